@@ -0,0 +1,154 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+
+from google.genai.types import CreateCachedContentConfig, UpdateCachedContentConfig
+
+logger = logging.getLogger(__name__)
+
+
+class SystemInstructionCache:
+    """
+    Keeps SYSTEM_INSTRUCTION registered as a Vertex cached context so requests can reference it
+    by name instead of resending it, which saves its input tokens (billed at the cached rate)
+    and the prefill time for them on every call.
+
+    The cache is created lazily on first use and its TTL is extended from a background task
+    `refresh_margin` seconds before it would expire. It is tied to a fingerprint of the model
+    and system instruction: if either changes, the next request builds a new cache and the old
+    one is deleted. When Vertex refuses the cache (for example instructions below the model's
+    minimum cacheable size) or any cache call fails, `current()` returns None and requests
+    send the instruction inline as before, trying again after RETRY_SECONDS.
+    """
+    RETRY_SECONDS = 60.0
+
+    def __init__(self, client, ttl: int = 3600, refresh_margin: int = 300, display_name: str = "prompt-augmenter-system-instruction"):
+        """
+        :param client: genai client (or FakeGenaiClient), its `aio.caches` is used.
+        :param ttl: Lifetime Vertex keeps the cache for after each create or refresh, in seconds.
+        :param refresh_margin: Refresh this many seconds before the cache would expire.
+        """
+        self.client = client
+        self.ttl = ttl
+        self.refresh_margin = min(refresh_margin, ttl // 2)
+        self.display_name = display_name
+        self.name = None
+        self._fingerprint = None
+        self._expires_at = 0.0
+        self._retry_at = 0.0
+        self._lock = asyncio.Lock()
+        self._refresh_task = None
+        self.stats = {"created": 0, "refreshed": 0, "rebuilt": 0, "deleted": 0, "errors": 0, "invalidated": 0}
+
+    @staticmethod
+    def fingerprint(model: str, system_instruction: str) -> str:
+        return hashlib.sha256(json.dumps([model, system_instruction]).encode("utf-8")).hexdigest()
+
+    def _usable(self, fingerprint: str) -> bool:
+        return self.name is not None and self._fingerprint == fingerprint and time.monotonic() < self._expires_at - self.refresh_margin
+
+    async def current(self, model: str, system_instruction: str):
+        """Name of a live cache holding `system_instruction` for `model`, creating or refreshing it if needed, or None."""
+        fingerprint = self.fingerprint(model, system_instruction)
+        if self._usable(fingerprint):
+            return self.name
+        if time.monotonic() < self._retry_at:
+            return None
+        async with self._lock:
+            # someone else may have fixed it while we waited for the lock
+            if self._usable(fingerprint):
+                return self.name
+            if self.name is not None and self._fingerprint == fingerprint:
+                try:
+                    await self._refresh()
+                    return self.name
+                except Exception as e:
+                    # most likely it expired already, build a new one below
+                    logger.info(f"could not refresh context cache {self.name}, creating a new one: {e}")
+                    self.name = None
+            try:
+                await self._create(model, system_instruction, fingerprint)
+            except Exception as e:
+                self.stats["errors"] += 1
+                self._retry_at = time.monotonic() + self.RETRY_SECONDS
+                logger.warning(f"context cache unavailable, sending the system instruction inline for {self.RETRY_SECONDS:g}s: {e}")
+                return None
+            return self.name
+
+    async def _create(self, model: str, system_instruction: str, fingerprint: str):
+        rebuilding = self._fingerprint is not None and self._fingerprint != fingerprint
+        old_name = self.name if rebuilding else None
+        cached = await self.client.aio.caches.create(
+            model=model,
+            config=CreateCachedContentConfig(
+                system_instruction=system_instruction,
+                ttl=f"{self.ttl}s",
+                display_name=self.display_name,
+            ),
+        )
+        self.name = cached.name
+        self._fingerprint = fingerprint
+        self._expires_at = time.monotonic() + self.ttl
+        if rebuilding:
+            self.stats["rebuilt"] += 1
+            logger.info(f"model or system instruction changed, rebuilt context cache as {self.name}")
+            if old_name is not None:
+                await self._delete(old_name)
+        else:
+            self.stats["created"] += 1
+            logger.info(f"system instruction cached as {self.name} for {self.ttl}s")
+
+    async def _refresh(self):
+        await self.client.aio.caches.update(name=self.name, config=UpdateCachedContentConfig(ttl=f"{self.ttl}s"))
+        self._expires_at = time.monotonic() + self.ttl
+        self.stats["refreshed"] += 1
+        logger.debug(f"context cache {self.name} refreshed for another {self.ttl}s")
+
+    async def _delete(self, name: str):
+        try:
+            await self.client.aio.caches.delete(name=name)
+            self.stats["deleted"] += 1
+        except Exception as e:
+            logger.warning(f"could not delete context cache {name}, it will expire on its own: {e}")
+
+    def invalidate(self, name: str):
+        """Called when Vertex rejects a request referencing `name`, so the next call recreates it."""
+        if self.name == name:
+            self.name = None
+            self.stats["invalidated"] += 1
+
+    def start(self, source):
+        """
+        Creates the cache in the background and keeps refreshing it ahead of expiry.
+        `source()` returns the current (model, system_instruction), so a change is picked up on the next refresh.
+        """
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop(source))
+
+    async def _refresh_loop(self, source):
+        while True:
+            await self.current(*source())
+            if self.name is None:
+                delay = self.RETRY_SECONDS
+            else:
+                # wake up as the refresh margin starts, current() then extends the TTL
+                delay = max(0.05, self._expires_at - self.refresh_margin - time.monotonic())
+            await asyncio.sleep(delay)
+
+    async def stop(self):
+        """Stops refreshing and deletes the cache, so a retired worker doesn't keep paying for storage."""
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+        if self.name is not None:
+            await self._delete(self.name)
+            self.name = None
+
+    def get_stats(self) -> dict:
+        return {"name": self.name, "ttl_seconds": self.ttl, **self.stats}
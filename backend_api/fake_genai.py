@@ -0,0 +1,259 @@
+"""
+In-process stand-in for the parts of `google.genai.Client` that VertexAIClient uses.
+
+Pass an instance as `VertexAIClient(settings, client=FakeGenaiClient())` to exercise the
+backend without credentials or network access, e.g. in tests. Setting USE_FAKE_VERTEX makes
+the app build one itself from the FAKE_VERTEX_* settings, which is what the load test uses.
+"""
+import asyncio
+import math
+import random
+import time
+
+
+_STATUSES = {400: "INVALID_ARGUMENT", 404: "NOT_FOUND", 429: "RESOURCE_EXHAUSTED", 500: "INTERNAL", 503: "UNAVAILABLE"}
+
+
+class FakeAPIError(Exception):
+    """Stands in for google.genai.errors.APIError: HTTP status in `.code`, gRPC status name in `.status`."""
+    def __init__(self, code: int, message: str = "injected upstream error"):
+        super().__init__(f"{code} {message}")
+        self.code = code
+        self.status = _STATUSES.get(code)
+        self.message = message
+
+
+def latency_sampler(spec: str, seed: int = None):
+    """
+    Returns a function drawing call latencies in seconds from a distribution spec:
+    "0.3" or "fixed:0.3", "uniform:0.1,0.5", "exp:0.3" (mean), "lognormal:0.3,0.5" (median, sigma).
+    """
+    rng = random.Random(seed)
+    kind, _, params = spec.partition(":")
+    if not params:
+        kind, params = "fixed", kind
+    try:
+        values = [float(value) for value in params.split(",")]
+        if kind == "fixed":
+            return lambda: values[0]
+        if kind == "uniform":
+            return lambda: rng.uniform(values[0], values[1])
+        if kind == "exp":
+            return lambda: rng.expovariate(1 / values[0])
+        if kind == "lognormal":
+            return lambda: rng.lognormvariate(math.log(values[0]), values[1])
+    except (ValueError, IndexError, ZeroDivisionError):
+        pass
+    raise ValueError(f"Invalid latency distribution '{spec}'")
+
+
+class FakeUsageMetadata:
+    def __init__(self, prompt_token_count: int, cached_content_token_count: int, candidates_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.cached_content_token_count = cached_content_token_count or None # the SDK leaves it unset without a cache
+        self.candidates_token_count = candidates_token_count
+
+
+class FakeGenerateContentResponse:
+    """Mimics google.genai.types.GenerateContentResponse: the backend reads `.text` and `.usage_metadata`."""
+    def __init__(self, text: str, usage_metadata: FakeUsageMetadata = None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class FakeCachedContent:
+    """Mimics google.genai.types.CachedContent, plus the instruction it holds and a monotonic expiry."""
+    def __init__(self, name: str, model: str, system_instruction: str, ttl: float):
+        self.name = name
+        self.model = model
+        self.system_instruction = system_instruction
+        self.expires_at = time.monotonic() + ttl
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+
+class FakeCountTokensResponse:
+    def __init__(self, total_tokens: int):
+        self.total_tokens = total_tokens
+
+
+def _ttl_seconds(ttl: str) -> float:
+    """Parses the SDK's duration strings, e.g. "3600s"."""
+    return float(str(ttl).rstrip("s"))
+
+
+class FakeAsyncCaches:
+    """
+    Emulates the Vertex context cache lifecycle behind `client.aio.caches`: entries expire after
+    their TTL, update() extends a live one, and using or updating an expired or deleted entry
+    fails with a 404 like the real service.
+    """
+    def __init__(self, owner: "FakeGenaiClient"):
+        self._owner = owner
+        self.entries = {} # name -> FakeCachedContent
+        self._counter = 0
+
+    def lookup(self, name: str) -> FakeCachedContent:
+        entry = self.entries.get(name)
+        if entry is None or entry.expired:
+            self.entries.pop(name, None)
+            raise FakeAPIError(404, f"cached content {name} not found")
+        return entry
+
+    async def create(self, model: str, config=None) -> FakeCachedContent:
+        system_instruction = getattr(config, "system_instruction", None) or ""
+        if self._owner.count_tokens_of(system_instruction) < self._owner.min_cache_tokens:
+            raise FakeAPIError(400, f"cached content must have at least {self._owner.min_cache_tokens} tokens")
+        self._counter += 1
+        name = f"projects/fake/locations/local/cachedContents/{self._counter}"
+        entry = self.entries[name] = FakeCachedContent(name, model, system_instruction, _ttl_seconds(getattr(config, "ttl", None) or "3600s"))
+        return entry
+
+    async def update(self, name: str, config=None) -> FakeCachedContent:
+        entry = self.lookup(name)
+        entry.expires_at = time.monotonic() + _ttl_seconds(config.ttl)
+        return entry
+
+    async def get(self, name: str) -> FakeCachedContent:
+        return self.lookup(name)
+
+    async def delete(self, name: str):
+        self.lookup(name)
+        del self.entries[name]
+
+
+class FakeModels:
+    def __init__(self, owner: "FakeGenaiClient"):
+        self._owner = owner
+
+    def generate_content(self, model: str, contents: str, config=None) -> FakeGenerateContentResponse:
+        usage, prefill = self._owner.prompt_usage(model, contents, config)
+        time.sleep(self._owner.begin_call() + prefill)
+        return FakeGenerateContentResponse(self._owner.respond(contents), usage)
+
+
+class FakeAsyncModels:
+    """Async counterpart of FakeModels, reached through `client.aio.models` like the real SDK."""
+    def __init__(self, owner: "FakeGenaiClient"):
+        self._owner = owner
+
+    async def generate_content(self, model: str, contents: str, config=None) -> FakeGenerateContentResponse:
+        usage, prefill = self._owner.prompt_usage(model, contents, config)
+        await asyncio.sleep(self._owner.begin_call() + prefill)
+        return FakeGenerateContentResponse(self._owner.respond(contents), usage)
+
+    async def generate_content_stream(self, model: str, contents: str, config=None):
+        usage, prefill = self._owner.prompt_usage(model, contents, config)
+        self._owner.begin_call()
+        return self._stream(self._owner.respond(contents), usage, prefill)
+
+    async def count_tokens(self, model: str, contents: str, config=None) -> FakeCountTokensResponse:
+        # used for warm-up, so it never fails and doesn't count as a generation call
+        return FakeCountTokensResponse(len(contents.split()))
+
+    async def _stream(self, text: str, usage: FakeUsageMetadata, prefill: float):
+        await asyncio.sleep(prefill)
+        for chunk in self._owner.chunks(text):
+            await asyncio.sleep(self._owner.chunk_delay)
+            yield FakeGenerateContentResponse(chunk)
+        # like the real API, token counts arrive with the final chunk
+        yield FakeGenerateContentResponse("", usage)
+
+
+class FakeAio:
+    def __init__(self, owner: "FakeGenaiClient"):
+        self.models = FakeAsyncModels(owner)
+        self.caches = FakeAsyncCaches(owner)
+
+
+class FakeGenaiClient:
+    """
+    Deterministic fake genai client.
+
+    :param latency: Seconds a call takes, or a function returning them (see latency_sampler).
+    :param chunk_delay: Seconds between streamed chunks.
+    :param chunk_size: Words per streamed chunk.
+    :param response_template: Format string for the reply; `{query}` is the user query.
+    :param error_rate: Fraction of calls that raise FakeAPIError(error_code).
+    :param error_code: HTTP status of injected errors (503 is retryable, 400 is not).
+    :param fail_first: The first this many calls fail, for deterministic tests.
+    :param slow_rate: Fraction of calls that take `slow_latency` instead of `latency`.
+    :param seed: Seed for the random choices above.
+    :param prefill_per_1k_tokens: Extra seconds per 1000 prompt tokens that aren't served from a
+                                  context cache, so caching the system instruction shows up in latency.
+    :param min_cache_tokens: Smallest system instruction (in tokens) caches.create accepts.
+    """
+    def __init__(self, latency: float = 0.0, chunk_delay: float = 0.0, chunk_size: int = 3,
+                 response_template: str = "Augmented prompt for: {query}",
+                 error_rate: float = 0.0, error_code: int = 503, fail_first: int = 0,
+                 slow_rate: float = 0.0, slow_latency: float = 1.0, seed: int = None,
+                 prefill_per_1k_tokens: float = 0.0, min_cache_tokens: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.fail_first = fail_first
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self._random = random.Random(seed)
+        self.errors = 0
+        self.chunk_delay = chunk_delay
+        self.chunk_size = max(1, chunk_size)
+        self.response_template = response_template
+        self.calls = 0
+        self.prefill_per_1k_tokens = prefill_per_1k_tokens
+        self.min_cache_tokens = min_cache_tokens
+        self.models = FakeModels(self)
+        self.aio = FakeAio(self)
+
+    def begin_call(self) -> float:
+        """Counts a call, raises an injected error if one is due, and returns the latency to simulate."""
+        self.calls += 1
+        if self.calls <= self.fail_first or self._random.random() < self.error_rate:
+            self.errors += 1
+            raise FakeAPIError(self.error_code)
+        if self._random.random() < self.slow_rate:
+            return self.slow_latency
+        return self.latency() if callable(self.latency) else self.latency
+
+    @classmethod
+    def from_settings(cls, settings) -> "FakeGenaiClient":
+        return cls(
+            latency=latency_sampler(settings.FAKE_VERTEX_LATENCY),
+            chunk_delay=settings.FAKE_VERTEX_CHUNK_DELAY,
+            error_rate=settings.FAKE_VERTEX_ERROR_RATE,
+            prefill_per_1k_tokens=settings.FAKE_VERTEX_PREFILL_PER_1K_TOKENS,
+        )
+
+    @staticmethod
+    def count_tokens_of(text: str) -> int:
+        return len(text.split()) # one token per word is close enough for a fake
+
+    def prompt_usage(self, model: str, contents: str, config=None):
+        """
+        Token usage of a request and the prefill seconds it costs. A `cached_content` in the config
+        must name a live cache for the same model (404 / 400 otherwise), and its tokens are free to prefill.
+        """
+        cached_tokens = 0
+        system_instruction = getattr(config, "system_instruction", None) or ""
+        cached_content = getattr(config, "cached_content", None)
+        if cached_content:
+            entry = self.aio.caches.lookup(cached_content)
+            if entry.model != model:
+                raise FakeAPIError(400, f"cached content {cached_content} was created for {entry.model}")
+            if system_instruction:
+                raise FakeAPIError(400, "system_instruction can't be set together with cached_content")
+            cached_tokens = self.count_tokens_of(entry.system_instruction)
+        uncached_tokens = self.count_tokens_of(system_instruction) + self.count_tokens_of(contents)
+        usage = FakeUsageMetadata(uncached_tokens + cached_tokens, cached_tokens, self.count_tokens_of(self.respond(contents)))
+        return usage, uncached_tokens / 1000 * self.prefill_per_1k_tokens
+
+    def respond(self, contents: str) -> str:
+        return self.response_template.format(query=contents)
+
+    def chunks(self, text: str):
+        words = text.split(" ")
+        for index in range(0, len(words), self.chunk_size):
+            piece = " ".join(words[index:index + self.chunk_size])
+            yield piece if index + self.chunk_size >= len(words) else piece + " "
@@ -0,0 +1,188 @@
+"""
+Production entry point for the backend: gunicorn managing one uvicorn worker per usable core.
+
+    python -m backend_api.launcher            # what the Procfile and Dockerfile run
+
+The worker count follows the cores this container may actually use (CPU affinity and cgroup
+quota, not just the host's core count) and can be pinned with WEB_CONCURRENCY. The app module
+is imported once in the master (preload), so settings are parsed a single time and workers
+fork with the code already loaded; each worker then runs its own lifespan and owns its Vertex
+client and Redis pool. Once the master is up, a readiness check polls the app until it answers
+and exits the launcher if it never does, so a broken deploy fails fast instead of serving errors.
+
+Rolling restarts: `kill -HUP <master pid>` starts fresh workers and retires the old ones
+gracefully (GRACEFUL_TIMEOUT seconds to finish in-flight requests). With preload on, HUP keeps
+the already imported code; to roll out new code send USR2 then WINCH/QUIT to the old master,
+or set LAUNCHER_PRELOAD=false so HUP reimports it in every new worker.
+
+Where gunicorn isn't available (e.g. Windows dev machines) it falls back to uvicorn's own
+multi-process mode with the same worker count.
+"""
+import argparse
+import logging
+import math
+import os
+import sys
+import threading
+import time
+import urllib.request
+
+logger = logging.getLogger(__name__)
+
+APP_PATH = "backend_api.main:app"
+READY_PATH = "/api/v1/ready"
+
+
+def _cgroup_cpu_limit():
+    """CPU quota from cgroup v2 (cpu.max) or v1 (cfs quota/period), or None when unlimited."""
+    try:
+        with open("/sys/fs/cgroup/cpu.max", encoding="utf-8") as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", encoding="utf-8") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us", encoding="utf-8") as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def available_cpus() -> int:
+    """Cores this process may run on: affinity mask, capped by the container's CPU quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError: # not available on Windows/macOS
+        cpus = os.cpu_count() or 1
+    quota = _cgroup_cpu_limit()
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return max(1, cpus)
+
+
+def worker_count() -> int:
+    """WEB_CONCURRENCY if set, otherwise one async worker per available core."""
+    override = os.getenv("WEB_CONCURRENCY")
+    if override:
+        try:
+            return max(1, int(override))
+        except ValueError:
+            logger.warning(f"Ignoring invalid WEB_CONCURRENCY={override!r}")
+    return available_cpus()
+
+
+def _worker_class() -> str:
+    try:
+        import uvicorn_worker  # noqa: F401 - the maintained home of UvicornWorker
+        return "uvicorn_worker.UvicornWorker"
+    except ImportError:
+        return "uvicorn.workers.UvicornWorker"
+
+
+def wait_until_ready(host: str, port: int, timeout: float) -> bool:
+    """Polls the readiness endpoint until it answers 200 or `timeout` seconds pass."""
+    url = f"http://{'127.0.0.1' if host in ('0.0.0.0', '::') else host}:{port}{READY_PATH}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                if response.status == 200:
+                    return True
+        except OSError:
+            pass
+        time.sleep(0.25)
+    return False
+
+
+def _start_readiness_check(host: str, port: int, timeout: float, on_failure):
+    def check():
+        started = time.monotonic()
+        if wait_until_ready(host, port, timeout):
+            logger.info(f"backend ready on {host}:{port} after {time.monotonic() - started:.2f}s")
+        else:
+            logger.critical(f"backend did not become ready within {timeout:g}s, shutting down")
+            on_failure()
+    threading.Thread(target=check, name="ReadinessCheck", daemon=True).start()
+
+
+def run_gunicorn(args):
+    from gunicorn.app.base import BaseApplication
+
+    class LauncherApplication(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from .main import app
+            return app
+
+    def when_ready(server):
+        server.log.info(f"master ready, {server.num_workers} workers of {_worker_class()}")
+        _start_readiness_check(args.host, args.port, args.ready_timeout, lambda: os.kill(server.pid, 15))
+
+    options = {
+        "bind": f"{args.host}:{args.port}",
+        "workers": args.workers,
+        "worker_class": _worker_class(),
+        "preload_app": args.preload,
+        "graceful_timeout": args.graceful_timeout,
+        "timeout": args.timeout,
+        "keepalive": args.keepalive,
+        # recycle workers now and then (jittered so they don't all restart at once) to cap slow leaks
+        "max_requests": args.max_requests,
+        "max_requests_jitter": max(1, args.max_requests // 10) if args.max_requests else 0,
+        "when_ready": when_ready,
+        "accesslog": None,
+    }
+    LauncherApplication(options).run()
+
+
+def run_uvicorn(args):
+    import uvicorn
+    logger.warning("gunicorn is not installed, falling back to uvicorn's process manager (no rolling restarts)")
+    _start_readiness_check(args.host, args.port, args.ready_timeout, lambda: os._exit(1))
+    uvicorn.run(APP_PATH, host=args.host, port=args.port, workers=args.workers,
+                timeout_graceful_shutdown=args.graceful_timeout, timeout_keep_alive=args.keepalive)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - [%(levelname)s] - %(message)s')
+    parser = argparse.ArgumentParser(description="Run the backend with one uvicorn worker per usable core.")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=None, help="Defaults to WEB_CONCURRENCY or the usable core count")
+    parser.add_argument("--no-preload", dest="preload", action="store_false", default=os.getenv("LAUNCHER_PRELOAD", "true").lower() != "false",
+                        help="Import the app in each worker instead of once in the master")
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("GRACEFUL_TIMEOUT", "30")))
+    parser.add_argument("--timeout", type=int, default=int(os.getenv("WORKER_TIMEOUT", "120")), help="Seconds before a silent worker is restarted")
+    parser.add_argument("--keepalive", type=int, default=int(os.getenv("KEEPALIVE", "5")))
+    parser.add_argument("--max-requests", type=int, default=int(os.getenv("MAX_REQUESTS", "0")), help="Recycle a worker after this many requests (0: never)")
+    parser.add_argument("--ready-timeout", type=float, default=float(os.getenv("READY_TIMEOUT", "60")))
+    args = parser.parse_args(argv)
+    if args.workers is None:
+        args.workers = worker_count()
+    logger.info(f"starting {args.workers} worker(s) on {args.host}:{args.port} ({available_cpus()} usable cores)")
+
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        run_uvicorn(args)
+    else:
+        run_gunicorn(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
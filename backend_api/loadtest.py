@@ -0,0 +1,277 @@
+"""
+Load test for the backend API with a fake model and an in-process Redis, so it needs no network.
+
+Runs the real `backend_api.main:app` either in-process (requests go through httpx's ASGI
+transport, no sockets at all) or under uvicorn on 127.0.0.1 with any number of workers. The
+app is started with USE_FAKE_VERTEX and REDIS_URL=memory://, and rate limits are lifted so the
+numbers show capacity rather than the limiter. Concurrency ramps through the given stages and
+each stage reports throughput, latency percentiles and error rates as JSON.
+
+Usage:
+    python -m backend_api.loadtest --concurrency 1,8,32,128 --duration 10 --latency lognormal:0.8,0.4
+    python -m backend_api.loadtest --mode uvicorn --workers 4 --distinct-queries 50 --output load.json
+
+With uvicorn and several workers, each worker has its own memory:// Redis, so the response
+cache and rate limits are per worker; pass --redis-url to share a real one.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+import httpx
+
+API_KEY = "loadtest-key"
+READY_PATH = "/api/v1/ready"
+ENDPOINTS = {
+    "generate": "/api/v1/generate-prompt",
+    "stream": "/api/v1/generate-prompt/stream",
+}
+
+
+def _configure_environment(args) -> dict:
+    """Settings for the app under test; real values from .env are only used where the test doesn't care."""
+    env = dict(os.environ)
+    for name, value in {
+        "VERTEX_AI_PROJECT": "loadtest",
+        "VERTEX_AI_LOCATION": "local",
+        "LLM_MODEL_NAME": "fake-model",
+        "SYSTEM_INSTRUCTION": "Rewrite the request as a detailed prompt.",
+        "MAX_OUTPUT_TOKENS": "1024",
+        "TEMPERATURE": "0.2",
+        "API_RETRY_COUNT": "2",
+    }.items():
+        env.setdefault(name, value)
+    env.update({
+        "USE_FAKE_VERTEX": "true",
+        "FAKE_VERTEX_LATENCY": args.latency,
+        "FAKE_VERTEX_CHUNK_DELAY": str(args.chunk_delay),
+        "FAKE_VERTEX_ERROR_RATE": str(args.error_rate),
+        "REDIS_URL": args.redis_url,
+        "BACKEND_API_KEY": API_KEY,
+        "RATE_LIMIT_DEFAULT": "1000000/second",
+        "RESPONSE_CACHE_ENABLED": "true" if args.cache else "false",
+        "CONTEXT_CACHE_ENABLED": "true" if args.context_cache else "false",
+        "FAKE_VERTEX_PREFILL_PER_1K_TOKENS": str(args.prefill_per_1k),
+    })
+    if args.max_concurrency:
+        env["LLM_MAX_CONCURRENCY"] = str(args.max_concurrency)
+    return env
+
+
+def _percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class QueryPool:
+    """Unique queries by default; with `distinct` > 0, repeats from a fixed set like template-style traffic."""
+    def __init__(self, distinct: int, seed: int):
+        self.distinct = distinct
+        self._random = random.Random(seed)
+        self._counter = 0
+
+    def next(self) -> str:
+        if self.distinct > 0:
+            return f"Template request number {self._random.randrange(self.distinct)}: write a unit test for my parser"
+        self._counter += 1
+        return f"Unique request {self._counter}: summarize the attached meeting notes for the team"
+
+
+async def _send(client: httpx.AsyncClient, path: str, query: str, streaming: bool):
+    """Returns (status code or error type, seconds). A streamed error event counts as an error."""
+    start = time.perf_counter()
+    try:
+        if streaming:
+            async with client.stream("POST", path, json={"user_query": query}) as response:
+                body = b"".join([chunk async for chunk in response.aiter_bytes()])
+                status = response.status_code
+                if status == 200 and b"event: error" in body:
+                    status = "stream_error"
+        else:
+            response = await client.post(path, json={"user_query": query})
+            status = response.status_code
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    return status, time.perf_counter() - start
+
+
+async def run_stage(client: httpx.AsyncClient, concurrency: int, duration: float, path: str, streaming: bool, queries: QueryPool) -> dict:
+    """Keeps `concurrency` requests in flight for `duration` seconds."""
+    latencies = []
+    outcomes = Counter()
+    deadline = time.perf_counter() + duration
+
+    async def user():
+        while time.perf_counter() < deadline:
+            status, seconds = await _send(client, path, queries.next(), streaming)
+            outcomes[str(status)] += 1
+            if status == 200:
+                latencies.append(seconds)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    total = sum(outcomes.values())
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 3),
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "successful_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "error_rate": round(1 - len(latencies) / total, 4) if total else 0.0,
+        "latency_ms": {
+            "p50": round(_percentile(latencies, 0.50) * 1000, 2),
+            "p95": round(_percentile(latencies, 0.95) * 1000, 2),
+            "p99": round(_percentile(latencies, 0.99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        },
+        "outcomes": dict(outcomes),
+    }
+
+
+async def _run_stages(client: httpx.AsyncClient, args) -> list:
+    path = ENDPOINTS[args.endpoint]
+    streaming = args.endpoint == "stream"
+    queries = QueryPool(args.distinct_queries, args.seed)
+    results = []
+    for concurrency in args.concurrency:
+        print(f"Stage: {concurrency} concurrent users for {args.duration}s...", file=sys.stderr)
+        results.append(await run_stage(client, concurrency, args.duration, path, streaming, queries))
+    return results
+
+
+async def _cache_stats(client: httpx.AsyncClient):
+    try:
+        response = await client.get("/api/v1/cache/stats")
+        return response.json() if response.status_code == 200 else None
+    except httpx.HTTPError:
+        return None
+
+
+async def run_in_process(args, env: dict) -> dict:
+    # Settings are read when backend_api.main is imported, so the environment has to be ready first
+    os.environ.update(env)
+    from .main import app
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", headers={"X-API-KEY": API_KEY}, limits=limits, timeout=args.timeout) as client:
+            stages = await _run_stages(client, args)
+            return {"stages": stages, "cache": await _cache_stats(client)}
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_until_ready(base_url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.perf_counter() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {process.returncode} during startup")
+            try:
+                if (await client.get(READY_PATH)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError("uvicorn did not become ready in time")
+
+
+async def run_under_uvicorn(args, env: dict) -> dict:
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    command = [sys.executable, "-m", "uvicorn", "backend_api.main:app", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(args.workers), "--log-level", "warning"]
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen(command, env=env, cwd=project_root)
+    try:
+        await _wait_until_ready(base_url, process)
+        limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+        async with httpx.AsyncClient(base_url=base_url, headers={"X-API-KEY": API_KEY}, limits=limits, timeout=args.timeout) as client:
+            stages = await _run_stages(client, args)
+            return {"stages": stages, "cache": await _cache_stats(client)}
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the backend API against a fake model.")
+    parser.add_argument("--mode", choices=("inprocess", "uvicorn"), default="inprocess")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes (uvicorn mode only)")
+    parser.add_argument("--concurrency", default="1,8,32,128", help="Comma-separated concurrent users per stage")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per stage")
+    parser.add_argument("--endpoint", choices=sorted(ENDPOINTS), default="generate")
+    parser.add_argument("--latency", default="lognormal:0.8,0.4", help='Fake model latency, e.g. "0.5", "uniform:0.2,1", "exp:0.8", "lognormal:0.8,0.4"')
+    parser.add_argument("--chunk-delay", type=float, default=0.05, help="Seconds between streamed chunks")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake model calls that fail with a 503")
+    parser.add_argument("--distinct-queries", type=int, default=0, help="Draw queries from this many templates (0: all unique)")
+    parser.add_argument("--no-cache", dest="cache", action="store_false", help="Disable the backend response cache")
+    parser.add_argument("--context-cache", action="store_true", help="Reference the system instruction through a (fake) Vertex context cache")
+    parser.add_argument("--prefill-per-1k", type=float, default=0.0, help="Extra fake model seconds per 1000 uncached prompt tokens")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="Override LLM_MAX_CONCURRENCY for the app")
+    parser.add_argument("--redis-url", default="memory://", help="Redis for the app; memory:// needs no server")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Client timeout per request in seconds")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--label", default="", help="Free-form label stored with the results, e.g. a version")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    args.concurrency = [int(level) for level in args.concurrency.split(",") if level.strip()]
+
+    env = _configure_environment(args)
+    runner = run_in_process if args.mode == "inprocess" else run_under_uvicorn
+    results = asyncio.run(runner(args, env))
+
+    report = {
+        "benchmark": "backend_load",
+        "label": args.label,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "mode": args.mode,
+            "workers": args.workers if args.mode == "uvicorn" else 1,
+            "endpoint": args.endpoint,
+            "latency": args.latency,
+            "error_rate": args.error_rate,
+            "distinct_queries": args.distinct_queries,
+            "response_cache": args.cache,
+            "context_cache": args.context_cache,
+            "prefill_per_1k": args.prefill_per_1k,
+            "redis_url": args.redis_url,
+        },
+        **results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+        print(f"Results written to {os.path.abspath(args.output)}", file=sys.stderr)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
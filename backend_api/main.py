@@ -1,25 +1,47 @@
+import time
+_IMPORT_STARTED = time.perf_counter() # everything below, google.genai included, counts as import time
 from fastapi import FastAPI, Response, HTTPException, Request, Header, Depends
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from .settings import Settings
 from .vertex_ai_client import VertexAIClient
-from .pydantic_models import PromptRequest, PromptResponse
+from .pydantic_models import PromptRequest, PromptResponse, BatchPromptRequest, BatchPromptResponse, BatchItemResult
+from .response_cache import ResponseCache
+from .resilience import UpstreamUnavailableError
+from . import metrics
+import math
 from pydantic import ValidationError
 settings = Settings()  # type: ignore - Pydantic loads from .env at runtime, Pylance can't see this.
 import logging 
 from contextlib import asynccontextmanager
+import asyncio
 #rate limiting imports
 import redis.asyncio as redis
-from fastapi_limiter import FastAPILimiter
-from fastapi_limiter.depends import RateLimiter
+from .rate_limiter import LocalFirstRateLimiter, rate_limit, charge
 import secrets
+import json
+import os
+
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+metrics.IMPORT_SECONDS.set(IMPORT_SECONDS)
 
 CORRECT_API_KEY = settings.BACKEND_API_KEY
 REDIS_URL = settings.REDIS_URL
 
 async def verify_api_key(api_key_header: str | None = Header(None, alias = "X-API-KEY")):
-    if not api_key_header:
-        raise HTTPException(status_code = 401, detail = "API KEY MISSING")
-    if not secrets.compare_digest(api_key_header, CORRECT_API_KEY):
-        raise HTTPException(status_code = 401, detail = "API KEY INVALID")
+    with metrics.AUTH_LATENCY.time():
+        if not api_key_header:
+            raise HTTPException(status_code = 401, detail = "API KEY MISSING")
+        if not secrets.compare_digest(api_key_header, CORRECT_API_KEY):
+            raise HTTPException(status_code = 401, detail = "API KEY INVALID")
+
+async def verify_metrics_access(authorization: str | None = Header(None), api_key_header: str | None = Header(None, alias = "X-API-KEY")):
+    """/metrics shows traffic, error rates and limiter internals: scrapers present METRICS_TOKEN as a bearer token, or the API key if none is set."""
+    if not settings.METRICS_TOKEN:
+        await verify_api_key(api_key_header)
+        return
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token.strip(), settings.METRICS_TOKEN):
+        raise HTTPException(status_code = 401, detail = "METRICS TOKEN MISSING OR INVALID", headers={"WWW-Authenticate": "Bearer"})
 
 def setup_logging():
     """config logging for the backend app"""
@@ -41,39 +63,151 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     """Initializing Vertex AI Client on Startup to prevent crash"""
     setup_logging()
-    logger.info("application startup sequence initiated")
+    startup_started = time.perf_counter()
+    app.state.ready = False
+    app.state.warmup = {}
+    logger.info(f"application startup sequence initiated (module import took {IMPORT_SECONDS * 1000:.0f} ms)")
     try:
-        app.state.vertex_ai_client = VertexAIClient(settings)
+        genai_client = None
+        if settings.USE_FAKE_VERTEX:
+            from .fake_genai import FakeGenaiClient
+            genai_client = FakeGenaiClient.from_settings(settings)
+            logger.warning(f"USE_FAKE_VERTEX is set, answering with a fake model (latency {settings.FAKE_VERTEX_LATENCY})")
+        app.state.vertex_ai_client = VertexAIClient(settings, client=genai_client)
         logger.info("Vertex client initialized successfully")
     except Exception as e:
         #any failure we log error
         logger.critical(f"CRITICAL: failed to initialize Vertex AI Client during startup: {e}", exc_info=True)
         app.state.vertex_ai_client = None
+    redis_conn = None
     try:
-        redis_conn = await redis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True)
-        await FastAPILimiter.init(redis_conn)
+        if REDIS_URL.startswith("memory://"):
+            import fakeredis.aioredis # dev dependency, only for load tests and local runs
+            redis_conn = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        else:
+            redis_conn = await redis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True)
+        await redis_conn.ping()
+        logger.info("redis connection established")
     except Exception as e:
-        logger.error(f"CRITICAL: redis connection uninitialized")
-        raise
+        # Not fatal: rate limits fall back to per-process and the response cache bypasses itself until Redis answers
+        logger.error(f"redis unavailable at startup, continuing with local rate limits: {e}")
+    app.state.redis = redis_conn
+
+    app.state.rate_limiter = LocalFirstRateLimiter(
+        redis_conn,
+        default=settings.RATE_LIMIT_DEFAULT,
+        routes=settings.RATE_LIMIT_ROUTES,
+        keys=settings.RATE_LIMIT_KEYS,
+        sync_interval=settings.RATE_LIMIT_SYNC_SECONDS,
+        trusted_proxies=settings.RATE_LIMIT_TRUSTED_PROXIES,
+    )
+    app.state.rate_limiter.start()
+
+    # Caps outstanding Vertex calls per worker so a traffic spike queues instead of piling up upstream
+    app.state.llm_semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+
+    app.state.response_cache = None
+    if settings.RESPONSE_CACHE_ENABLED and redis_conn is not None:
+        app.state.response_cache = ResponseCache(
+            redis_conn,
+            settings,
+            ttl=settings.RESPONSE_CACHE_TTL_SECONDS,
+            max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+            lock_timeout=settings.RESPONSE_CACHE_LOCK_SECONDS,
+        )
+        logger.info("response cache enabled")
+
+    if settings.WARMUP_ENABLED:
+        app.state.warmup = await warm_up(app)
+    if app.state.vertex_ai_client is not None:
+        app.state.vertex_ai_client.start()
+    startup_seconds = time.perf_counter() - startup_started
+    metrics.STARTUP_SECONDS.set(startup_seconds)
+    app.state.startup_seconds = startup_seconds
+    app.state.ready = app.state.vertex_ai_client is not None
+    logger.info(f"startup finished in {startup_seconds * 1000:.0f} ms, ready: {app.state.ready}")
 
     yield
+    app.state.ready = False # fail readiness first so load balancers stop routing here while we drain
     logger.info("Application shutdown sequence initiated")
+    await app.state.rate_limiter.stop()
+    if app.state.vertex_ai_client is not None:
+        await app.state.vertex_ai_client.stop()
+
+async def _timed_warmup(component: str, warm):
+    """Runs one warm-up step under WARMUP_TIMEOUT_SECONDS and returns its status and duration."""
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(warm(), timeout=settings.WARMUP_TIMEOUT_SECONDS)
+        status = "ok"
+    except Exception as e:
+        logger.warning(f"{component} warm-up failed: {e!r}")
+        status = "failed"
+    seconds = time.perf_counter() - started
+    metrics.WARMUP_SECONDS.labels(component).set(seconds)
+    return {"status": status, "ms": round(seconds * 1000, 1)}
+
+
+async def warm_up(app: FastAPI) -> dict:
+    """
+    Pays the one-off costs before the worker takes traffic: a cheap Vertex call (auth token,
+    TLS handshake, connection pool) and a Redis round trip, concurrently. Failures are reported
+    by /api/v1/ready but don't stop startup; the resilience layer handles a flaky upstream.
+    """
+    steps = {}
+    if app.state.vertex_ai_client is not None:
+        steps["vertex"] = app.state.vertex_ai_client.warm_up
+    if app.state.redis is not None:
+        steps["redis"] = app.state.redis.ping
+    results = await asyncio.gather(*(_timed_warmup(component, warm) for component, warm in steps.items()))
+    warmup = dict(zip(steps, results))
+    logger.info(f"warm-up finished: {warmup}")
+    return warmup
+
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(metrics.MetricsMiddleware)
+
+
+@asynccontextmanager
+async def llm_slot(app: FastAPI):
+    """Holds one of the worker's LLM concurrency slots, or raises 503 if none frees up in time."""
+    semaphore = app.state.llm_semaphore
+    try:
+        await asyncio.wait_for(semaphore.acquire(), timeout=settings.LLM_QUEUE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        logger.warning("no LLM slot became free in time, rejecting request")
+        raise HTTPException(status_code = 503, detail = "Server busy, try again shortly", headers={"Retry-After": "1"})
+    try:
+        yield
+    finally:
+        semaphore.release()
 
 
 @app.post("/api/v1/generate-prompt")
-async def generate_prompt(request: PromptRequest, http_request:Request, ratelimits: None = Depends(RateLimiter(times=20, minutes=1)), api_verification: None = Depends(verify_api_key))->PromptResponse:
+async def generate_prompt(request: PromptRequest, http_request:Request, ratelimits: None = Depends(rate_limit), api_verification: None = Depends(verify_api_key))->PromptResponse:
     vertex_ai_client = http_request.app.state.vertex_ai_client
 
     if not vertex_ai_client:
         logger.error("reject request since Vertex Ai Client not available")
         raise HTTPException(status_code = 503, detail = "Service temporarily unavailable due to configuration error")
                      
-    user_query = request.user_query
     logger.info(f"Received request payload: {request.dict()}")
+    return await _generate_one(http_request.app, vertex_ai_client, request.user_query)
+
+
+async def _generate_one(app: FastAPI, vertex_ai_client: VertexAIClient, user_query: str) -> PromptResponse:
+    """Cache lookup or LLM call for one query, with every failure mapped to the HTTPException a client should see."""
+    async def generate() -> str:
+        async with llm_slot(app):
+            return await vertex_ai_client.generate_prompt_async(user_query)
+
+    response_cache = app.state.response_cache
     try:
-        llm_response = vertex_ai_client.generate_prompt(user_query)
+        if response_cache is not None:
+            llm_response = await response_cache.get_or_generate(user_query, generate)
+        else:
+            llm_response = await generate()
         return PromptResponse(augmented_prompt=llm_response)
     except ValidationError as e:
         logger.error(f"LLM response validation failed: {e}")
@@ -81,16 +215,177 @@ async def generate_prompt(request: PromptRequest, http_request:Request, ratelimi
             status_code = 502,
             detail="API returned invalid response"
         )
+    except UpstreamUnavailableError as e:
+        logger.warning(f"Upstream unavailable: {e}")
+        raise HTTPException(status_code = 503, detail = "Model temporarily unavailable", headers={"Retry-After": str(math.ceil(e.retry_after) or 1)})
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
         raise HTTPException(status_code = 500, detail = "Internal server error")
 
 
+@app.post("/api/v1/generate-prompt/batch")
+async def generate_prompt_batch(request: BatchPromptRequest, http_request: Request, api_verification: None = Depends(verify_api_key)) -> BatchPromptResponse:
+    """
+    Generates prompts for up to BATCH_MAX_ITEMS queries in one call, BATCH_MAX_PARALLELISM at a time.
+    Each item is charged to the client's /api/v1/generate-prompt rate limit, so batching is faster
+    but doesn't buy extra quota (settings refuse a BATCH_MAX_ITEMS above that limit; a client with a
+    lower per-key limit gets 413 for batches bigger than it). Results come back in request order; a
+    failing item carries the status and error it would have gotten on its own instead of failing the whole batch.
+    """
+    vertex_ai_client = http_request.app.state.vertex_ai_client
+
+    if not vertex_ai_client:
+        logger.error("reject request since Vertex Ai Client not available")
+        raise HTTPException(status_code = 503, detail = "Service temporarily unavailable due to configuration error")
+    if len(request.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code = 413, detail = f"Batch has {len(request.items)} items, the maximum is {settings.BATCH_MAX_ITEMS}")
+    # only charged once it can be served; the key is checked before this (dependency) so unauthenticated callers can't drain someone's quota
+    await charge(http_request, cost=len(request.items), route="/api/v1/generate-prompt")
+
+    logger.info(f"Received batch request with {len(request.items)} items")
+    parallelism = asyncio.Semaphore(settings.BATCH_MAX_PARALLELISM)
+
+    async def run_item(index: int, item: PromptRequest) -> BatchItemResult:
+        async with parallelism:
+            try:
+                response = await _generate_one(http_request.app, vertex_ai_client, item.user_query)
+            except HTTPException as e:
+                return BatchItemResult(index=index, status_code=e.status_code, error=str(e.detail))
+        return BatchItemResult(index=index, status_code=200, augmented_prompt=response.augmented_prompt)
+
+    results = await asyncio.gather(*(run_item(index, item) for index, item in enumerate(request.items)))
+    succeeded = sum(1 for result in results if result.status_code == 200)
+    return BatchPromptResponse(results=results, succeeded=succeeded, failed=len(results) - succeeded)
+
+
+
+def _sse_event(event: str, data: dict) -> str:
+    """Formats one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/api/v1/generate-prompt/stream")
+async def generate_prompt_stream(request: PromptRequest, http_request:Request, ratelimits: None = Depends(rate_limit), api_verification: None = Depends(verify_api_key)):
+    """
+    Streams the augmented prompt as server-sent events while the model generates it:
+    `delta` events carry text chunks, then one `done` event carries the full prompt
+    (or an `error` event if generation fails part way).
+    """
+    vertex_ai_client = http_request.app.state.vertex_ai_client
+
+    if not vertex_ai_client:
+        logger.error("reject request since Vertex Ai Client not available")
+        raise HTTPException(status_code = 503, detail = "Service temporarily unavailable due to configuration error")
+
+    user_query = request.user_query
+    logger.info(f"Received streaming request payload: {request.model_dump()}")
+
+    response_cache = http_request.app.state.response_cache
+
+    async def generate_stream():
+        async with llm_slot(http_request.app):
+            async for chunk in vertex_ai_client.generate_prompt_stream_async(user_query):
+                yield chunk
+
+    async def event_stream():
+        parts = []
+        try:
+            # A cache hit arrives as one chunk; identical requests in flight share one generation
+            if response_cache is not None:
+                chunks = response_cache.stream_or_generate(user_query, generate_stream)
+            else:
+                chunks = generate_stream()
+            async for chunk in chunks:
+                parts.append(chunk)
+                yield _sse_event("delta", {"text": chunk})
+            response = PromptResponse(augmented_prompt="".join(parts))
+            yield _sse_event("done", response.model_dump())
+        except HTTPException as e:
+            yield _sse_event("error", {"detail": e.detail})
+        except UpstreamUnavailableError as e:
+            logger.warning(f"Upstream unavailable while streaming: {e}")
+            yield _sse_event("error", {"detail": "Model temporarily unavailable", "retry_after": math.ceil(e.retry_after) or 1})
+        except ValidationError as e:
+            logger.error(f"LLM response validation failed: {e}")
+            yield _sse_event("error", {"detail": "API returned invalid response"})
+        except Exception as e:
+            logger.error(f"Unexpected error while streaming: {e}")
+            yield _sse_event("error", {"detail": "Internal server error"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/v1/cache/stats")
+async def show_cache_stats(http_request: Request, api_verification: None = Depends(verify_api_key)):
+    """
+    Response cache hit/miss counters for this worker and across all workers, plus this worker's
+    Vertex context cache usage: latency and input tokens with the system instruction cached vs inline.
+    """
+    response_cache = http_request.app.state.response_cache
+    stats = {"enabled": response_cache is not None}
+    if response_cache is not None:
+        stats.update(await response_cache.get_stats())
+    vertex_ai_client = http_request.app.state.vertex_ai_client
+    if vertex_ai_client is not None:
+        stats["context_cache"] = vertex_ai_client.get_usage_stats()
+    return stats
+
+
+@app.get("/metrics", include_in_schema=False)
+async def show_metrics(access_verification: None = Depends(verify_metrics_access)):
+    """Prometheus scrape endpoint, values are for this worker process."""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
     
 @app.get("/api/v1/health")
 async def show_health():
+    """Liveness only: the process is up. Use /api/v1/ready to decide whether to send it traffic."""
     return Response(status_code=200)
 
+
+@app.get("/api/v1/ready")
+async def show_readiness(http_request: Request):
+    """
+    Readiness probe: 200 once startup and warm-up finished and the Vertex client exists, 503 before.
+    Redis being down is reported as degraded but still ready, limits and caching work without it.
+    """
+    state = http_request.app.state
+    components = {"vertex": {"status": "ok" if state.vertex_ai_client is not None else "unavailable"}}
+
+    redis_conn = getattr(state, "redis", None)
+    if redis_conn is None:
+        components["redis"] = {"status": "unavailable"}
+    else:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(redis_conn.ping(), timeout=0.5)
+            components["redis"] = {"status": "ok", "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
+        except Exception as e:
+            components["redis"] = {"status": "unavailable", "error": type(e).__name__}
+
+    for component, result in getattr(state, "warmup", {}).items():
+        components.setdefault(component, {})["warmup"] = result
+
+    ready = bool(getattr(state, "ready", False))
+    degraded = any(component["status"] != "ok" or component.get("warmup", {}).get("status") == "failed" for component in components.values())
+    body = {
+        "ready": ready,
+        "status": "starting" if not ready else ("degraded" if degraded else "ok"),
+        "pid": os.getpid(),
+        "components": components,
+        "startup_ms": {
+            "import": round(IMPORT_SECONDS * 1000, 1),
+            "lifespan": round(getattr(state, "startup_seconds", 0.0) * 1000, 1),
+        },
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
+
 @app.get("/favicon.ico", include_in_schema=False)
 async def favicon_no_content():
     return Response(status_code=204)
@@ -0,0 +1,248 @@
+"""
+Minimal Prometheus metrics for the backend, rendered in the text exposition format at /metrics.
+
+Kept in-house instead of pulling in prometheus_client: the backend only needs counters, gauges
+and histograms, and recording one is a dict lookup plus a bisect, cheap enough for every request.
+Values are per worker process; Prometheus sums them across workers at query time.
+"""
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Seconds, from a cached lookup up to a slow generation
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Bytes, from an error body up to a long augmented prompt
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {} # label values tuple -> child holding the value(s)
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values):
+        """Returns the child for these label values (positional, in labelnames order)."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for values, child in list(self._children.items()):
+            yield from self._render_child(values, child)
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def _render_child(self, values, child):
+        yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_number(child.value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+    @contextmanager
+    def track_inprogress(self, *values):
+        child = self.labels(*values) if values else self._default
+        child.inc()
+        try:
+            yield
+        finally:
+            child.dec()
+
+
+class _HistogramValue:
+    __slots__ = ("upper_bounds", "counts", "sum")
+
+    def __init__(self, upper_bounds):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1) # the last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.upper_bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.upper_bounds)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def _render_child(self, values, child):
+        cumulative = 0
+        for bound, count in zip(self.upper_bounds + (float("inf"),), child.counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, f'le="{_format_number(float(bound))}"')
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = _format_labels(self.labelnames, values)
+        yield f"{self.name}_sum{labels} {_format_number(child.sum)}"
+        yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: _Metric):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Cold start, set once per worker
+IMPORT_SECONDS = Gauge("app_import_seconds", "Time to import the app module, google.genai included")
+STARTUP_SECONDS = Gauge("app_startup_seconds", "Time from lifespan start until the worker was ready, warm-up included")
+WARMUP_SECONDS = Gauge("app_warmup_seconds", "Duration of each warm-up step", ("component",))
+
+# Request level, recorded by MetricsMiddleware
+REQUESTS = Counter("http_requests_total", "HTTP requests handled", ("route", "method", "status"))
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "Total time to handle a request, including streaming the body", ("route",))
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being handled")
+RESPONSE_SIZE = Histogram("http_response_size_bytes", "Response body size", ("route",), buckets=SIZE_BUCKETS)
+
+# Stages inside generate_prompt
+AUTH_LATENCY = Histogram("auth_duration_seconds", "Time spent checking the API key")
+RATE_LIMIT_LATENCY = Histogram("rate_limit_duration_seconds", "Time spent in the rate limiter")
+RATE_LIMITED = Counter("rate_limited_requests_total", "Requests rejected with 429", ("route",))
+
+# Upstream, recorded by VertexAIClient
+VERTEX_LATENCY = Histogram("vertex_request_duration_seconds", "Time for a Vertex call, including retries and hedging", ("mode",))
+VERTEX_IN_FLIGHT = Gauge("vertex_requests_in_flight", "Vertex calls currently running")
+VERTEX_ERRORS = Counter("vertex_errors_total", "Failed Vertex calls by error type", ("mode", "type"))
+VERTEX_RESPONSE_SIZE = Histogram("vertex_response_size_chars", "Length of generated prompts in characters", ("mode",), buckets=SIZE_BUCKETS)
+
+# Context caching, labelled by where the system instruction came from ("cached" or "inline")
+VERTEX_ATTEMPT_LATENCY = Histogram("vertex_attempt_duration_seconds", "One Vertex attempt: full response for generate, first chunk for stream", ("mode", "context"))
+VERTEX_PROMPT_TOKENS = Counter("vertex_prompt_tokens_total", "Input tokens reported by Vertex, cached ones included", ("context",))
+VERTEX_CACHED_TOKENS = Counter("vertex_cached_tokens_total", "Input tokens served from the context cache instead of being resent")
+
+
+def error_type(error: BaseException) -> str:
+    """Short, low-cardinality label for an upstream error, e.g. "APIError_503" or "TimeoutError"."""
+    # Exhausted retries wrap the last upstream error, which is the more useful label
+    error = error.__cause__ or error
+    code = getattr(error, "code", None)
+    name = type(error).__name__
+    return f"{name}_{code}" if isinstance(code, int) else name
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware timing every HTTP request and counting response bytes as they are sent,
+    which also covers streamed responses. Routes are labelled with their path template after
+    routing, unknown paths share one "unmatched" label so scanners can't blow up cardinality.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_and_measure(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_and_measure)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            route = scope.get("route")
+            route_label = getattr(route, "path", None) or "unmatched"
+            REQUESTS.labels(route_label, scope["method"], str(status)).inc()
+            REQUEST_LATENCY.labels(route_label).observe(time.perf_counter() - start)
+            RESPONSE_SIZE.labels(route_label).observe(size)
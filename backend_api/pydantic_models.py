@@ -15,6 +15,27 @@ class PromptResponse(BaseModel):
         max_length = 10000,
         description="AI-generated augmented prompt"
     )
+
+class BatchPromptRequest(BaseModel):
+    """Request model for the batch endpoint: several prompt requests answered in one call"""
+    items: list[PromptRequest] = Field(
+        min_length=1,
+        max_length=100, # hard ceiling, the server's BATCH_MAX_ITEMS setting is usually lower
+        description="Requests to transform, answered in the same order"
+    )
+
+class BatchItemResult(BaseModel):
+    """Outcome of one batch item: either the prompt or the error it would have gotten on its own"""
+    index: int = Field(description="Position of the item in the request")
+    status_code: int = Field(description="HTTP status this item would have had as a single request")
+    augmented_prompt: str | None = None
+    error: str | None = None
+
+class BatchPromptResponse(BaseModel):
+    """Response model for the batch endpoint"""
+    results: list[BatchItemResult]
+    succeeded: int
+    failed: int
 #note: 
 #we set the min length to 1 to catch empty strings, and the max length to prevent prompt injection 
 #into wasting my credits and getting super long answers
@@ -0,0 +1,250 @@
+import asyncio
+import ipaddress
+import logging
+import math
+import time
+from dataclasses import dataclass
+
+from fastapi import HTTPException, Request
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    times: int
+    seconds: int
+
+    @classmethod
+    def parse(cls, spec: str) -> "RateLimit":
+        """Parses "20/minute", "5/second", "1000/day" (plural units are accepted too)."""
+        try:
+            times, unit = spec.strip().split("/", 1)
+            seconds = _PERIODS[unit.strip().lower().rstrip("s")]
+            return cls(int(times), seconds)
+        except (ValueError, KeyError):
+            raise ValueError(f"Invalid rate limit '{spec}', expected e.g. '20/minute'")
+
+    @property
+    def rate(self) -> float:
+        return self.times / self.seconds
+
+
+class _Bucket:
+    """Token bucket for one (route, client) pair, plus what it owes the shared Redis counter."""
+    __slots__ = ("limit", "tokens", "updated", "unsynced")
+
+    def __init__(self, limit: RateLimit, now: float):
+        self.limit = limit
+        self.tokens = float(limit.times)
+        self.updated = now
+        self.unsynced = 0    # requests admitted here that Redis hasn't been told about yet
+
+    def refill(self, now: float):
+        self.tokens = min(self.limit.times, self.tokens + (now - self.updated) * self.limit.rate)
+        self.updated = now
+
+    def is_full(self, now: float) -> bool:
+        """True once refilling has topped it up, i.e. it's no different from a brand new bucket."""
+        return self.tokens + (now - self.updated) * self.limit.rate >= self.limit.times
+
+
+class LocalFirstRateLimiter:
+    """
+    Rate limiter that decides every request in memory and reconciles with Redis in the background.
+
+    Each (route, client) pair has a token bucket in this worker, so admitting a request never
+    waits on the network. Every `sync_interval` seconds the requests admitted since the last
+    sync are added to a per-window counter in Redis with one pipelined round trip, and each
+    bucket is capped to what is left of the limit across all workers. Workers can therefore
+    overshoot a shared limit by at most what they admit within one sync interval.
+
+    If Redis is missing or failing, buckets simply keep working on their own, which turns the
+    limits into per-process limits until Redis answers again.
+
+    Buckets that have refilled completely are dropped every PRUNE_INTERVAL seconds (a new one
+    would be identical), so memory follows the clients active within their window, with or
+    without Redis.
+    """
+    KEY_PREFIX = "ratelimit"
+    PRUNE_INTERVAL = 10.0
+
+    def __init__(self, redis_conn=None, default: str = "20/minute", routes: dict = None, keys: dict = None,
+                 sync_interval: float = 1.0, trusted_proxies: list = None):
+        """
+        :param redis_conn: redis.asyncio connection used for cluster-wide counts, or None for local only.
+        :param default: Limit for routes and clients without an override.
+        :param routes: Route path -> limit, e.g. {"/api/v1/generate-prompt/stream": "10/minute"}.
+        :param keys: Client key -> limit, overriding route limits for that client.
+        :param sync_interval: Seconds between batched reconciliations with Redis.
+        :param trusted_proxies: Addresses or networks of our own reverse proxies; X-Forwarded-For is
+                                only believed from these (see client_key).
+        """
+        self.redis = redis_conn
+        self.default = RateLimit.parse(default)
+        self.routes = {route: RateLimit.parse(spec) for route, spec in (routes or {}).items()}
+        self.keys = {key: RateLimit.parse(spec) for key, spec in (keys or {}).items()}
+        self.sync_interval = sync_interval
+        self.trusted_proxies = parse_networks(trusted_proxies or [])
+        self.redis_healthy = redis_conn is not None
+        self._buckets = {} # (route, client key) -> _Bucket
+        self._pruned_at = time.monotonic()
+        self._sync_task = None
+        self.stats = {"allowed": 0, "limited": 0, "syncs": 0, "sync_errors": 0}
+
+    def limit_for(self, route: str, key: str) -> RateLimit:
+        return self.keys.get(key) or self.routes.get(route) or self.default
+
+    def hit(self, route: str, key: str, cost: int = 1):
+        """
+        Takes `cost` tokens for one request. Returns None if allowed, otherwise the number of
+        seconds until enough tokens are back.
+        """
+        now = time.monotonic()
+        if now - self._pruned_at >= self.PRUNE_INTERVAL:
+            self._prune(now)
+        bucket = self._buckets.get((route, key))
+        if bucket is None:
+            bucket = self._buckets[(route, key)] = _Bucket(self.limit_for(route, key), now)
+        bucket.refill(now)
+        if bucket.tokens >= cost:
+            bucket.tokens -= cost
+            bucket.unsynced += cost
+            self.stats["allowed"] += 1
+            return None
+        self.stats["limited"] += 1
+        missing = cost - bucket.tokens
+        return missing / bucket.limit.rate
+
+    def _prune(self, now: float):
+        """
+        Forgets buckets that are full again. One that still owes Redis counts is kept until a
+        sync delivers them, unless Redis is gone, in which case nobody is waiting for them.
+        """
+        self._pruned_at = now
+        for pair in [pair for pair, bucket in self._buckets.items()
+                     if bucket.is_full(now) and (not bucket.unsynced or not self.redis_healthy)]:
+            del self._buckets[pair]
+
+    async def check(self, request: Request, cost: int = 1, route: str = None):
+        """
+        Raises 429 with Retry-After if the calling client is over its limit for this route.
+        `route` charges another route's bucket instead, e.g. batch items against the single endpoint.
+        """
+        route = route or request.url.path
+        key = client_key(request, self.trusted_proxies)
+        limit = self.limit_for(route, key)
+        if cost > limit.times:
+            # would never fit in the bucket, waiting can't help
+            raise HTTPException(status_code=413, detail=f"Request costs {cost} but the limit is {limit.times} per {limit.seconds}s")
+        retry_after = self.hit(route, key, cost)
+        if retry_after is not None:
+            raise HTTPException(status_code=429, detail="Too Many Requests", headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+    def start(self):
+        if self.redis is not None and self._sync_task is None:
+            self._sync_task = asyncio.create_task(self._sync_loop())
+
+    async def stop(self):
+        if self._sync_task is None:
+            return
+        self._sync_task.cancel()
+        try:
+            await self._sync_task
+        except asyncio.CancelledError:
+            pass
+        self._sync_task = None
+        await self.sync() # hand the last admissions to the other workers
+
+    async def _sync_loop(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            await self.sync()
+
+    async def sync(self):
+        """Pushes locally admitted requests to Redis and caps buckets to the cluster-wide remainder."""
+        now_wall = time.time()
+        now = time.monotonic()
+        self._prune(now)
+        if self.redis is None or not self._buckets:
+            return
+
+        pending = list(self._buckets.items())
+        sent = [bucket.unsynced for _, bucket in pending]
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for ((route, key), bucket), count in zip(pending, sent):
+                    window = int(now_wall // bucket.limit.seconds)
+                    redis_key = f"{self.KEY_PREFIX}:{route}:{key}:{window}"
+                    pipe.incrby(redis_key, count)
+                    pipe.expire(redis_key, bucket.limit.seconds * 2)
+                results = await pipe.execute()
+        except Exception as e:
+            self.stats["sync_errors"] += 1
+            if self.redis_healthy:
+                logger.warning(f"rate limiter lost Redis, enforcing per-process limits until it's back: {e}")
+            self.redis_healthy = False
+            return
+
+        if not self.redis_healthy:
+            logger.info("rate limiter reconnected to Redis, limits are cluster-wide again")
+        self.redis_healthy = True
+        self.stats["syncs"] += 1
+        for index, ((_, bucket), count) in enumerate(zip(pending, sent)):
+            # Clear only what was sent, requests admitted during the round trip go out next time
+            bucket.unsynced -= count
+            used_cluster_wide = results[index * 2]
+            bucket.refill(now)
+            bucket.tokens = min(bucket.tokens, max(0, bucket.limit.times - used_cluster_wide))
+
+
+def parse_networks(specs) -> tuple:
+    """Parses addresses and CIDR ranges like "10.0.0.0/8" into ip_network objects."""
+    try:
+        return tuple(ipaddress.ip_network(spec.strip(), strict=False) for spec in specs)
+    except ValueError as e:
+        raise ValueError(f"Invalid trusted proxy: {e}")
+
+
+def _is_trusted(address: str, trusted_proxies) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted_proxies)
+
+
+def client_key(request: Request, trusted_proxies=()) -> str:
+    """
+    Identifies the caller by address. X-Forwarded-For only counts when the connection comes from
+    one of `trusted_proxies`: then the hops are walked back from the nearest one and the first
+    address that isn't a trusted proxy is the client. Anything further left was written by the
+    client itself and can't be believed, so rotating it doesn't get anyone a fresh bucket.
+    """
+    peer = request.client.host if request.client else "unknown"
+    forwarded = request.headers.get("X-Forwarded-For")
+    if not forwarded or not _is_trusted(peer, trusted_proxies):
+        return peer
+    hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not _is_trusted(hop, trusted_proxies):
+            return hop
+    return hops[0] if hops else peer
+
+
+async def charge(request: Request, cost: int = 1, route: str = None):
+    """Applies the app's LocalFirstRateLimiter for `cost` requests, recording the limiter metrics."""
+    with metrics.RATE_LIMIT_LATENCY.time():
+        try:
+            await request.app.state.rate_limiter.check(request, cost, route)
+        except HTTPException:
+            metrics.RATE_LIMITED.labels(route or request.url.path).inc()
+            raise
+
+
+async def rate_limit(request: Request):
+    """FastAPI dependency applying the app's LocalFirstRateLimiter to the current route."""
+    await charge(request)
@@ -0,0 +1,281 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses worth another attempt: timeouts, throttling and upstream server trouble
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class UpstreamUnavailableError(Exception):
+    """Vertex is failing or overloaded; the client should come back after `retry_after` seconds."""
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamUnavailableError):
+    """Raised without calling upstream while the circuit breaker is open."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """True for transient failures: timeouts, connection errors and retryable HTTP statuses."""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError, httpx.TransportError)):
+        return True
+    code = getattr(error, "code", None) # google.genai.errors.APIError (and the fake) carry the status here
+    return isinstance(code, int) and code in RETRYABLE_STATUS_CODES
+
+
+class CircuitBreaker:
+    """
+    Counts consecutive upstream failures. After `failure_threshold` of them the circuit
+    opens and calls fail fast for `recovery_time` seconds; then one probe call is let
+    through (half-open) and its outcome closes or re-opens the circuit.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, recovery_time: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_time = recovery_time
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def retry_after(self) -> float:
+        return max(0.0, self._opened_at + self.recovery_time - time.monotonic())
+
+    def before_call(self) -> bool:
+        """
+        Raises CircuitOpenError if calls should not reach upstream right now. Returns True if
+        this call is the half-open probe, which must end in record_success, record_failure or release_probe.
+        """
+        if self.state == self.OPEN:
+            if self.retry_after() > 0:
+                raise CircuitOpenError("Upstream model is unavailable", self.retry_after())
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                raise CircuitOpenError("Upstream model is recovering", 1.0)
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info("circuit breaker closed, upstream recovered")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def release_probe(self):
+        """Ends a call that says nothing about upstream health (e.g. a bad request) without changing state."""
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"circuit breaker opened after {self.failures} consecutive failures")
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Sliding window of recent successful call durations, used to pick the hedging delay."""
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, pct: float, min_samples: int = 1):
+        """Returns the `pct` percentile in seconds, or None until `min_samples` calls were seen."""
+        if len(self._samples) < max(1, min_samples):
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+class ResiliencePolicy:
+    """
+    Wraps calls to Vertex with retries, hedging and a circuit breaker.
+
+    Each attempt gets `attempt_timeout` seconds (0 for no limit), so a hung connection ends
+    in a retryable timeout instead of holding the request forever. Retryable failures are
+    retried up to `retry_count` times with exponential backoff and full jitter. Once enough latencies are known, a call still running past the
+    `hedge_percentile` latency gets a second, identical attempt and whichever finishes first
+    wins. Every failed attempt feeds the circuit breaker, which makes requests fail fast with
+    UpstreamUnavailableError while upstream is unhealthy.
+    """
+    def __init__(self, retry_count: int = 2, base_delay: float = 0.25, max_delay: float = 4.0,
+                 hedge_enabled: bool = True, hedge_percentile: float = 95.0, hedge_min_samples: int = 20,
+                 breaker_failure_threshold: int = 5, breaker_recovery_time: float = 30.0, attempt_timeout: float = 30.0):
+        self.retry_count = max(0, retry_count)
+        self.attempt_timeout = attempt_timeout if attempt_timeout and attempt_timeout > 0 else None
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = CircuitBreaker(breaker_failure_threshold, breaker_recovery_time)
+        self.latency = LatencyTracker()
+        self.stats = {"calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "failures": 0, "short_circuited": 0}
+
+    @classmethod
+    def from_settings(cls, settings) -> "ResiliencePolicy":
+        return cls(
+            retry_count=settings.API_RETRY_COUNT,
+            base_delay=settings.RETRY_BASE_DELAY_SECONDS,
+            max_delay=settings.RETRY_MAX_DELAY_SECONDS,
+            hedge_enabled=settings.HEDGE_ENABLED,
+            hedge_percentile=settings.HEDGE_PERCENTILE,
+            hedge_min_samples=settings.HEDGE_MIN_SAMPLES,
+            breaker_failure_threshold=settings.BREAKER_FAILURE_THRESHOLD,
+            breaker_recovery_time=settings.BREAKER_RECOVERY_SECONDS,
+            attempt_timeout=settings.ATTEMPT_TIMEOUT_SECONDS,
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: a random delay up to base * 2^attempt, capped at max_delay."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def _attempt(self, make_attempt: Callable[[], Awaitable[str]]) -> str:
+        """One attempt, cut off with asyncio.TimeoutError (retryable) after attempt_timeout."""
+        return await asyncio.wait_for(make_attempt(), self.attempt_timeout)
+
+    def _check_breaker(self) -> bool:
+        try:
+            return self.breaker.before_call()
+        except CircuitOpenError:
+            self.stats["short_circuited"] += 1
+            raise
+
+    def _give_up(self, error: BaseException):
+        """Turns a final retryable failure into UpstreamUnavailableError, re-raises anything else."""
+        self.stats["failures"] += 1
+        if is_retryable(error):
+            retry_after = self.breaker.retry_after() if self.breaker.state == CircuitBreaker.OPEN else 1.0
+            raise UpstreamUnavailableError(f"Upstream model failed: {error}", retry_after) from error
+        raise error
+
+    async def call(self, make_attempt: Callable[[], Awaitable[str]]) -> str:
+        """Runs `make_attempt()` (a fresh coroutine per attempt) with retries, hedging and the breaker."""
+        self.stats["calls"] += 1
+        for attempt in range(self.retry_count + 1):
+            probe = self._check_breaker()
+            try:
+                result = await self._hedged(make_attempt)
+            except Exception as e:
+                if not is_retryable(e):
+                    # A bad request says nothing about upstream health, don't count it against the breaker
+                    self.breaker.release_probe()
+                    self._give_up(e)
+                self.breaker.record_failure()
+                if attempt == self.retry_count:
+                    self._give_up(e)
+                delay = self.backoff(attempt)
+                self.stats["retries"] += 1
+                logger.warning(f"upstream attempt {attempt + 1} failed ({e}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+            except BaseException:
+                # cancelled (e.g. the client went away): that says nothing about upstream either,
+                # but a probe has to be handed back or the breaker stays half-open for good
+                if probe:
+                    self.breaker.release_probe()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+
+    async def _hedged(self, make_attempt: Callable[[], Awaitable[str]]) -> str:
+        hedge_after = None
+        if self.hedge_enabled:
+            hedge_after = self.latency.percentile(self.hedge_percentile, self.hedge_min_samples)
+
+        started = time.monotonic()
+        primary = asyncio.ensure_future(self._attempt(make_attempt))
+        if hedge_after is None:
+            result = await primary
+            self.latency.record(time.monotonic() - started)
+            return result
+
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                self.stats["hedges"] += 1
+                logger.info(f"upstream call slower than p{self.hedge_percentile:g} ({hedge_after:.2f}s), sending a hedged attempt")
+                tasks.add(asyncio.ensure_future(self._attempt(make_attempt)))
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.stats["hedge_wins"] += 1
+                        self.latency.record(time.monotonic() - started)
+                        return task.result()
+                if not tasks:
+                    # every attempt failed, surface the last error
+                    raise done.pop().exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def stream(self, open_stream: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        Yields chunks from `open_stream()`. Failures before the first chunk are retried like
+        call(); once text has been sent to the client a failure can't be retried and is raised.
+        Streams are not hedged, a duplicate would double the tokens for every slow stream.
+        attempt_timeout bounds the wait for each chunk, the first one as well as a stall later on.
+        """
+        self.stats["calls"] += 1
+        for attempt in range(self.retry_count + 1):
+            probe = self._check_breaker()
+            started_streaming = False
+            chunks = open_stream()
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), self.attempt_timeout)
+                    except StopAsyncIteration:
+                        break
+                    if not started_streaming:
+                        started_streaming = True
+                        self.breaker.record_success()
+                    yield chunk
+                if not started_streaming:
+                    self.breaker.record_success()
+                return
+            except Exception as e:
+                if started_streaming or not is_retryable(e):
+                    self.breaker.release_probe()
+                    self._give_up(e)
+                self.breaker.record_failure()
+                if attempt == self.retry_count:
+                    self._give_up(e)
+                delay = self.backoff(attempt)
+                self.stats["retries"] += 1
+                logger.warning(f"upstream stream attempt {attempt + 1} failed ({e}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+            except BaseException:
+                # cancelled, or closed by the consumer, before the first chunk settled the probe
+                if probe and not started_streaming:
+                    self.breaker.release_probe()
+                raise
+            finally:
+                await chunks.aclose()
@@ -0,0 +1,313 @@
+import asyncio
+import hashlib
+import json
+import logging
+import secrets
+import time
+from typing import AsyncIterator, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(user_query: str) -> str:
+    """Collapses runs of whitespace so trivially different spellings of a prompt share a cache entry."""
+    return " ".join(user_query.split())
+
+
+class _SharedStream:
+    """The chunks of one streamed generation so far, replayed to every caller asking for the same prompt."""
+    def __init__(self):
+        self.chunks = []
+        self.error = None
+        self.finished = False
+        self.task = None
+        self._changed = asyncio.Condition()
+
+    async def publish(self, chunk: str):
+        self.chunks.append(chunk)
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def finish(self, error: BaseException = None):
+        self.error = error
+        self.finished = True
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def follow(self) -> AsyncIterator[str]:
+        """Yields every chunk from the first one on, then raises the generation's error if it failed."""
+        index = 0
+        while True:
+            if index < len(self.chunks):
+                index += 1
+                yield self.chunks[index - 1]
+            elif self.finished:
+                if self.error is not None:
+                    raise self.error
+                return
+            else:
+                async with self._changed:
+                    await self._changed.wait_for(lambda: index < len(self.chunks) or self.finished)
+
+
+class ResponseCache:
+    """
+    Redis-backed cache of augmented prompts, shared by every worker.
+
+    Entries are keyed on a sha256 of the normalized query plus the model name, system
+    instruction and temperature, so changing any of those in Settings naturally misses.
+    Each entry expires after `ttl` seconds and a sorted-set index keeps the newest
+    `max_entries`, evicting the oldest beyond that.
+
+    Concurrent misses for the same key are collapsed twice over: inside a worker they
+    share one in-process task, and across workers the first one to take a short Redis
+    lock (SET NX) calls Vertex while the others poll for its result. Streamed generations are
+    shared the same way, with callers that join late replaying the chunks so far. If Redis misbehaves
+    the cache gets out of the way for REDIS_RETRY_SECONDS and requests go straight upstream.
+    """
+    LOCK_POLL_INTERVAL = 0.05
+    REDIS_RETRY_SECONDS = 5.0
+    STATS_FIELDS = ("hits", "misses", "coalesced", "errors")
+
+    def __init__(self, redis_conn, settings, ttl: int = 3600, max_entries: int = 10000, lock_timeout: float = 30.0, namespace: str = "promptcache"):
+        self.redis = redis_conn
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock_timeout = lock_timeout
+        self.namespace = namespace
+        self._index_key = f"{namespace}:index"
+        self._stats_key = f"{namespace}:stats"
+        # Everything besides the query that changes what Vertex would answer
+        self._fingerprint = json.dumps([settings.LLM_MODEL_NAME, settings.SYSTEM_INSTRUCTION, settings.TEMPERATURE])
+        self._in_flight = {}  # key -> asyncio.Task generating it, shared by concurrent identical requests in this worker
+        self._streams_in_flight = {}  # key -> _SharedStream, the same for streamed requests
+        self.stats = dict.fromkeys(self.STATS_FIELDS, 0)
+        self._unsent = dict.fromkeys(self.STATS_FIELDS, 0) # counts not yet added to the shared hash
+        self._send_task = None
+        self._redis_down_until = 0.0
+
+    def _redis_available(self) -> bool:
+        return time.monotonic() >= self._redis_down_until
+
+    def _redis_failed(self, action: str, error: Exception):
+        """Counts the error and stops using Redis for a while, logging only when it first goes away."""
+        self.stats["errors"] += 1
+        if self._redis_available():
+            logger.warning(f"response cache {action} failed, bypassing cache for {self.REDIS_RETRY_SECONDS:g}s: {error}")
+        self._redis_down_until = time.monotonic() + self.REDIS_RETRY_SECONDS
+
+    def key_for(self, user_query: str) -> str:
+        digest = hashlib.sha256(f"{self._fingerprint}\x00{normalize_query(user_query)}".encode("utf-8")).hexdigest()
+        return f"{self.namespace}:entry:{digest}"
+
+    async def get(self, user_query: str):
+        """Returns the cached prompt for `user_query`, or None. Counts a hit or a miss."""
+        if not self._redis_available():
+            return None
+        key = self.key_for(user_query)
+        try:
+            value = await self.redis.get(key)
+        except Exception as e:
+            self._redis_failed("lookup", e)
+            return None
+        self._count("hits" if value is not None else "misses")
+        return value
+
+    async def get_or_generate(self, user_query: str, generate: Callable[[], Awaitable[str]]) -> str:
+        """Returns the cached prompt, or runs `generate` once for every concurrent caller asking for the same one."""
+        cached = await self.get(user_query)
+        if cached is not None:
+            return cached
+
+        key = self.key_for(user_query)
+        task = self._in_flight.get(key)
+        if task is None:
+            # Runs as its own task rather than in the first caller's, so cancelling any caller can't cancel it
+            task = asyncio.ensure_future(self._fill(key, generate))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self._count("coalesced")
+        # shield so a caller disconnecting only stops waiting, the others (and the cache) still get the result
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Future):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved so asyncio doesn't warn when every caller had gone
+
+    async def stream_or_generate(self, user_query: str, generate_stream: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        Streaming counterpart of get_or_generate: yields the cached prompt as one chunk, or the chunks
+        of one `generate_stream` run shared by every concurrent caller asking for the same prompt. The
+        run is a task of its own, so a caller disconnecting only stops reading it.
+        """
+        cached = await self.get(user_query)
+        if cached is not None:
+            yield cached
+            return
+
+        key = self.key_for(user_query)
+        shared = self._streams_in_flight.get(key)
+        if shared is None:
+            shared = self._streams_in_flight[key] = _SharedStream()
+            shared.task = asyncio.ensure_future(self._fill_stream(key, shared, generate_stream))
+            shared.task.add_done_callback(lambda done: None if done.cancelled() else done.exception())
+        else:
+            self._count("coalesced")
+        async for chunk in shared.follow():
+            yield chunk
+
+    async def _lock(self, lock_key: str, token: str):
+        """
+        Takes the cross-worker lock for one key. Returns True when taken, False when another worker
+        holds it, and None when Redis can't be asked (then just generate).
+        """
+        if not self._redis_available():
+            return None
+        try:
+            return bool(await self.redis.set(lock_key, token, nx=True, px=int(self.lock_timeout * 1000)))
+        except Exception as e:
+            self._redis_failed("lock", e)
+            return None
+
+    async def _fill(self, key: str, generate: Callable[[], Awaitable[str]]) -> str:
+        lock_key = f"{key}:lock"
+        token = secrets.token_hex(8)
+        locked = await self._lock(lock_key, token)
+        if locked is None:
+            return await generate()
+
+        if not locked:
+            # Another worker is already generating this one, wait for it to land in the cache
+            value = await self._wait_for_other_worker(key, lock_key)
+            if value is not None:
+                self._count("coalesced")
+                return value
+            return await generate()
+
+        try:
+            value = await generate()
+            await self.put_by_key(key, value)
+            return value
+        finally:
+            await self._release_lock(lock_key, token)
+
+    async def _fill_stream(self, key: str, shared: _SharedStream, generate_stream: Callable[[], AsyncIterator[str]]):
+        lock_key = f"{key}:lock"
+        token = secrets.token_hex(8)
+        try:
+            locked = await self._lock(lock_key, token)
+            if locked is False:
+                # Another worker is already generating this one, pass its result on as one chunk
+                value = await self._wait_for_other_worker(key, lock_key)
+                if value is not None:
+                    self._count("coalesced")
+                    await shared.publish(value)
+                    await shared.finish()
+                    return
+            try:
+                async for chunk in generate_stream():
+                    await shared.publish(chunk)
+                if locked:
+                    await self.put_by_key(key, "".join(shared.chunks))
+            finally:
+                if locked:
+                    await self._release_lock(lock_key, token)
+            await shared.finish()
+        except BaseException as e:
+            await shared.finish(e)
+            raise
+        finally:
+            if self._streams_in_flight.get(key) is shared:
+                del self._streams_in_flight[key]
+
+    async def _wait_for_other_worker(self, key: str, lock_key: str):
+        deadline = time.monotonic() + self.lock_timeout
+        try:
+            while time.monotonic() < deadline:
+                value = await self.redis.get(key)
+                if value is not None:
+                    return value
+                if not await self.redis.exists(lock_key):
+                    # The other worker failed or gave up, one last look before generating ourselves
+                    return await self.redis.get(key)
+                await asyncio.sleep(self.LOCK_POLL_INTERVAL)
+        except Exception as e:
+            self._redis_failed("poll", e)
+        return None
+
+    async def _release_lock(self, lock_key: str, token: str):
+        try:
+            # Only remove our own lock, it may have expired and been taken by another worker
+            if await self.redis.get(lock_key) == token:
+                await self.redis.delete(lock_key)
+        except Exception as e:
+            logger.warning(f"response cache unlock failed, lock will expire on its own: {e}")
+
+    async def put(self, user_query: str, value: str):
+        await self.put_by_key(self.key_for(user_query), value)
+
+    async def put_by_key(self, key: str, value: str):
+        """Stores a prompt and evicts the oldest entries beyond max_entries."""
+        if not value or not self._redis_available():
+            return  # never cache an empty answer, and don't wait on a Redis that just failed
+        now = time.time()
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.set(key, value, ex=self.ttl)
+                pipe.zadd(self._index_key, {key: now})
+                # drop index entries whose keys have already expired
+                pipe.zremrangebyscore(self._index_key, "-inf", now - self.ttl)
+                pipe.zcard(self._index_key)
+                results = await pipe.execute()
+            overflow = results[-1] - self.max_entries
+            if overflow > 0:
+                evicted = [member for member, _ in await self.redis.zpopmin(self._index_key, overflow)]
+                if evicted:
+                    await self.redis.delete(*evicted)
+                    logger.debug(f"response cache evicted {len(evicted)} entries")
+        except Exception as e:
+            self._redis_failed("store", e)
+
+    def _count(self, field: str):
+        """
+        Bumps a counter. The shared one in Redis is updated in the background, so a cache hit
+        never waits on a second round trip; counts piling up meanwhile go out in one pipeline.
+        """
+        self.stats[field] += 1
+        self._unsent[field] += 1
+        if self._send_task is None and self._redis_available():
+            self._send_task = asyncio.ensure_future(self._send_counts())
+
+    async def _send_counts(self):
+        try:
+            while any(self._unsent.values()) and self._redis_available():
+                counts, self._unsent = self._unsent, dict.fromkeys(self.STATS_FIELDS, 0)
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for field, count in counts.items():
+                        if count:
+                            pipe.hincrby(self._stats_key, field, count)
+                    await pipe.execute()
+        except Exception:
+            pass  # the local counters are still right, the shared ones just miss these events
+        finally:
+            self._send_task = None
+
+    async def get_stats(self) -> dict:
+        """Counters for this worker and, when Redis answers, across all workers."""
+        stats = {"worker": dict(self.stats)}
+        try:
+            if self._send_task is not None:
+                await asyncio.shield(self._send_task)  # so the totals include this worker's latest counts
+            shared = await self.redis.hgetall(self._stats_key)
+            totals = {field: int(shared.get(field, 0)) for field in self.STATS_FIELDS}
+            stats["entries"] = await self.redis.zcard(self._index_key)
+        except Exception as e:
+            logger.warning(f"could not read shared response cache stats: {e}")
+            totals = dict(self.stats)
+        lookups = totals["hits"] + totals["misses"]
+        totals["hit_ratio"] = round(totals["hits"] / lookups, 4) if lookups else 0.0
+        stats["total"] = totals
+        return stats
@@ -1,5 +1,9 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
+from pydantic import model_validator
 from pathlib import Path 
+from .rate_limiter import RateLimit
+BATCH_ITEMS_CEILING = 100 # BatchPromptRequest's schema limit
+
 class Settings(BaseSettings):
     VERTEX_AI_PROJECT: str
     VERTEX_AI_LOCATION: str
@@ -9,9 +13,66 @@ class Settings(BaseSettings):
     TEMPERATURE: float
     API_RETRY_COUNT: int
     BACKEND_API_KEY:str
-    REDIS_URL:str
+    REDIS_URL:str #"memory://" uses an in-process fakeredis instead of a server
+    #most Vertex calls one worker process runs at once, and how long a request may wait for a free slot
+    LLM_MAX_CONCURRENCY:int = 32
+    LLM_QUEUE_TIMEOUT_SECONDS:float = 10.0
+    #shared response cache, identical prompts within the TTL are served from Redis
+    RESPONSE_CACHE_ENABLED:bool = True
+    RESPONSE_CACHE_TTL_SECONDS:int = 3600
+    RESPONSE_CACHE_MAX_ENTRIES:int = 10000
+    RESPONSE_CACHE_LOCK_SECONDS:float = 30.0
+    #retries (API_RETRY_COUNT of them) back off exponentially with jitter between these bounds
+    RETRY_BASE_DELAY_SECONDS:float = 0.25
+    RETRY_MAX_DELAY_SECONDS:float = 4.0
+    #longest one upstream attempt (or the wait for one stream chunk) may take before it counts as a retryable failure, 0 for no limit
+    ATTEMPT_TIMEOUT_SECONDS:float = 30.0
+    #send a second attempt when the first is slower than this latency percentile of recent calls
+    HEDGE_ENABLED:bool = True
+    HEDGE_PERCENTILE:float = 95.0
+    HEDGE_MIN_SAMPLES:int = 20
+    #consecutive upstream failures before failing fast, and how long to fail fast
+    BREAKER_FAILURE_THRESHOLD:int = 5
+    BREAKER_RECOVERY_SECONDS:float = 30.0
+    #rate limits like "20/minute"; RATE_LIMIT_ROUTES maps a path and RATE_LIMIT_KEYS a client address to its own limit (JSON in .env)
+    RATE_LIMIT_DEFAULT:str = "20/minute"
+    RATE_LIMIT_ROUTES:dict[str, str] = {}
+    RATE_LIMIT_KEYS:dict[str, str] = {}
+    #how often each worker reconciles its local counts with Redis
+    RATE_LIMIT_SYNC_SECONDS:float = 1.0
+    #addresses/CIDR ranges of our own reverse proxies; X-Forwarded-For is ignored unless the request comes through one (JSON list in .env)
+    RATE_LIMIT_TRUSTED_PROXIES:list[str] = []
+    #bearer token Prometheus sends to /metrics ("Authorization: Bearer <token>"); when empty, /metrics takes the X-API-KEY instead
+    METRICS_TOKEN:str = ""
+    #answer with an in-process fake instead of Vertex (load tests, local runs); latency is a distribution spec like "lognormal:0.8,0.4"
+    USE_FAKE_VERTEX:bool = False
+    FAKE_VERTEX_LATENCY:str = "lognormal:0.8,0.4"
+    FAKE_VERTEX_CHUNK_DELAY:float = 0.05
+    FAKE_VERTEX_ERROR_RATE:float = 0.0
+    FAKE_VERTEX_PREFILL_PER_1K_TOKENS:float = 0.0
+    #register SYSTEM_INSTRUCTION as a Vertex cached context and reference it instead of resending it;
+    #Vertex only caches contexts above a minimum size (1024+ tokens depending on the model), below that it stays inline
+    CONTEXT_CACHE_ENABLED:bool = False
+    CONTEXT_CACHE_TTL_SECONDS:int = 3600
+    CONTEXT_CACHE_REFRESH_MARGIN_SECONDS:int = 300
+    #how many items of one batch request are generated at once (LLM_MAX_CONCURRENCY still caps the worker)
+    BATCH_MAX_PARALLELISM:int = 8
+    #largest batch accepted; each item is charged to the /api/v1/generate-prompt limit, so it can't exceed that limit
+    BATCH_MAX_ITEMS:int = 20
+    #make a cheap Vertex call and a Redis ping before taking traffic, each step capped at the timeout
+    WARMUP_ENABLED:bool = True
+    WARMUP_TIMEOUT_SECONDS:float = 10.0
     #model config for reliable loading:
 
+    @model_validator(mode="after")
+    def check_batch_fits_rate_limit(self):
+        """A batch bigger than the single endpoint's limit could never be admitted, refuse such a config up front."""
+        limit = RateLimit.parse(self.RATE_LIMIT_ROUTES.get("/api/v1/generate-prompt", self.RATE_LIMIT_DEFAULT))
+        if not 1 <= self.BATCH_MAX_ITEMS <= min(BATCH_ITEMS_CEILING, limit.times):
+            raise ValueError(f"BATCH_MAX_ITEMS must be between 1 and {min(BATCH_ITEMS_CEILING, limit.times)} "
+                             f"(the /api/v1/generate-prompt limit is {limit.times} per {limit.seconds}s)")
+        return self
+
     model_config = SettingsConfigDict(
         env_file=Path(__file__).parent/".env",
         env_file_encoding="utf-8"
@@ -1,4 +1,8 @@
 from .settings import Settings
+from .resilience import ResiliencePolicy
+from .context_cache import SystemInstructionCache
+from . import metrics
+import time
 from google import genai
 from google.genai.types import GenerateContentConfig
 import logging
@@ -9,8 +13,13 @@ class VertexAIClient:
     """
     Class to handle Vertex Client related interactions"""
 
-    def __init__(self, settings: Settings):
-        """Initializing the Vertex AI Client"""
+    def __init__(self, settings: Settings, client=None):
+        """
+        Initializing the Vertex AI Client
+
+        :param client: Optional pre-built genai client. Tests and load tests pass a
+                       FakeGenaiClient here so no network or credentials are needed.
+        """
         self.project=settings.VERTEX_AI_PROJECT
         self.location=settings.VERTEX_AI_LOCATION
         self.model_name = settings.LLM_MODEL_NAME
@@ -22,27 +31,223 @@ class VertexAIClient:
             raise ValueError("VERTEX_AI_PROJECT and LOCATION not set")
 
 
-        self.client = genai.Client(
+        self.client = client or genai.Client(
             vertexai=True, 
             project = self.project,
             location=self.location
         )
+        # retries, hedging and the circuit breaker for the async paths the endpoints use
+        self.resilience = ResiliencePolicy.from_settings(settings)
+        # optional: reference SYSTEM_INSTRUCTION as a Vertex cached context instead of resending it
+        self.context_cache = None
+        if settings.CONTEXT_CACHE_ENABLED:
+            self.context_cache = SystemInstructionCache(
+                self.client,
+                ttl=settings.CONTEXT_CACHE_TTL_SECONDS,
+                refresh_margin=settings.CONTEXT_CACHE_REFRESH_MARGIN_SECONDS,
+            )
+        # per context ("cached"/"inline"): attempts, their total seconds and the tokens Vertex reported
+        self.usage = {context: dict.fromkeys(("requests", "seconds", "prompt_tokens", "cached_tokens"), 0) for context in ("cached", "inline")}
         logger.info(f"VertexAIClient initialized for model '{settings.LLM_MODEL_NAME}'.")
 
+    def _generation_config(self, cached_content: str = None) -> GenerateContentConfig:
+        if cached_content:
+            # the instruction lives in the cache, Vertex rejects sending it again alongside
+            return GenerateContentConfig(
+                temperature = self.temperature,
+                max_output_tokens=self.max_tokens,
+                cached_content=cached_content
+            )
+        return GenerateContentConfig(
+            temperature = self.temperature,
+            max_output_tokens=self.max_tokens,
+            system_instruction=self.system_instructions
+        )
+
+    async def _cached_context(self):
+        """Name of the context cache holding the system instruction, or None to send it inline."""
+        if self.context_cache is None:
+            return None
+        return await self.context_cache.current(self.model_name, self.system_instructions)
+
+    @staticmethod
+    def _is_missing_cache_error(error: Exception) -> bool:
+        """
+        True for "this cached content doesn't exist (any more)": a 404 / NOT_FOUND, or the 400
+        Vertex answers with for an expired cache. Other 400s (oversized prompt, safety block, bad
+        parameter) would fail again without the cache too, so they don't count.
+        """
+        code = getattr(error, "code", None)
+        if code == 404 or getattr(error, "status", None) == "NOT_FOUND":
+            return True
+        message = str(getattr(error, "message", None) or error).lower()
+        return code == 400 and "cache" in message and ("expired" in message or "not found" in message)
+
+    def _cache_rejected(self, cached_content, error: Exception) -> bool:
+        """True if Vertex refused the request because the referenced context cache is gone."""
+        if cached_content and self._is_missing_cache_error(error):
+            logger.warning(f"Vertex no longer has context cache {cached_content}, retrying with the instruction inline: {error}")
+            self.context_cache.invalidate(cached_content)
+            return True
+        return False
+
+    def _record_usage(self, mode: str, cached_content, seconds: float, usage_metadata):
+        context = "cached" if cached_content else "inline"
+        metrics.VERTEX_ATTEMPT_LATENCY.labels(mode, context).observe(seconds)
+        usage = self.usage[context]
+        usage["requests"] += 1
+        usage["seconds"] += seconds
+        if usage_metadata is None:
+            return
+        prompt_tokens = usage_metadata.prompt_token_count or 0
+        cached_tokens = usage_metadata.cached_content_token_count or 0
+        usage["prompt_tokens"] += prompt_tokens
+        usage["cached_tokens"] += cached_tokens
+        metrics.VERTEX_PROMPT_TOKENS.labels(context).inc(prompt_tokens)
+        if cached_tokens:
+            metrics.VERTEX_CACHED_TOKENS.inc(cached_tokens)
+
+    def get_usage_stats(self) -> dict:
+        """Attempts, mean latency and input tokens with and without the context cache, for /api/v1/cache/stats."""
+        stats = {}
+        for context, usage in self.usage.items():
+            requests = usage["requests"]
+            stats[context] = {
+                "requests": requests,
+                "mean_latency_ms": round(usage["seconds"] / requests * 1000, 2) if requests else None,
+                "prompt_tokens": usage["prompt_tokens"],
+                "cached_tokens": usage["cached_tokens"],
+            }
+        total_prompt_tokens = sum(usage["prompt_tokens"] for usage in self.usage.values())
+        stats["cached_token_ratio"] = round(self.usage["cached"]["cached_tokens"] / total_prompt_tokens, 4) if total_prompt_tokens else 0.0
+        if self.context_cache is not None:
+            stats["cache"] = self.context_cache.get_stats()
+        return stats
+
     def generate_prompt(self, user_query:str)->str:
         logger.info(f"system instruction injected: {self.system_instructions}")
+        start = time.perf_counter()
+        metrics.VERTEX_IN_FLIGHT.inc()
         try:
             response = self.client.models.generate_content(
                 model=self.model_name,
                 contents=user_query,
-                config = GenerateContentConfig(
-                    temperature = self.temperature,
-                    max_output_tokens=self.max_tokens,
-                    system_instruction=self.system_instructions
-                )            
+                config = self._generation_config()
             )
-            return response.text or ""
+            text = response.text or ""
+            metrics.VERTEX_RESPONSE_SIZE.labels("sync").observe(len(text))
+            return text
         except Exception as e:
+            metrics.VERTEX_ERRORS.labels("sync", metrics.error_type(e)).inc()
             logger.error(f"Error ocrrued during API call: {e}")
             raise
+        finally:
+            metrics.VERTEX_IN_FLIGHT.dec()
+            metrics.VERTEX_LATENCY.labels("sync").observe(time.perf_counter() - start)
 
+    async def warm_up(self):
+        """
+        Cheapest authenticated call there is (token counting, no generation) so credentials,
+        DNS, TLS and the SDK's connection pool are all set up before the first real request.
+        """
+        await self.client.aio.models.count_tokens(model=self.model_name, contents="warm-up")
+        # build the context cache now as well, instead of on the first request
+        await self._cached_context()
+
+    def start(self):
+        """Starts background work: keeping the context cache alive, if enabled."""
+        if self.context_cache is not None:
+            self.context_cache.start(lambda: (self.model_name, self.system_instructions))
+
+    async def stop(self):
+        if self.context_cache is not None:
+            await self.context_cache.stop()
+
+    async def generate_prompt_async(self, user_query: str) -> str:
+        """
+        Same as generate_prompt, but on the SDK's async client so the event loop keeps serving
+        other requests. Goes through the resilience policy, so it may raise UpstreamUnavailableError.
+        """
+        start = time.perf_counter()
+        metrics.VERTEX_IN_FLIGHT.inc()
+        try:
+            text = await self.resilience.call(lambda: self._generate_once(user_query))
+            metrics.VERTEX_RESPONSE_SIZE.labels("generate").observe(len(text))
+            return text
+        except Exception as e:
+            metrics.VERTEX_ERRORS.labels("generate", metrics.error_type(e)).inc()
+            logger.error(f"Error ocrrued during API call: {e}")
+            raise
+        finally:
+            metrics.VERTEX_IN_FLIGHT.dec()
+            metrics.VERTEX_LATENCY.labels("generate").observe(time.perf_counter() - start)
+
+    async def _generate_once(self, user_query: str) -> str:
+        cached_content = await self._cached_context()
+        start = time.perf_counter()
+        try:
+            response = await self.client.aio.models.generate_content(
+                model=self.model_name,
+                contents=user_query,
+                config = self._generation_config(cached_content)
+            )
+        except Exception as e:
+            if not self._cache_rejected(cached_content, e):
+                raise
+            cached_content = None
+            start = time.perf_counter()
+            response = await self.client.aio.models.generate_content(
+                model=self.model_name,
+                contents=user_query,
+                config = self._generation_config()
+            )
+        self._record_usage("generate", cached_content, time.perf_counter() - start, getattr(response, "usage_metadata", None))
+        return response.text or ""
+
+    async def generate_prompt_stream_async(self, user_query: str):
+        """Yields the augmented prompt in text chunks as the model generates them, retried until the first chunk arrives."""
+        start = time.perf_counter()
+        size = 0
+        metrics.VERTEX_IN_FLIGHT.inc()
+        try:
+            async for chunk in self.resilience.stream(lambda: self._stream_once(user_query)):
+                size += len(chunk)
+                yield chunk
+            metrics.VERTEX_RESPONSE_SIZE.labels("stream").observe(size)
+        except Exception as e:
+            metrics.VERTEX_ERRORS.labels("stream", metrics.error_type(e)).inc()
+            logger.error(f"Error ocrrued during streaming API call: {e}")
+            raise
+        finally:
+            metrics.VERTEX_IN_FLIGHT.dec()
+            metrics.VERTEX_LATENCY.labels("stream").observe(time.perf_counter() - start)
+
+    async def _stream_once(self, user_query: str):
+        cached_content = await self._cached_context()
+        start = time.perf_counter()
+        try:
+            stream = await self.client.aio.models.generate_content_stream(
+                model=self.model_name,
+                contents=user_query,
+                config = self._generation_config(cached_content)
+            )
+        except Exception as e:
+            if not self._cache_rejected(cached_content, e):
+                raise
+            cached_content = None
+            start = time.perf_counter()
+            stream = await self.client.aio.models.generate_content_stream(
+                model=self.model_name,
+                contents=user_query,
+                config = self._generation_config()
+            )
+        first_chunk_seconds = None
+        usage_metadata = None
+        async for chunk in stream:
+            if first_chunk_seconds is None:
+                first_chunk_seconds = time.perf_counter() - start
+            # usage arrives on the last chunk, keep the latest one seen
+            usage_metadata = getattr(chunk, "usage_metadata", None) or usage_metadata
+            if chunk.text:
+                yield chunk.text
+        self._record_usage("stream", cached_content, first_chunk_seconds or time.perf_counter() - start, usage_metadata)
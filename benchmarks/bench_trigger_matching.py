@@ -0,0 +1,328 @@
+"""
+Trigger-matching throughput benchmark for KeystrokeListener.
+
+Drives KeystrokeListener._track_keystrokes with synthetic keyboard events and runs the
+matcher worker's batch handler synchronously, so the numbers cover the hook callback plus
+the automaton/ring-buffer work for every key. Runs headless: the `keyboard`, `win32gui`
+and `pyperclip` modules are replaced with stand-ins before the listener is imported, and
+PySide6 is only stubbed if it is not installed.
+
+Usage:
+    python -m benchmarks.bench_trigger_matching --events 1000000 --snippets 10,1000,100000 --output bench.json
+"""
+import argparse
+import array
+import json
+import os
+import platform
+import queue
+import random
+import string
+import sys
+import time
+import tracemalloc
+import types
+from datetime import datetime
+
+KEY_DOWN = "down"
+KEY_UP = "up"
+
+
+def _install_stub_modules():
+    """Registers minimal stand-ins for the OS-level modules the client imports."""
+    keyboard = types.ModuleType("keyboard")
+    keyboard.KEY_DOWN = KEY_DOWN
+    keyboard.KEY_UP = KEY_UP
+    keyboard.hook = lambda callback: None
+    keyboard.add_hotkey = lambda *args, **kwargs: None
+    keyboard.unhook_all = lambda: None
+    keyboard.send = lambda *args, **kwargs: None
+    keyboard.write = lambda *args, **kwargs: None
+    sys.modules["keyboard"] = keyboard
+
+    win32gui = types.ModuleType("win32gui")
+    win32gui.GetForegroundWindow = lambda: 0
+    sys.modules["win32gui"] = win32gui
+
+    pyperclip = types.ModuleType("pyperclip")
+    pyperclip.PyperclipException = Exception
+    pyperclip.paste = lambda: ""
+    pyperclip.copy = lambda text: None
+    sys.modules["pyperclip"] = pyperclip
+
+    try:
+        import PySide6.QtCore  # noqa: F401
+    except ImportError:
+        _install_qt_stub()
+
+
+def _install_qt_stub():
+    """Just enough of PySide6.QtCore for KeystrokeListener: QObject and a direct-call Signal."""
+    class _BoundSignal:
+        def __init__(self):
+            self._slots = []
+
+        def connect(self, slot):
+            self._slots.append(slot)
+
+        def emit(self, *args):
+            for slot in self._slots:
+                slot(*args)
+
+    class Signal:
+        def __init__(self, *types_):
+            self._name = None
+
+        def __set_name__(self, owner, name):
+            self._name = name
+
+        def __get__(self, instance, owner=None):
+            if instance is None:
+                return self
+            return instance.__dict__.setdefault("_signal_" + self._name, _BoundSignal())
+
+    class QObject:
+        def __init__(self, *args, **kwargs):
+            pass
+
+    qtcore = types.ModuleType("PySide6.QtCore")
+    qtcore.QObject = QObject
+    qtcore.Signal = Signal
+    qtcore.Slot = lambda *args, **kwargs: (lambda func: func)
+    pyside = types.ModuleType("PySide6")
+    pyside.QtCore = qtcore
+    sys.modules["PySide6"] = pyside
+    sys.modules["PySide6.QtCore"] = qtcore
+
+
+class FakeKeyEvent:
+    """Mimics the attributes of keyboard.KeyboardEvent that the listener reads."""
+    __slots__ = ("name", "event_type")
+
+    def __init__(self, name, event_type):
+        self.name = name
+        self.event_type = event_type
+
+
+class FakeSnippetStorage:
+    def __init__(self, snippets):
+        self.snippets = snippets
+
+    def add_listener(self, callback):
+        pass
+
+
+def build_snippet_library(size: int, rng: random.Random) -> dict:
+    alphabet = string.ascii_letters + string.digits + "_"
+    snippets = {}
+    while len(snippets) < size:
+        name = "".join(rng.choice(alphabet) for _ in range(rng.randint(3, 12)))
+        snippets["::" + name] = f"Expanded text for {name}"
+    return snippets
+
+
+PROSE = ("the quick brown fox jumps over a lazy dog while we refactor this module and "
+         "write an email about the quarterly report before lunch").split()
+CODE = ["std::cout", "<<", "value;", "Foo::bar()", "auto", "it", "=", "map.find(key);",
+        "ns::detail::impl", "return", "x::y;", "template<typename", "T>", "a->b::c"]
+
+
+def generate_trace(event_count: int, snippets: dict, rng: random.Random):
+    """
+    Yields FakeKeyEvents (down and up for every key) until `event_count` events were produced.
+    The text mixes prose, C++-style code full of '::', snippet triggers, typos fixed with
+    backspace, ctrl shortcuts and the occasional ::Prompt(...) command.
+    """
+    events = {}
+
+    def key(name):
+        pair = events.get(name)
+        if pair is None:
+            pair = events[name] = (FakeKeyEvent(name, KEY_DOWN), FakeKeyEvent(name, KEY_UP))
+        return pair
+
+    commands = list(snippets)
+    produced = 0
+    while produced < event_count:
+        roll = rng.random()
+        if roll < 0.05 and commands:
+            word = rng.choice(commands)
+        elif roll < 0.06:
+            word = "::Prompt(" + " ".join(rng.choice(PROSE) for _ in range(rng.randint(2, 8))) + ")"
+        elif roll < 0.35:
+            word = rng.choice(CODE)
+        else:
+            word = rng.choice(PROSE)
+
+        for char in word:
+            down, up = key("space" if char == " " else char)
+            yield down
+            yield up
+            produced += 2
+        if rng.random() < 0.05:
+            for _ in range(rng.randint(1, 4)):
+                down, up = key("backspace")
+                yield down
+                yield up
+                produced += 2
+        if rng.random() < 0.01:
+            ctrl_down, ctrl_up = key("ctrl")
+            c_down, c_up = key(rng.choice("acxz"))
+            yield ctrl_down
+            yield c_down
+            yield c_up
+            yield ctrl_up
+            produced += 4
+        down, up = key("space")
+        yield down
+        yield up
+        produced += 2
+
+
+def _percentile(sorted_values, fraction: float) -> int:
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _new_listener(snippets: dict):
+    from src.core.keystroke_listener import KeystrokeListener
+
+    listener = KeystrokeListener(FakeSnippetStorage(snippets), queue_size=1 << 20)
+    # The benchmark plays the worker itself so every event can be timed on one thread
+    listener.stop_listener()
+    return listener
+
+
+def _drain(listener):
+    events = listener._events
+    batch = []
+    try:
+        while True:
+            batch.append(events.get_nowait())
+    except queue.Empty:
+        pass
+    if batch:
+        listener._process_batch(batch)
+
+
+def run_case(snippet_count: int, event_count: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    snippets = build_snippet_library(snippet_count, rng)
+
+    build_start = time.perf_counter()
+    listener = _new_listener(snippets)
+    build_seconds = time.perf_counter() - build_start
+
+    emitted = {"commands": 0, "llm": 0}
+    listener.command_typed.connect(lambda command: emitted.__setitem__("commands", emitted["commands"] + 1))
+    listener.llm_command_detected.connect(lambda command, query: emitted.__setitem__("llm", emitted["llm"] + 1))
+
+    # Pass 1: throughput, with the worker draining in batches like it does in the app
+    track = listener._track_keystrokes
+    queue_ = listener._events
+    start = time.perf_counter()
+    for count, event in enumerate(generate_trace(event_count, snippets, random.Random(seed + 1)), 1):
+        track(event)
+        if queue_.qsize() >= 256:
+            _drain(listener)
+    _drain(listener)
+    throughput_seconds = time.perf_counter() - start
+
+    # Pass 2: per-event latency of the hook callback and of hook + matching
+    listener = _new_listener(snippets)
+    track = listener._track_keystrokes
+    process = listener._process_batch
+    get_nowait = listener._events.get_nowait
+    clock = time.perf_counter_ns
+    hook_latency = array.array("q")
+    total_latency = array.array("q")
+    for event in generate_trace(event_count, snippets, random.Random(seed + 1)):
+        t0 = clock()
+        track(event)
+        t1 = clock()
+        try:
+            process([get_nowait()])
+        except queue.Empty:
+            pass
+        t2 = clock()
+        hook_latency.append(t1 - t0)
+        total_latency.append(t2 - t0)
+
+    # Pass 3: memory held and allocated while processing
+    allocation_events = min(event_count, 200000)
+    listener = _new_listener(snippets)
+    trace = list(generate_trace(allocation_events, snippets, random.Random(seed + 1)))
+    tracemalloc.start()
+    blocks_before = sys.getallocatedblocks()
+    for event in trace:
+        listener._track_keystrokes(event)
+        try:
+            listener._process_batch([listener._events.get_nowait()])
+        except queue.Empty:
+            pass
+    blocks_after = sys.getallocatedblocks()
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    hook_sorted = sorted(hook_latency)
+    total_sorted = sorted(total_latency)
+    return {
+        "snippets": snippet_count,
+        "events": count,
+        "automaton_build_seconds": round(build_seconds, 4),
+        "events_per_sec": round(count / throughput_seconds, 1),
+        "hook_latency_ns": {
+            "p50": _percentile(hook_sorted, 0.50),
+            "p99": _percentile(hook_sorted, 0.99),
+            "max": hook_sorted[-1] if hook_sorted else 0,
+        },
+        "event_latency_ns": {
+            "p50": _percentile(total_sorted, 0.50),
+            "p99": _percentile(total_sorted, 0.99),
+            "max": total_sorted[-1] if total_sorted else 0,
+        },
+        "net_allocated_blocks_per_event": round((blocks_after - blocks_before) / max(1, len(trace)), 4),
+        "traced_peak_bytes": traced_peak,
+        "commands_emitted": emitted["commands"],
+        "llm_commands_emitted": emitted["llm"],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark KeystrokeListener trigger matching.")
+    parser.add_argument("--events", type=int, default=1000000, help="Keyboard events per case (default: 1,000,000)")
+    parser.add_argument("--snippets", default="10,1000,100000", help="Comma-separated snippet library sizes")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--label", default="", help="Free-form label stored with the results, e.g. a version")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    _install_stub_modules()
+    sizes = [int(size) for size in args.snippets.split(",") if size.strip()]
+
+    report = {
+        "benchmark": "trigger_matching",
+        "label": args.label,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": [],
+    }
+    for size in sizes:
+        print(f"Running {args.events} events against {size} snippets...", file=sys.stderr)
+        report["results"].append(run_case(size, args.events, args.seed))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+        print(f"Results written to {os.path.abspath(args.output)}", file=sys.stderr)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
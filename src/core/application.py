@@ -1,18 +1,24 @@
-from PySide6.QtCore import QObject, Slot
+from PySide6.QtCore import QObject, Slot, Signal
 from PySide6.QtWidgets import QApplication, QSystemTrayIcon, QStyle, QMenu
 from PySide6.QtGui import QIcon
 from ..storage.snippet_storage import SnippetStorage
 from ..storage.settings_storage import SettingsStorage
 from ..storage.history_storage import HistoryStorage
+from ..storage.prompt_cache import PromptCache
+from ..storage.history_index import HistoryIndex
+from ..storage.persistence_service import default_service
 from ..ui.snippet_manager_ui import SnippetUI
 from ..ui.frameless_window import FramelessWindow
 from .keystroke_listener import KeystrokeListener
 from .focus_tracker import FocusTracker 
 from .snippet_handler import SnippetHandler 
+from .expansion_worker import ExpansionWorker
 from .llm_prompt_handler import LLMHandler
 from ..keyboard_utils import clipboard_copy, simulate_keystrokes
 from .resource_handler import get_path_for_resource
 import signal
+import itertools
+import keyboard
 import logging # Import logging
 import winsound
 import sys
@@ -24,18 +30,44 @@ logger = logging.getLogger(__name__) # Get a logger for this module
 #QObject is the base class for all Qt objects
 #inherit event loop and signal slot mechanism
 class Application(QObject):
+    cancel_hotkey_pressed = Signal() # emitted from the keyboard thread, handled on the main thread
      
     def __init__(self):
         
         super().__init__()#initialize QObject from super class constructor
         logger.info("Initializing Application...")
-        self.storage = SnippetStorage()
-        self.settings = SettingsStorage()
-        self.history = HistoryStorage()
+        # one background writer for all storages, so saving never blocks the GUI thread
+        self.persistence = default_service()
+        self.storage = SnippetStorage(persistence=self.persistence)
+        self.settings = SettingsStorage(persistence=self.persistence)
+        self.history = HistoryStorage(
+            tail_size=int(self.settings.get("history_tail_size", 500)),
+            segment_max_bytes=int(self.settings.get("history_segment_max_kb", 1024)) * 1024,
+            compress_segments=bool(self.settings.get("history_compress_segments", True)),
+            retention_days=float(self.settings.get("history_retention_days", 0)),
+            persistence=self.persistence,
+        )
+        # full-text search for the History page, caught up with the history in the background
+        self.history_index = None
+        if self.settings.get("history_search_enabled", True):
+            try:
+                self.history_index = HistoryIndex(self.history, persistence=self.persistence)
+                self.history_index.start()
+            except Exception as e:
+                logger.error(f"History search unavailable: {e}", exc_info=True)
+        self.prompt_cache = None
+        if self.settings.get("prompt_cache_enabled", True):
+            self.prompt_cache = PromptCache(
+                self.history,
+                max_entries=int(self.settings.get("prompt_cache_max_entries", 200)),
+                max_age=float(self.settings.get("prompt_cache_max_age_hours", 168)) * 3600,
+                refresh_marker=self.settings.get("prompt_cache_refresh_marker", "!"),
+            )
         self.main_window = None # To hold the reference to the UI window
         # self.cached_control = None #implement cache control, which stores reference to the active UI control to reduce UIA overhead - COMMENTED OUT
         #App compatibility, works with most but for some can not detect the input content
-        self.is_request_in_flight = False
+        self.pending_prompts = {} # request id -> placeholder text typed for that request
+        self._request_ids = itertools.count(1)
 
         #resource handler for icon
         
@@ -43,27 +75,48 @@ class Application(QObject):
         # Load settings into application properties, ensuring correct types
         self.blacklisted_apps = self.settings.get("blacklisted_apps", [])
         self.clear_clipboard = bool(self.settings.get("clear_clipboard_on_paste", False))
+        self.max_concurrent_prompts = max(1, int(self.settings.get("max_concurrent_prompts", 3)))
 
         self.generating_text = "Generating Prompt..."
         """
         TODO - sort out the blacklist if it's even needed
         """
-        self.keystroke_listener = KeystrokeListener(self.storage)
+        self.keystroke_listener = KeystrokeListener(
+            self.storage,
+            self.settings.get("trigger_prefixes", ["::"]),
+            int(self.settings.get("keystroke_queue_size", 1024)),
+        )
         self.focus_tracker = FocusTracker(self.keystroke_listener, self.blacklisted_apps)
-        self.snippet_handler = SnippetHandler(self.storage)
+        self.snippet_handler = SnippetHandler(self.storage, self.settings)
+        self.expansion_worker = ExpansionWorker(self.snippet_handler)
         self._init_tray_icon()
-        self.llm_handler = LLMHandler()
+        self.llm_handler = LLMHandler(
+            connect_timeout=float(self.settings.get("llm_connect_timeout", 5.0)),
+            read_timeout=float(self.settings.get("llm_read_timeout", 30.0)),
+            total_timeout=float(self.settings.get("llm_total_timeout", 45.0)),
+            use_http2=bool(self.settings.get("llm_http2", True)),
+            streaming=bool(self.settings.get("llm_streaming", True)),
+            prompt_cache=self.prompt_cache,
+        )
         # self._init_uia_polling() # COMMENTED OUT
         self.focus_tracker.start()
         logger.info("Application components initialized.")
 
         #Connect signals
-        self.keystroke_listener.command_typed.connect(self.snippet_handler.replace_snippet) # Connect the command_typed signal to the snippet handler
+        self.keystroke_listener.command_typed.connect(self.expansion_worker.submit) # Queue typed commands for expansion off the GUI thread
+        self.expansion_worker.expansion_failed.connect(self.on_expansion_failed)
 
         #llm related signal connections
         self.keystroke_listener.llm_command_detected.connect(self.on_llm_command) #Connect the llm command detection to the visual feedback and backend calling
         self.llm_handler.prompt_received.connect(self.handle_llm_augmented_prompt) 
         self.llm_handler.prompt_failed.connect(self.handle_llm_failure)
+        self.llm_handler.prompt_partial.connect(self.on_llm_progress)
+        self.keystroke_listener.placeholder_deleted.connect(self.on_placeholder_deleted)
+        self.cancel_hotkey_pressed.connect(self.cancel_latest_prompt)
+        self._register_cancel_hotkey()
+
+        #rebuild the trigger automaton whenever the snippet library changes
+        self.storage.add_listener(self._refresh_commands)
 
         #snippet replacement and clear connections
         self.snippet_handler.snippet_pasted.connect(self.replace_and_clear_buffer)
@@ -72,9 +125,24 @@ class Application(QObject):
         signal.signal(signal.SIGTERM, self._handle_signal)
         logger.info("Signal handlers registered.")
 
+    def _register_cancel_hotkey(self):
+        hotkey = self.settings.get("cancel_prompt_hotkey", "ctrl+alt+backspace")
+        if not hotkey:
+            return
+        try:
+            keyboard.add_hotkey(hotkey, self.cancel_hotkey_pressed.emit)
+            logger.info(f"Hotkey '{hotkey}' cancels the latest pending prompt")
+        except Exception as e:
+            logger.error(f"Could not register cancel hotkey '{hotkey}': {e}")
+
     @Slot()
     def replace_and_clear_buffer(self):
         self.keystroke_listener.clear_buffer()
+    @Slot(str, str)
+    def on_expansion_failed(self, cmd: str, error_message: str):
+        logger.warning(f"Expansion of {cmd} failed: {error_message}")
+        self.keystroke_listener.clear_buffer()
+
     @Slot()
     def show_snippet_manager(self):
         """Create and show the snippet manager UI."""
@@ -82,7 +150,7 @@ class Application(QObject):
             logger.debug("Creating or showing main window.")
             
             # 1. Create the content widget first, passing all storage objects
-            dashboard_content = SnippetUI(self.storage, self.settings, self.history)
+            dashboard_content = SnippetUI(self.storage, self.settings, self.history, self.history_index)
             
             # 2. Wrap it in our custom frameless window
             self.main_window = FramelessWindow(dashboard_content)
@@ -106,38 +174,82 @@ class Application(QObject):
     
     @Slot(str, str)
     def on_llm_command(self, original_command: str, user_query: str):
-        if self.is_request_in_flight:
-            logger.warning("ignore request because llm command is already in flight")
+        refresh = False
+        if self.prompt_cache is not None:
+            user_query, refresh = self.prompt_cache.split_refresh(user_query)
+            if refresh:
+                self.prompt_cache.invalidate(user_query)
+                logger.info("Refresh marker found, skipping the prompt cache")
+            else:
+                request_id = next(self._request_ids)
+                self.pending_prompts[request_id] = "" # nothing typed, the command itself gets erased
+                if self.llm_handler.get_cached_prompt(request_id, user_query, original_command):
+                    return
+                del self.pending_prompts[request_id]
+
+        if len(self.pending_prompts) >= self.max_concurrent_prompts:
+            logger.warning(f"ignore request because {len(self.pending_prompts)} llm commands are already in flight")
             winsound.PlaySound("SystemHand", winsound.SND_ALIAS | winsound.SND_ASYNC)
             return # Stop processing immediately
         
-        self.is_request_in_flight = True
-        logger.info(f"Received llm command: {original_command}")
-        #Type the generating text
+        request_id = next(self._request_ids)
+        placeholder = self.generating_text.replace("...", f" #{request_id}...")
+        self.pending_prompts[request_id] = placeholder
+        logger.info(f"Received llm command #{request_id}: {original_command}")
+        #Type the generating text, watched so that deleting it cancels the request
         try:
-            
-            simulate_keystrokes(self.generating_text, len(original_command)+1)
+            self.keystroke_listener.watch_placeholder(request_id, placeholder)
+            simulate_keystrokes(placeholder, len(original_command)+1)
         except Exception as e:
             logger.error(f"Error showing the 'generating...' visual feedback: {e}", exc_info = True)
         
         #call the backend, passing the original query for history
-        self.llm_handler.get_prompt_from_backend(user_query, original_command)
-        
+        self.llm_handler.get_prompt_from_backend(request_id, user_query, original_command)
 
-        
+    @Slot(int, str)
+    def on_llm_progress(self, request_id: int, partial_prompt: str):
+        """Shows streaming progress in the tray tooltip while the prompt is generated."""
+        if request_id in self.pending_prompts:
+            self.tray_icon.setToolTip(f"PromptAssist - prompt #{request_id}: {len(partial_prompt)} characters received")
 
-    @Slot(str, str)
-    def handle_llm_augmented_prompt(self, augmented_prompt: str, original_query: str):
+    def _remove_placeholder(self, request_id: int, placeholder: str, replacement: str = "") -> bool:
+        """
+        Replaces a request's placeholder with `replacement` if it is still right before the cursor.
+        Returns False (and leaves the text alone) if the user has typed or moved on since.
+        """
+        at_cursor = self.keystroke_listener.placeholder_at_cursor(request_id)
+        self.keystroke_listener.unwatch_placeholder(request_id)
+        if not at_cursor:
+            logger.info(f"Placeholder for request #{request_id} is no longer at the cursor, leaving it in place.")
+            return False
+        simulate_keystrokes(replacement, backspaces=len(placeholder))
+        return True
+
+    def _finish_request(self, request_id: int):
+        logger.info(f"LLM request #{request_id} finished, {len(self.pending_prompts)} still in flight.")
+        if not self.pending_prompts:
+            self.tray_icon.setToolTip("PromptAssist")
+            self.keystroke_listener.clear_buffer()
 
-        try:
-            backspaces_for_call = len(self.generating_text)
+    @Slot(int, str, str)
+    def handle_llm_augmented_prompt(self, request_id: int, augmented_prompt: str, original_query: str):
+        placeholder = self.pending_prompts.pop(request_id, None)
+        if placeholder is None:
+            logger.info(f"Ignoring result for cancelled request #{request_id}")
+            return
 
-            if augmented_prompt:
+        try:
+            if augmented_prompt and not placeholder:
+                # Served from the prompt cache: erase the command and its trigger space, history already has it
+                simulate_keystrokes(backspaces=len(original_query)+1)
+                clipboard_copy(augmented_prompt, clear_after=self.clear_clipboard)
+            elif augmented_prompt:
                 # Add to history
                 self.history.add_entry(query=original_query, result=augmented_prompt)
 
-                logger.info("augmented prompt received. Replacing text")
-                simulate_keystrokes(backspaces=backspaces_for_call)
+                logger.info(f"augmented prompt #{request_id} received. Replacing text")
+                if not self._remove_placeholder(request_id, placeholder):
+                    self.tray_icon.showMessage("PromptAssist", f"Prompt #{request_id} is ready and copied to the clipboard.")
                 clipboard_copy(augmented_prompt, clear_after=self.clear_clipboard)
                 try:
                     winsound.PlaySound("SystemAsterisk", winsound.SND_ALIAS | winsound.SND_ASYNC)
@@ -148,24 +260,49 @@ class Application(QObject):
                     logger.debug("Played notif sound (system bell \a).")
             # This 'else' case is now handled by handle_llm_failure
         finally:
-            self.is_request_in_flight = False
-            logger.info("LLM request flight lock released.")
-            self.keystroke_listener.clear_buffer()
+            self._finish_request(request_id)
 
-    @Slot(str)
-    def handle_llm_failure(self, error_message: str):
+    @Slot(int, str)
+    def handle_llm_failure(self, request_id: int, error_message: str):
         """Handles the visual feedback when a prompt generation fails."""
+        placeholder = self.pending_prompts.pop(request_id, None)
+        if placeholder is None:
+            return
         try:
-            logger.warning(f"Failed to get augmented prompt, displaying error: {error_message}")
+            logger.warning(f"Failed to get augmented prompt #{request_id}, displaying error: {error_message}")
             error_display_text = f"[Prompt Failed: {error_message}]"
-            backspaces_for_call = len(self.generating_text)
-            simulate_keystrokes(error_display_text, backspaces_for_call)
+            if not self._remove_placeholder(request_id, placeholder, error_display_text):
+                self.tray_icon.showMessage("PromptAssist", f"Prompt #{request_id} failed: {error_message}", QSystemTrayIcon.MessageIcon.Warning)
         except Exception as e:
             logger.error(f"Error displaying failure message: {e}", exc_info=True)
         finally:
-            self.is_request_in_flight = False
-            logger.info("LLM request flight lock released after failure.")
-            self.keystroke_listener.clear_buffer()
+            self._finish_request(request_id)
+
+    def cancel_prompt(self, request_id: int, remove_placeholder: bool = True):
+        """Cancels one pending LLM request and, if asked, removes its placeholder text."""
+        placeholder = self.pending_prompts.pop(request_id, None)
+        if placeholder is None:
+            return
+        self.llm_handler.cancel(request_id)
+        logger.info(f"LLM request #{request_id} cancelled.")
+        if remove_placeholder:
+            self._remove_placeholder(request_id, placeholder)
+        else:
+            self.keystroke_listener.unwatch_placeholder(request_id)
+        self._finish_request(request_id)
+
+    @Slot(int)
+    def on_placeholder_deleted(self, request_id: int):
+        # The user is already deleting the text, so leave the rest of it to them
+        self.cancel_prompt(request_id, remove_placeholder=False)
+
+    @Slot()
+    def cancel_latest_prompt(self):
+        """Cancel hotkey: cancels the most recently started request that is still pending."""
+        if not self.pending_prompts:
+            logger.debug("Cancel hotkey pressed with no pending LLM requests.")
+            return
+        self.cancel_prompt(max(self.pending_prompts))
 
     @Slot(QSystemTrayIcon.ActivationReason)
     def on_tray_icon_activated(self, reason):
@@ -234,6 +371,15 @@ class Application(QObject):
     def quit_application(self):
         """Quits the application."""
         logger.info("Quit action triggered. Shutting down.")
+        self.focus_tracker.stop()
+        self.keystroke_listener.stop_listener()
+        self.expansion_worker.stop()
+        self.llm_handler.shutdown()
+        # write out debounced settings/history/snippet changes before the process goes away
+        self.persistence.flush()
+        self.storage.close()
+        if self.history_index is not None:
+            self.history_index.close()
         QApplication.quit()
 
     def _handle_signal(self, signum, frame):
@@ -257,20 +403,8 @@ class Application(QObject):
 
     def _refresh_commands(self):
         """
-        Refreshes commands. Currently, this is a placeholder as KeystrokeListener
-        reads directly from SnippetStorage. If caching or more complex command
-        management is introduced in KeystrokeListener or SnippetHandler,
-        this method would trigger updates in those components.
+        Refreshes commands. KeystrokeListener matches against an automaton built
+        from SnippetStorage, so it has to be rebuilt whenever a snippet is saved or deleted.
         """
-        logger.info("Application: Commands refresh requested (currently a placeholder).")
-        # Potentially, if SnippetStorage had signals, other components could listen.
-        # self._register_commands() # Example: if _register_commands had an active role.
-        pass
-
-
-    """ 
-    *Updated Keystroke Tracking for our Buffer and UIA System and to Standardize the :: Prefix for now
-    TODO - Allow for custom prefixes to classify different types of snippets, or provide a list of prefixes to choose from to avoid
-    TODO - Stuff like C++ code std::cout to mess up with the snippets.
-     """
-
+        logger.info("Application: Commands refresh requested.")
+        self.keystroke_listener.refresh_triggers()
@@ -0,0 +1,71 @@
+import logging
+import queue
+import threading
+from PySide6.QtCore import QObject, Signal, Slot
+from .snippet_handler import SnippetHandler
+
+logger = logging.getLogger(__name__)
+
+
+class ExpansionWorker(QObject):
+    """
+    Runs snippet expansions on a background thread, one at a time.
+
+    SnippetHandler waits on the clipboard and simulates keystrokes, which would freeze the
+    tray menu and dashboard if it ran on the Qt main thread. Commands are queued here and
+    expanded in order, so back-to-back triggers line up instead of blocking the event loop.
+    Failures come back through a signal, which Qt delivers to a main-thread slot as a queued call
+    (a successful expansion is already reported by SnippetHandler.snippet_pasted).
+    """
+    expansion_failed = Signal(str, str) # command, error message
+
+    def __init__(self, snippet_handler: SnippetHandler, max_pending: int = 32):
+        super().__init__()
+        self.snippet_handler = snippet_handler
+        self._jobs = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="SnippetExpansion", daemon=True)
+        self._thread.start()
+        logger.info("Snippet expansion worker started")
+
+    @Slot(str)
+    def submit(self, cmd: str):
+        """Queues a command for expansion. Safe to call from any thread."""
+        try:
+            self._jobs.put_nowait(cmd)
+        except queue.Full:
+            logger.warning(f"Expansion queue is full, dropping command {cmd}")
+            self.expansion_failed.emit(cmd, "Too many expansions pending")
+
+    def pending(self) -> int:
+        return self._jobs.qsize()
+
+    def _run(self):
+        while True:
+            cmd = self._jobs.get()
+            if cmd is None:
+                break
+            try:
+                if not self.snippet_handler.replace_snippet(cmd):
+                    self.expansion_failed.emit(cmd, "Snippet could not be expanded")
+            except Exception as e:
+                logger.error(f"Expansion of {cmd} failed: {e}", exc_info=True)
+                self.expansion_failed.emit(cmd, str(e))
+        logger.info("Snippet expansion worker stopped")
+
+    def stop(self, timeout: float = 2.0):
+        """
+        Drops expansions still queued (typing them out while the app quits would surprise the user),
+        lets the one in progress finish and stops the worker thread, waiting at most `timeout`.
+        """
+        try:
+            while True:
+                self._jobs.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            # put() can't block for good if a submit() from another thread refilled the queue meanwhile
+            self._jobs.put(None, timeout=timeout)
+        except queue.Full:
+            logger.warning("Expansion queue stayed full, leaving the daemon worker behind")
+            return
+        self._thread.join(timeout=timeout)
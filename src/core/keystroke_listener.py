@@ -1,29 +1,88 @@
 import keyboard
 import time
+import queue
+import threading
 from PySide6.QtCore import QObject, Signal
 import logging 
 from ..storage.snippet_storage import SnippetStorage
+from .trigger_matcher import TriggerMatcher, SNIPPET_TRIGGER, LLM_TRIGGER, DEFAULT_PREFIXES
+from .ring_buffer import KeystrokeRingBuffer
 import pyperclip
 
 logger = logging.getLogger(__name__) # Initialize logger
 
+# Longest query the backend accepts (PromptRequest.user_query max_length)
+MAX_LLM_QUERY_LENGTH = 10000
+
+# Event records passed from the keyboard hook to the matcher worker as (kind, payload) tuples
+EVENT_KEY = 0        # payload: key name
+EVENT_CTRL_DOWN = 1
+EVENT_CTRL_UP = 2
+EVENT_PASTE = 3
+EVENT_RESET = 4
+EVENT_REFRESH = 5    # payload: a freshly built TriggerMatcher
+EVENT_STOP = 6
+EVENT_WATCH = 7      # payload: (request id, placeholder text)
+EVENT_UNWATCH = 8    # payload: request id
+
+CTRL_KEYS = frozenset(("ctrl", "left_ctrl", "right_ctrl"))
+# Keys the matcher cares about besides single characters; everything else is dropped in the hook
+TRACKED_KEYS = frozenset(("space", "backspace"))
+MAX_BATCH_SIZE = 256
+
 class KeystrokeListener(QObject):
     command_typed = Signal(str)  # Signal to emit when a command is typed
     llm_command_detected = Signal(str, str)
+    placeholder_deleted = Signal(int) # request id whose placeholder the user started deleting
+
+    # Trigger rebuilds wait for this much quiet after the last snippet change, but no longer than
+    # REFRESH_MAX_DELAY after the first one, so a burst of edits (or an import) is one build
+    REFRESH_DEBOUNCE = 0.2
+    REFRESH_MAX_DELAY = 1.0
 
-    def __init__(self, snippet_storage: SnippetStorage):
+    def __init__(self, snippet_storage: SnippetStorage, trigger_prefixes=DEFAULT_PREFIXES, queue_size: int = 1024):
         super().__init__()
         self.snippet_storage = snippet_storage
-        self.buffer = ""
+        self.trigger_prefixes = tuple(trigger_prefixes)
+
+        # Everything below is owned by the matcher worker thread once it starts
+        self._llm_spans = [] # (start, end) absolute ring positions of each typed LLM trigger
         self.ctrl_pressed = False
         self.last_input_time = time.time()
-        
+        self.matcher = self._build_matcher()
+        self.ring = KeystrokeRingBuffer(self._ring_capacity())
+        self._placeholders = {} # request id -> placeholder text typed for a pending LLM request
+        self._placeholder_ends = {} # request id -> absolute ring position just past its typed placeholder
+        self._placeholder_last_chars = frozenset()
+        self._keep_length = self.matcher.max_trigger_length
+
+        # What the GUI thread may read of the worker's placeholder state, published after each batch
+        self._placeholder_lock = threading.Lock()
+        self._placeholders_at_cursor = frozenset() # request ids whose placeholder ends right at the cursor
+
+        # The hook thread only ever touches the queue and the drop counter
+        self._events = queue.Queue(maxsize=queue_size)
+        self.dropped_events = 0
+        self.processed_events = 0
+        self.coalesced_events = 0
+        self.max_queue_depth = 0
+        self._drops_seen = 0
+        self._worker = threading.Thread(target=self._matcher_loop, name="KeystrokeMatcher", daemon=True)
+        self._worker.start()
+
+        # Automaton rebuilds run here, so neither the GUI nor the matcher waits on them
+        self._refresh_condition = threading.Condition()
+        self._refresh_commands = None # latest snapshot of the snippet commands waiting to be built
+        self._refresh_due = 0.0
+        self._refresh_deadline = 0.0
+        self._builder_stopped = False
+        self._builder = threading.Thread(target=self._builder_loop, name="TriggerBuilder", daemon=True)
+        self._builder.start()
 
         self._init_keyboard_listener()
 
     def _init_keyboard_listener(self):
             """Monitoring keystrokes in live time for commands"""
-            self.buffer = ""
             try:
                 keyboard.hook(self._track_keystrokes)
                 logger.info("Keyboard listener initialized.") 
@@ -50,103 +109,348 @@ class KeystrokeListener(QObject):
 
 
     def _track_keystrokes(self, event):
-        """Using buffer of typed characters and check for commands"""
-        logger.debug(f"--- _track_keystrokes CALLED: event_type={event.event_type}, name={event.name} ---") 
+        """
+        Keyboard hook callback. Runs on the OS hook thread, so it only turns the event into
+        a compact record for the matcher worker and returns.
+        """
+        name = event.name
+        if name in CTRL_KEYS:
+            self._enqueue(EVENT_CTRL_DOWN if event.event_type == keyboard.KEY_DOWN else EVENT_CTRL_UP)
+        elif event.event_type == keyboard.KEY_UP: #to prevent counting the key press and key release as two separate events
+            return
+        elif name is not None and (len(name) == 1 or name in TRACKED_KEYS):
+            self._enqueue(EVENT_KEY, name)
+
+    def _enqueue(self, kind: int, payload=None):
+        try:
+            self._events.put_nowait((kind, payload))
+        except queue.Full:
+            # Never block the hook; the worker resets the buffer once it notices the gap
+            self.dropped_events += 1
+
+    def queue_depth(self) -> int:
+        """Number of events waiting for the matcher worker."""
+        return self._events.qsize()
+
+    def get_stats(self) -> dict:
+        """Counters that show whether the matcher keeps up with typing."""
+        return {
+            "queue_depth": self.queue_depth(),
+            "queue_capacity": self._events.maxsize,
+            "max_queue_depth": self.max_queue_depth,
+            "processed_events": self.processed_events,
+            "coalesced_events": self.coalesced_events,
+            "dropped_events": self.dropped_events,
+        }
 
-        if event.name == "ctrl" or event.name == "left_ctrl" or event.name == "right_ctrl":
-            if event.event_type == "down":
+    def _matcher_loop(self):
+        """Matcher worker: owns the ring buffer and handles events in arrival order."""
+        logger.info("Keystroke matcher worker started")
+        get = self._events.get
+        get_nowait = self._events.get_nowait
+        while True:
+            batch = [get()]
+            try:
+                while len(batch) < MAX_BATCH_SIZE:
+                    batch.append(get_nowait())
+            except queue.Empty:
+                pass
+
+            if len(batch) > self.max_queue_depth:
+                self.max_queue_depth = len(batch)
+            try:
+                if not self._process_batch(batch):
+                    break
+            except Exception as e:
+                logger.error(f"Keystroke matcher failed on an event batch: {e}", exc_info=True)
+                self._reset_buffer()
+            self._publish_placeholders()
+        logger.info("Keystroke matcher worker stopped")
+
+    def _process_batch(self, batch) -> bool:
+        """
+        Handles a batch of event records. Runs of identical records (auto-repeat storms)
+        are coalesced: repeated backspaces become one multi-character pop, repeated ctrl
+        and reset records collapse to one. Returns False when the worker should stop.
+        """
+        if self.dropped_events != self._drops_seen:
+            logger.warning(f"Keystroke queue overflowed, {self.dropped_events - self._drops_seen} event(s) dropped. Buffer reset.")
+            self._drops_seen = self.dropped_events
+            self._reset_buffer()
+
+        index = 0
+        size = len(batch)
+        while index < size:
+            record = batch[index]
+            run = 1
+            while index + run < size and batch[index + run] == record and record[0] < EVENT_REFRESH:
+                run += 1
+            index += run
+            self.processed_events += run
+            self.coalesced_events += run - 1
+
+            kind, payload = record
+            if kind == EVENT_KEY:
+                self._handle_key(payload, run)
+            elif kind == EVENT_CTRL_DOWN:
                 self.ctrl_pressed = True
-            elif event.event_type == "up":
+            elif kind == EVENT_CTRL_UP:
                 self.ctrl_pressed = False
-            return
-            
-        if event.event_type == keyboard.KEY_UP: #to prevent counting the key press and key release as two separate events
-            return
+            elif kind == EVENT_RESET:
+                self._reset_buffer()
+            elif kind == EVENT_PASTE:
+                for _ in range(run):
+                    self._handle_paste()
+            elif kind == EVENT_REFRESH:
+                self._swap_matcher(payload)
+            elif kind == EVENT_WATCH:
+                self._placeholders[payload[0]] = payload[1]
+                self._update_placeholder_cache()
+            elif kind == EVENT_UNWATCH:
+                self._placeholders.pop(payload, None)
+                self._placeholder_ends.pop(payload, None)
+                self._update_placeholder_cache()
+            elif kind == EVENT_STOP:
+                return False
+        return True
 
-        logger.debug(f"Keystroke detected: {event.name}")
+    def _handle_key(self, char: str, repeat: int = 1):
+        """Updates the buffer for `repeat` presses of the same key and checks for commands"""
+        # Checked once per event so nothing below formats a string unless DEBUG is on
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("Keystroke detected: %s x%d", char, repeat)
 
         #Check last input time:
         self.last_input_time = time.time()
-        llm_prefix = "::Prompt("
 
         #Handle ctrl combo presses:
-        if self.ctrl_pressed and event.name in ('a', 'c', 'x', 'z'):
-            logger.debug("Ctrl+Key detected, clearing buffer.") 
-            self.buffer=""
+        if self.ctrl_pressed and char in ('a', 'c', 'x', 'z'):
+            if debug:
+                logger.debug("Ctrl+Key detected, clearing buffer.")
+            self._reset_buffer()
             return
 
         """ Handle Character Input """
-        char = event.name
         if char == "backspace":
-            if self.buffer: # Only modify if buffer is not empty
-                self.buffer=self.buffer[:-1]
-                logger.debug(f"Buffer after backspace: '{self.buffer}'") 
-            else:
-                logger.debug("Buffer empty, backspace ignored.") 
+            if debug and not len(self.ring):
+                logger.debug("Buffer empty, backspace only moves the tracked cursor position.")
+            self._pop_char(repeat)
+            if debug:
+                logger.debug("Buffer after backspace: '%s'", self.buffer)
         elif char == "space":
-            logger.debug(f"Space detected. Buffer before check: '{self.buffer}'") 
+            for _ in range(repeat):
+                if self._handle_space(debug):
+                    return
+        elif not self.ctrl_pressed:
+            #add character to buffer
+            self._append_text(char if repeat == 1 else char * repeat)
+            if debug:
+                logger.debug("Buffer after adding char '%s': '%s'", char, self.buffer)
 
-            #Check if the buffer contains a stored Command
-           
+    def _handle_space(self, debug: bool) -> bool:
+        """Checks for a command ending at the cursor. Returns True if one was emitted."""
+        if debug:
+            logger.debug("Space detected. Buffer before check: '%s'", self.buffer)
 
-            snippet_prefix = "::"
-            if snippet_prefix in self.buffer:
-                possible_snippet = self.buffer[self.buffer.index("::"):]
-                if possible_snippet in self.snippet_storage.snippets:
-                    logger.info(f"Command '{possible_snippet}' found! Emitting signal.")
-                    self.command_typed.emit(possible_snippet)
-                    return
+        #The automaton already knows which trigger (if any) ends at the cursor
+        match = self.matcher.match_at(self.ring.last_state())
+        if match is not None and match[1] == SNIPPET_TRIGGER:
+            possible_snippet = match[0]
+            if possible_snippet in self.snippet_storage.snippets:
+                logger.info("Command '%s' found! Emitting signal.", possible_snippet)
+                self._append_text(" ") # the space is on screen too, and gets backspaced with the command
+                self.command_typed.emit(possible_snippet)
+                return True
 
-            
-                
-            if llm_prefix in self.buffer and self.buffer.endswith(")"):
-                original_command_start = self.buffer.find(llm_prefix)
-                
-                user_query_start = original_command_start + len(llm_prefix)
-                original_command = self.buffer[original_command_start : ]
-                user_query = self.buffer[user_query_start : -1]
-                if not user_query:
-                    logger.debug(f"Empty prompt in format '{self.buffer}', no query is extracted and no API called.")
-                    self.buffer += " "
-                    return
-                
-                else:
-                    self.llm_command_detected.emit(original_command, user_query)
-                    return
+        if self._llm_spans and self.ring.last_char() == ")":
+            original_command_start, user_query_start = self._llm_spans[-1]
+            original_command = self.ring.text(original_command_start)
+            user_query = original_command[user_query_start - original_command_start : -1]
+            if not user_query:
+                if debug:
+                    logger.debug("Empty prompt in format '%s', no query is extracted and no API called.", original_command)
+            else:
+                self._append_text(" ")
+                self.llm_command_detected.emit(original_command, user_query)
+                return True
 
+        self._append_text(" ") # Add space if no command was triggered
+        if debug:
+            logger.debug("Buffer after space added: '%s'", self.buffer)
+        return False
 
-            
-            self.buffer += " " # Add space if no command was triggered
-            logger.debug(f"Buffer after space added: '{self.buffer}'") 
+    def _build_matcher(self) -> TriggerMatcher:
+        return TriggerMatcher(self.snippet_storage.snippets.keys(), self.trigger_prefixes)
 
+    def _ring_capacity(self) -> int:
+        """Room for the longest trigger plus the longest LLM query and its closing bracket."""
+        return self.matcher.max_trigger_length + MAX_LLM_QUERY_LENGTH + 1
 
-            
-                        
-        elif len(char) == 1 and not self.ctrl_pressed:
-            #add character to buffer
-            self.buffer+=char
-            logger.debug(f"Buffer after adding char '{char}': '{self.buffer}'") 
-
-            if len(self.buffer) > 200: 
-                if "::" not in self.buffer:
-                    #if we have a long buffer string without a prefix indicating someone's sending a crazy prompt, then trim it for performance and 
-                    #for privacy
-                    self.buffer = self.buffer[-50:]
-                    logger.debug(f"Buffer trimmed: '{self.buffer}'") 
-        else:
-            # Log other keys if needed (like shift, alt, etc.)
-            # logger.debug(f"Non-character key ignored: {char}") 
-            pass # Ignore other keys like shift, alt, etc. for now
+    @property
+    def buffer(self) -> str:
+        """The tracked text as a string. Builds a new string, so keep it off the per-key path."""
+        return self.ring.text()
+
+    def _append_text(self, text: str):
+        """Appends text to the ring, advancing the automaton one state per character."""
+        matcher = self.matcher
+        ring = self.ring
+        state = ring.last_state()
+        for char in text:
+            state = matcher.step(state, char)
+            ring.append(char, state)
+            match = matcher.match_at(state)
+            if match is not None and match[1] == LLM_TRIGGER:
+                self._llm_spans.append((ring.end - len(match[0]), ring.end))
+            if char in self._placeholder_last_chars:
+                self._mark_typed_placeholders()
+
+        if self._llm_spans:
+            # Forget prompts whose start has been overwritten by a very long query
+            if self._llm_spans[0][0] < ring.start:
+                self._llm_spans = [span for span in self._llm_spans if span[0] >= ring.start]
+        if not self._llm_spans and len(ring) > self._keep_length:
+            #without a pending LLM prompt only the last max_trigger_length characters can still
+            #complete a trigger (or a watched placeholder), so older ones are dropped for privacy
+            ring.drop_oldest(len(ring) - self._keep_length)
+
+    def _append_pasted_text(self, text: str):
+        """Only the tail of a paste that fits in the ring can ever be part of a trigger."""
+        if len(text) > self.ring.capacity:
+            self._reset_buffer()
+            text = text[-self.ring.capacity:]
+        self._append_text(text)
+
+    def _pop_char(self, count: int = 1):
+        for _ in range(count):
+            self.ring.pop()
+        if self._placeholder_ends:
+            for request_id, end in list(self._placeholder_ends.items()):
+                if end > self.ring.end:
+                    # The user is deleting a placeholder, which cancels its request
+                    del self._placeholder_ends[request_id]
+                    self._placeholders.pop(request_id, None)
+                    self._update_placeholder_cache()
+                    logger.info(f"Placeholder for request {request_id} deleted by the user.")
+                    self.placeholder_deleted.emit(request_id)
+        # Forget an LLM trigger once any of its characters has been deleted
+        while self._llm_spans and self._llm_spans[-1][1] > self.ring.end:
+            self._llm_spans.pop()
+
+    def _reset_buffer(self):
+        self.ring.clear()
+        self._llm_spans = []
+        self._placeholder_ends.clear()
+
+    def _mark_typed_placeholders(self):
+        """Records where a watched placeholder was fully typed, so later backspaces can be noticed."""
+        ring = self.ring
+        for request_id, text in self._placeholders.items():
+            if request_id not in self._placeholder_ends and ring.text(ring.end - len(text)) == text:
+                self._placeholder_ends[request_id] = ring.end
+
+    def _publish_placeholders(self):
+        """Worker side of placeholder_at_cursor: snapshots which placeholders the cursor is right behind."""
+        end = self.ring.end
+        at_cursor = frozenset(request_id for request_id, placeholder_end in self._placeholder_ends.items() if placeholder_end == end)
+        if at_cursor != self._placeholders_at_cursor:
+            with self._placeholder_lock:
+                self._placeholders_at_cursor = at_cursor
+
+    def _update_placeholder_cache(self):
+        self._placeholder_last_chars = frozenset(text[-1] for text in self._placeholders.values() if text)
+        longest_placeholder = max((len(text) for text in self._placeholders.values()), default=0)
+        self._keep_length = max(self.matcher.max_trigger_length, longest_placeholder)
+
+    def watch_placeholder(self, request_id: int, text: str):
+        """
+        Tracks a placeholder that is about to be typed for an LLM request. If the user later
+        backspaces into it, placeholder_deleted is emitted with the request id.
+        """
+        self._enqueue_control(EVENT_WATCH, (request_id, text))
+
+    def unwatch_placeholder(self, request_id: int):
+        """Stops tracking a placeholder. Call before removing it with simulated backspaces."""
+        self._enqueue_control(EVENT_UNWATCH, request_id)
+
+    def placeholder_at_cursor(self, request_id: int) -> bool:
+        """
+        True if the placeholder was typed and nothing has been typed or deleted after it, as of the
+        last event batch the worker finished. Safe to call from the GUI thread.
+        """
+        with self._placeholder_lock:
+            return request_id in self._placeholders_at_cursor
+
+    def refresh_triggers(self):
+        """
+        Rebuilds the automaton from the current snippets, e.g. after one is saved or deleted.
+        Only the command list is copied on the calling thread; the build runs on the builder
+        thread after the burst of changes settles, and the worker swaps it in between keystrokes.
+        """
+        commands = tuple(self.snippet_storage.snippets) # copied here, the dict is only changed on this thread
+        now = time.monotonic()
+        with self._refresh_condition:
+            if self._refresh_commands is None:
+                self._refresh_deadline = now + self.REFRESH_MAX_DELAY
+            self._refresh_commands = commands
+            self._refresh_due = min(now + self.REFRESH_DEBOUNCE, self._refresh_deadline)
+            self._refresh_condition.notify()
+
+    def _builder_loop(self):
+        while True:
+            with self._refresh_condition:
+                while not self._builder_stopped:
+                    if self._refresh_commands is not None:
+                        remaining = self._refresh_due - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._refresh_condition.wait(remaining)
+                    else:
+                        self._refresh_condition.wait()
+                if self._builder_stopped:
+                    return
+                commands, self._refresh_commands = self._refresh_commands, None
+            # changes made while this builds queue another build, which is swapped in after this one
+            started = time.perf_counter()
+            try:
+                matcher = TriggerMatcher(commands, self.trigger_prefixes)
+            except Exception as e:
+                logger.error(f"Rebuilding the trigger automaton failed: {e}", exc_info=True)
+                continue
+            logger.debug(f"Trigger automaton built in {time.perf_counter() - started:.3f}s")
+            self._enqueue_control(EVENT_REFRESH, matcher)
+
+    def _swap_matcher(self, matcher: TriggerMatcher):
+        text = self.buffer
+        self.matcher = matcher
+        self.ring = KeystrokeRingBuffer(self._ring_capacity())
+        self._llm_spans = []
+        self._placeholder_ends.clear()
+        self._update_placeholder_cache()
+        self._append_text(text)
+        logger.info(f"Trigger automaton rebuilt with {len(self.matcher)} triggers.")
+
+    def _enqueue_control(self, kind: int, payload=None):
+        """Control records come from normal threads, so they may wait briefly rather than be dropped."""
+        try:
+            self._events.put((kind, payload), timeout=1.0)
+        except queue.Full:
+            logger.error(f"Keystroke queue stayed full, control event {kind} dropped.")
 
     def _on_paste(self):
+        """Ctrl+V hotkey callback; the clipboard is read by the worker, not the hook thread."""
+        self._enqueue(EVENT_PASTE)
+
+    def _handle_paste(self):
         logger.debug("attempting to paste last clipboard object")
         try:
 
             pasted_object = pyperclip.paste()
             #check if the pasted object is of string type
             if (isinstance(pasted_object, str)):
-                self.buffer += pasted_object
-                logger.info(f"Adding text: \"{pasted_object}\" to buffer")
+                self._append_pasted_text(pasted_object)
+                logger.info(f"Added {len(pasted_object)} pasted characters to buffer")
             else:
                 logger.info("Pasted text is not a string, ignoring")
         except Exception as e:
@@ -154,8 +458,15 @@ class KeystrokeListener(QObject):
         
 
     def clear_buffer(self):
-        logger.debug ("KeystrokeListener: Buffer cleared") 
-        self.buffer = ""
+        """Thread-safe reset; goes through the event queue so it is ordered with keystrokes."""
+        logger.debug ("KeystrokeListener: Buffer clear requested") 
+        self._enqueue_control(EVENT_RESET)
         
     def stop_listener(self):
-        keyboard.unhook_all()
\ No newline at end of file
+        keyboard.unhook_all()
+        with self._refresh_condition:
+            self._builder_stopped = True
+            self._refresh_condition.notify()
+        self._enqueue_control(EVENT_STOP)
+        self._worker.join(timeout=1.0)
+        logger.info(f"Keystroke listener stopped. Stats: {self.get_stats()}")
\ No newline at end of file
@@ -1,78 +1,219 @@
+import asyncio
 import logging
+import threading
 from PySide6.QtCore import QObject, Slot, Signal
 import os 
 from dotenv import load_dotenv
 from .resource_handler import get_path_for_resource
+from .prompt_stream import BackendStreamError, read_prompt_stream
 
 
 import httpx
 logger = logging.getLogger(__name__)
 
-class LLMHandler(QObject):
-    # Signal to emit the successful prompt and the original query
-    prompt_received = Signal(str, str) 
-    # Signal to emit the error message on failure
-    prompt_failed = Signal(str)
+try:
+    import h2  # noqa: F401 - only needed so httpx can negotiate HTTP/2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
 
-    def __init__(self):
+class LLMHandler(QObject):
+    """
+    Talks to the backend from a dedicated asyncio loop thread.
+
+    One long-lived httpx.AsyncClient keeps connections alive (and uses HTTP/2 when the h2
+    package is installed), so only the first request pays for DNS, TCP and TLS, and that
+    cost is moved to startup by a warm-up call. Callers never block: results are reported
+    only through the prompt_received / prompt_failed signals, which Qt delivers to
+    main-thread slots as queued calls. Every request carries a caller-chosen id, so several
+    can be in flight at once and each can be cancelled on its own. With streaming on, the
+    text generated so far is reported through prompt_partial while the backend is still working.
+    Queries answered before can be served from a PromptCache without any request at all.
+    """
+    PARTIAL_EMIT_INTERVAL = 0.1 # seconds between prompt_partial signals for one request
+
+    # Signal to emit the request id, the successful prompt and the original query
+    prompt_received = Signal(int, str, str) 
+    # Signal to emit the request id and the error message on failure
+    prompt_failed = Signal(int, str)
+    # Signal to emit the request id and the text received so far while streaming
+    prompt_partial = Signal(int, str)
+
+    def __init__(self, connect_timeout: float = 5.0, read_timeout: float = 30.0, total_timeout: float = 45.0, use_http2: bool = True, streaming: bool = True, prompt_cache=None):
+        """
+        :param connect_timeout: Seconds to establish a connection (also used for writes and pool waits).
+        :param read_timeout: Seconds to wait between bytes of the response.
+        :param total_timeout: Hard limit in seconds for a whole request, including retries inside httpx.
+        :param use_http2: Negotiate HTTP/2 with the backend if the h2 package is installed.
+        :param streaming: Use the backend's server-sent events endpoint and report partial text.
+        :param prompt_cache: Optional PromptCache consulted by get_cached_prompt().
+        """
         super().__init__()
         env_path = get_path_for_resource('.env')
         load_dotenv(dotenv_path=env_path)
         self.backend_url = os.getenv("BACKEND_API_URL")
         self.backend_api = os.getenv("BACKEND_API_KEY")
 
-
-    @Slot(str, str)
-    def get_prompt_from_backend (self, user_query: str, original_command: str):
-        """Make a post request to the backend with user_query, return an augmented prompt"""
-
+        self.total_timeout = total_timeout
+        self.streaming = streaming
+        self.prompt_cache = prompt_cache
+        self._in_flight = {} # request id -> concurrent.futures.Future of its coroutine
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name="LLMClient", daemon=True)
+        self._thread.start()
+
+        self._client = None
+        if self.backend_url:
+            if use_http2 and not HTTP2_AVAILABLE:
+                logger.warning("h2 package not installed, falling back to HTTP/1.1 for the backend connection.")
+            self._client = httpx.AsyncClient(
+                base_url=self.backend_url,
+                http2=use_http2 and HTTP2_AVAILABLE,
+                timeout=httpx.Timeout(connect=connect_timeout, read=read_timeout, write=connect_timeout, pool=connect_timeout),
+                limits=httpx.Limits(max_connections=10, max_keepalive_connections=4, keepalive_expiry=300.0),
+                headers={
+                    "Content-Type": "application/json",
+                    "X-API-KEY": self.backend_api or "",
+                },
+            )
+            self._submit(self._warm_up())
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def _submit(self, coroutine):
+        """Schedules a coroutine on the client loop from any thread."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    async def _warm_up(self):
+        """Resolves the backend host and opens a pooled connection before the first prompt."""
+        try:
+            url = self._client.base_url
+            port = url.port or (443 if url.scheme == "https" else 80)
+            await self._loop.getaddrinfo(url.host, port)
+            response = await self._client.get("/api/v1/health")
+            logger.info(f"Backend connection warmed up ({response.http_version}, status {response.status_code}).")
+        except Exception as e:
+            # Not fatal: the first real request will simply pay the connection cost
+            logger.warning(f"Backend warm-up failed: {e}")
+
+    @Slot(int, str, str)
+    def get_cached_prompt(self, request_id: int, user_query: str, original_command: str) -> bool:
+        """
+        Emits prompt_received right away (on the calling thread) if an earlier result for
+        user_query is cached. Returns False on a miss, in which case nothing is emitted.
+        """
+        if self.prompt_cache is None:
+            return False
+        cached_prompt = self.prompt_cache.get(user_query)
+        if cached_prompt is None:
+            return False
+        logger.info(f"Prompt #{request_id} served from the local cache.")
+        self.prompt_received.emit(request_id, cached_prompt, original_command)
+        return True
+
+    def get_prompt_from_backend (self, request_id: int, user_query: str, original_command: str):
+        """Queue a post request to the backend with user_query; the result arrives through the signals."""
+        if not self._client:
+            error_msg = "BACKEND_API_URL environment variable is not set."
+            logger.error(error_msg)
+            self.prompt_failed.emit(request_id, error_msg)
+            return None
+        future = self._submit(self._request_prompt(request_id, user_query, original_command))
+        self._in_flight[request_id] = future
+        future.add_done_callback(lambda _: self._in_flight.pop(request_id, None))
+        return future
+
+    def cancel(self, request_id: int) -> bool:
+        """Cancels a pending request. Returns False if it already finished."""
+        future = self._in_flight.get(request_id)
+        if future is None:
+            return False
+        # Cancelling the concurrent future cancels the asyncio task on the client loop
+        return future.cancel()
+
+    def in_flight_count(self) -> int:
+        return len(self._in_flight)
+
+    async def _request_prompt(self, request_id: int, user_query: str, original_command: str):
+        """Make a post request to the backend with user_query, emit an augmented prompt"""
         try:
-            base_url = self.backend_url
-            if not base_url:
-                error_msg = "BACKEND_API_URL environment variable is not set."
-                logger.error(error_msg)
-                self.prompt_failed.emit(error_msg)
-                return
-            
             payload = {"user_query": user_query}
-            request_headers = {
-                "Content-Type": "application/json",
-                "X-API-KEY": self.backend_api
-            }
-            response = httpx.post(f"{base_url}/api/v1/generate-prompt", headers=request_headers, json=payload, timeout=30.0)
-            response.raise_for_status() 
-
-            data = response.json()
-            augmented_prompt = data.get("augmented_prompt")
+            if self.streaming:
+                request = self._stream_prompt(request_id, payload)
+            else:
+                request = self._post_prompt(payload)
+            augmented_prompt = await asyncio.wait_for(request, timeout=self.total_timeout)
 
             if augmented_prompt:
                 logger.info("Augmented prompt successfully received, emitting signal.")
                 # Pass the original command along with the result
-                self.prompt_received.emit(augmented_prompt, original_command)
+                self.prompt_received.emit(request_id, augmented_prompt, original_command)
             else:
                 error_msg = "Backend returned an empty prompt."
                 logger.warning(error_msg)
-                self.prompt_failed.emit(error_msg)
-
+                self.prompt_failed.emit(request_id, error_msg)
+
+        except asyncio.CancelledError:
+            # whoever cancelled it (Application.cancel_prompt or shutdown) already forgot the request
+            logger.info(f"Request {request_id} cancelled.")
+            raise
+        except asyncio.TimeoutError:
+            error_msg = f"Request timed out after {self.total_timeout:.0f}s"
+            logger.error(error_msg)
+            self.prompt_failed.emit(request_id, error_msg)
         except httpx.HTTPStatusError as e:
             error_body = e.response.text
             error_msg = f"HTTP {e.response.status_code}: {error_body}"
             logger.error(f"HTTP error occurred: {error_msg}", exc_info=True)
-            self.prompt_failed.emit(error_msg)
+            self.prompt_failed.emit(request_id, error_msg)
+        except BackendStreamError as e:
+            error_msg = f"Streaming failed: {e}"
+            logger.error(error_msg)
+            self.prompt_failed.emit(request_id, error_msg)
+        except httpx.TimeoutException as e:
+            error_msg = f"Timed out talking to the backend ({type(e).__name__})"
+            logger.error(error_msg)
+            self.prompt_failed.emit(request_id, error_msg)
         except httpx.RequestError as e:
             error_msg = f"Network error: {e}"
             logger.error(f"A network error occurred: {error_msg}", exc_info=True)
-            self.prompt_failed.emit(error_msg)
+            self.prompt_failed.emit(request_id, error_msg)
         except Exception as e:
             error_msg = f"An unexpected error occurred: {e}"
             logger.error(error_msg, exc_info=True)
-            self.prompt_failed.emit(error_msg)
-
-
-
-
-
-
-
-
-
+            self.prompt_failed.emit(request_id, error_msg)
+
+    async def _post_prompt(self, payload: dict) -> str:
+        response = await self._client.post("/api/v1/generate-prompt", json=payload)
+        response.raise_for_status() 
+        data = response.json()
+        return data.get("augmented_prompt")
+
+    async def _stream_prompt(self, request_id: int, payload: dict) -> str:
+        """Consumes the streaming endpoint, emitting prompt_partial as text arrives."""
+        async with self._client.stream("POST", "/api/v1/generate-prompt/stream", json=payload) as response:
+            if response.status_code == 404:
+                logger.warning("Backend has no streaming endpoint, falling back to the regular one.")
+                self.streaming = False
+                return await self._post_prompt(payload)
+            if response.is_error:
+                await response.aread()
+                response.raise_for_status()
+
+            return await read_prompt_stream(
+                response,
+                on_partial=lambda text: self.prompt_partial.emit(request_id, text),
+                partial_interval=self.PARTIAL_EMIT_INTERVAL,
+            )
+
+    def shutdown(self, timeout: float = 2.0):
+        """Closes pooled connections and stops the client loop."""
+        if self._client is not None:
+            try:
+                self._submit(self._client.aclose()).result(timeout=timeout)
+            except Exception as e:
+                logger.warning(f"Error closing backend client: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=timeout)
@@ -0,0 +1,44 @@
+import json
+import time
+import httpx
+
+
+class BackendStreamError(Exception):
+    """The backend reported an error, or the stream ended early, while streaming a prompt."""
+
+
+async def iter_sse_events(response: httpx.Response):
+    """Yields (event, data) pairs from a text/event-stream response, with data parsed as JSON."""
+    event, data_lines = "message", []
+    async for line in response.aiter_lines():
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].lstrip())
+
+
+async def read_prompt_stream(response: httpx.Response, on_partial=None, partial_interval: float = 0.1) -> str:
+    """
+    Reads the backend's /generate-prompt/stream events and returns the finished prompt.
+    `delta` text is accumulated and handed to `on_partial(text so far)` at most every
+    `partial_interval` seconds; an `error` event, or the stream ending without `done`, raises
+    BackendStreamError. Kept free of Qt so the protocol can be tested on its own.
+    """
+    parts = []
+    last_emit = 0.0
+    async for event, data in iter_sse_events(response):
+        if event == "delta":
+            parts.append(data.get("text", ""))
+            now = time.monotonic()
+            if on_partial is not None and now - last_emit >= partial_interval:
+                last_emit = now
+                on_partial("".join(parts))
+        elif event == "done":
+            return data.get("augmented_prompt") or "".join(parts)
+        elif event == "error":
+            raise BackendStreamError(data.get("detail", "unknown backend error"))
+    raise BackendStreamError("stream ended before the prompt was complete")
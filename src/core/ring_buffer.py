@@ -0,0 +1,87 @@
+class KeystrokeRingBuffer:
+    """
+    Fixed-capacity ring of typed characters, each paired with the trigger automaton state
+    reached after it.
+
+    Appending and backspacing only move indices inside preallocated lists, so typing never
+    rebuilds a string and memory stays flat however long the user types. Positions are
+    absolute (they keep counting up as characters are typed), which lets callers remember
+    where something started even after older characters have been overwritten.
+    """
+    __slots__ = ("capacity", "_chars", "_states", "_head", "_length", "end")
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError("KeystrokeRingBuffer capacity must be at least 1")
+        self.capacity = capacity
+        self._chars = [""] * capacity
+        self._states = [0] * capacity
+        self._head = 0    # slot of the oldest character
+        self._length = 0
+        self.end = 0      # absolute position just past the newest character
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def start(self) -> int:
+        """Absolute position of the oldest character still held."""
+        return self.end - self._length
+
+    def append(self, char: str, state: int):
+        """Adds a character, overwriting the oldest one when the ring is full."""
+        capacity = self.capacity
+        if self._length == capacity:
+            slot = self._head
+            self._head = (slot + 1) % capacity
+        else:
+            slot = (self._head + self._length) % capacity
+            self._length += 1
+        self._chars[slot] = char
+        self._states[slot] = state
+        self.end += 1
+
+    def pop(self) -> bool:
+        """
+        Removes the newest character (a backspace). When nothing is held, only the end position
+        moves back so absolute positions keep following the cursor. Returns False in that case.
+        """
+        self.end -= 1
+        if not self._length:
+            return False
+        self._length -= 1
+        return True
+
+    def drop_oldest(self, count: int):
+        """Forgets the `count` oldest characters without touching the rest."""
+        count = min(count, self._length)
+        self._head = (self._head + count) % self.capacity
+        self._length -= count
+
+    def clear(self):
+        self._head = 0
+        self._length = 0
+        self.end = 0
+
+    def last_state(self, default: int = 0) -> int:
+        if not self._length:
+            return default
+        return self._states[(self._head + self._length - 1) % self.capacity]
+
+    def last_char(self) -> str:
+        if not self._length:
+            return ""
+        return self._chars[(self._head + self._length - 1) % self.capacity]
+
+    def text(self, start: int = None) -> str:
+        """Returns the characters from absolute position `start` (default: oldest held) to the end."""
+        if start is None or start < self.start:
+            start = self.start
+        count = self.end - start
+        if count <= 0:
+            return ""
+        first = (self._head + (start - self.start)) % self.capacity
+        last = first + count
+        if last <= self.capacity:
+            return "".join(self._chars[first:last])
+        return "".join(self._chars[first:]) + "".join(self._chars[:last - self.capacity])
@@ -0,0 +1,175 @@
+import logging
+import time
+import keyboard
+import pyperclip
+from ..storage.settings_storage import SettingsStorage
+
+try:
+    import win32clipboard
+    import win32gui
+except ImportError: # Not on Windows, fall back to polling pyperclip and calibrated waits
+    win32clipboard = None
+    win32gui = None
+
+logger = logging.getLogger(__name__)
+
+TYPING_METHOD = "typing"
+CLIPBOARD_METHOD = "clipboard"
+
+
+class TextInjector:
+    """
+    Puts snippet text into the focused application using the cheapest method that works.
+
+    Short single-line snippets are typed directly, which never touches the clipboard. Longer
+    ones go through the clipboard. Instead of fixed sleeps, the injector waits until the
+    clipboard sequence number shows the new text is in place, presses Ctrl+V, and then
+    watches for the target app to open and close the clipboard to know the paste has
+    finished before the user's clipboard is restored. How long each app took is remembered
+    (per window class) in SettingsStorage and used as the wait when the paste can't be observed.
+    A paste that isn't seen within that wait doubles it (up to DEFAULT_PASTE_SETTLE) for the next
+    one, so an app that got slower isn't handed the restored clipboard forever.
+    """
+    POLL_INTERVAL = 0.001
+    CLIPBOARD_READY_TIMEOUT = 0.25
+    DEFAULT_PASTE_SETTLE = 0.5   # the previous fixed delay, used until an app has been calibrated
+    MIN_PASTE_SETTLE = 0.03
+    CALIBRATION_WEIGHT = 0.3     # weight of the newest measurement in the moving average
+
+    def __init__(self, settings: SettingsStorage = None):
+        self.settings = settings
+        self.typing_threshold = int(self._setting("injection_typing_threshold", 64))
+        self.timings = dict(self._setting("injection_timings", {}) or {})
+
+    def _setting(self, key, default):
+        if self.settings is None:
+            return default
+        return self.settings.get(key, default)
+
+    def choose_method(self, text: str) -> str:
+        # Typing a newline would press Enter, which sends the message in most chat apps
+        if len(text) <= self.typing_threshold and "\n" not in text and "\r" not in text:
+            return TYPING_METHOD
+        return CLIPBOARD_METHOD
+
+    def inject(self, text: str) -> str:
+        """Injects text into the focused window and returns the method that was used."""
+        method = self.choose_method(text)
+        if method == TYPING_METHOD:
+            keyboard.write(text)
+            logger.debug(f"Typed {len(text)} characters directly")
+        else:
+            self._paste_via_clipboard(text)
+        return method
+
+    def _paste_via_clipboard(self, text: str):
+        original_clipboard_content = None
+        try:
+            original_clipboard_content = pyperclip.paste()
+            logger.debug("Retrieved original clipboard content")
+        except pyperclip.PyperclipException as e_get_paste:
+            logger.warning(f"Error retrieving original clipboard content: {e_get_paste}")
+
+        app_key = self._foreground_app_key()
+        sequence_before = self._clipboard_sequence()
+        pyperclip.copy(text)
+        try:
+            if not self._wait_for_clipboard(text, sequence_before):
+                logger.warning("Clipboard did not report the new content in time, pasting anyway")
+
+            keyboard.send('ctrl+v')
+            self._wait_for_paste(app_key)
+        finally:
+            if original_clipboard_content is not None: #"is not" checks for memory address or identity inequality vs value inequality
+                try:
+                    pyperclip.copy(original_clipboard_content)
+                    logger.debug("restored user's original clipboard content")
+                except pyperclip.PyperclipException as e_restore:
+                    logger.warning(f"Error when restoring user's original clipboard content: {e_restore}")
+            else:
+                logger.debug("Clipboard was modified, but there was no original content to restore")
+
+    def _wait_for_clipboard(self, text: str, sequence_before) -> bool:
+        """Waits until the clipboard holds `text`. Returns False on timeout."""
+        deadline = time.perf_counter() + self.CLIPBOARD_READY_TIMEOUT
+        while True:
+            if sequence_before is not None:
+                if self._clipboard_sequence() != sequence_before:
+                    return True
+            else:
+                try:
+                    if pyperclip.paste() == text:
+                        return True
+                except pyperclip.PyperclipException:
+                    pass
+            if time.perf_counter() >= deadline:
+                return False
+            time.sleep(self.POLL_INTERVAL)
+
+    def _wait_for_paste(self, app_key: str):
+        """
+        Blocks until the target app has read the clipboard, or until its calibrated settle
+        time runs out if the read can't be observed.
+        """
+        settle = self.timings.get(app_key, self.DEFAULT_PASTE_SETTLE)
+        if win32clipboard is None:
+            time.sleep(settle)
+            return
+
+        start = time.perf_counter()
+        deadline = start + settle
+        seen_open = False
+        while time.perf_counter() < deadline:
+            try:
+                is_open = bool(win32clipboard.GetOpenClipboardWindow())
+            except Exception:
+                is_open = False
+            if is_open:
+                seen_open = True
+            elif seen_open:
+                self._calibrate(app_key, time.perf_counter() - start)
+                return
+            time.sleep(self.POLL_INTERVAL)
+        logger.debug(f"Paste into '{app_key}' not observed, waited the calibrated {settle:.3f}s")
+        self._back_off(app_key, settle)
+
+    def _calibrate(self, app_key: str, elapsed: float):
+        """Remembers how long `app_key` takes to finish a paste, with headroom."""
+        observed = max(self.MIN_PASTE_SETTLE, elapsed * 2)
+        previous = self.timings.get(app_key)
+        settle = observed if previous is None else (1 - self.CALIBRATION_WEIGHT) * previous + self.CALIBRATION_WEIGHT * observed
+        settle = min(settle, self.DEFAULT_PASTE_SETTLE)
+        self.timings[app_key] = settle
+        logger.debug(f"Paste into '{app_key}' finished after {elapsed * 1000:.1f} ms, settle time now {settle:.3f}s")
+
+        # Only write to disk when the calibration moved noticeably
+        if self.settings is not None and (previous is None or abs(settle - previous) > 0.1 * previous):
+            self.settings.set("injection_timings", dict(self.timings))
+
+    def _back_off(self, app_key: str, settle: float):
+        """
+        The app didn't finish reading the clipboard within `settle`: it may be slower than the
+        fast pastes it was calibrated on (Electron, RDP), so give it twice as long next time.
+        """
+        if settle >= self.DEFAULT_PASTE_SETTLE or app_key not in self.timings:
+            return
+        self.timings[app_key] = min(settle * 2, self.DEFAULT_PASTE_SETTLE)
+        logger.debug(f"Paste settle time for '{app_key}' backed off to {self.timings[app_key]:.3f}s")
+        if self.settings is not None:
+            self.settings.set("injection_timings", dict(self.timings))
+
+    def _clipboard_sequence(self):
+        if win32clipboard is None:
+            return None
+        try:
+            return win32clipboard.GetClipboardSequenceNumber()
+        except Exception:
+            return None
+
+    def _foreground_app_key(self) -> str:
+        if win32gui is None:
+            return "default"
+        try:
+            return win32gui.GetClassName(win32gui.GetForegroundWindow()) or "default"
+        except Exception:
+            return "default"
@@ -0,0 +1,121 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Kinds of triggers the automaton can report
+SNIPPET_TRIGGER = 0
+LLM_TRIGGER = 1
+
+DEFAULT_PREFIXES = ("::",)
+LLM_KEYWORD = "Prompt("
+
+
+class TriggerMatcher:
+    """
+    Aho-Corasick automaton over every snippet command and the LLM trigger.
+
+    The listener feeds it one character at a time with `step()`. Every state
+    remembers the longest trigger that ends on it, so checking for a command
+    when space is pressed is a list lookup instead of a scan of the buffer.
+    Transitions that need failure links are memoized the first time they are
+    taken, which keeps each keystroke O(1) however many snippets are loaded.
+    """
+    ROOT = 0
+
+    def __init__(self, commands, prefixes=DEFAULT_PREFIXES, llm_keyword: str = LLM_KEYWORD):
+        """
+        :param commands: Iterable of snippet commands (e.g. the keys of SnippetStorage.snippets).
+        :param prefixes: Prefixes a command must start with to be armed, e.g. ("::", ";;").
+                         The LLM trigger is registered once per prefix ("::Prompt(", ";;Prompt(").
+        :param llm_keyword: The text following a prefix that opens an LLM prompt.
+        """
+        self.prefixes = tuple(p for p in prefixes if p) or DEFAULT_PREFIXES
+        self.llm_triggers = tuple(prefix + llm_keyword for prefix in self.prefixes)
+
+        self._goto = [{}]    # state -> {char: next state}
+        self._fail = [0]     # state -> failure link
+        self._match = [-1]   # state -> index into self._triggers of the longest trigger ending here
+        self._triggers = []  # list of (trigger text, kind)
+        self.max_trigger_length = 0
+
+        skipped = 0
+        for command in commands:
+            if command.startswith(self.prefixes):
+                self._insert(command, SNIPPET_TRIGGER)
+            else:
+                skipped += 1
+        # LLM triggers go in last so they win over a snippet with the same text
+        for trigger in self.llm_triggers:
+            self._insert(trigger, LLM_TRIGGER)
+
+        self._build_failure_links()
+        if skipped:
+            logger.warning(f"{skipped} snippet command(s) do not start with a configured prefix {self.prefixes} and were not armed.")
+        logger.debug(f"TriggerMatcher built with {len(self._triggers)} triggers and {len(self._goto)} states.")
+
+    def _insert(self, trigger: str, kind: int):
+        state = self.ROOT
+        for char in trigger:
+            nxt = self._goto[state].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(self.ROOT)
+                self._match.append(-1)
+                self._goto[state][char] = nxt
+            state = nxt
+
+        if self._match[state] != -1:
+            self._triggers[self._match[state]] = (trigger, kind)
+        else:
+            self._match[state] = len(self._triggers)
+            self._triggers.append((trigger, kind))
+        self.max_trigger_length = max(self.max_trigger_length, len(trigger))
+
+    def _build_failure_links(self):
+        """Breadth-first pass so that a state's failure link is always resolved before its children."""
+        queue = list(self._goto[self.ROOT].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for char, child in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, self.ROOT)
+                self._fail[child] = target if target != child else self.ROOT
+                # A state without its own trigger inherits the longest one from its failure link
+                if self._match[child] == -1:
+                    self._match[child] = self._match[self._fail[child]]
+                queue.append(child)
+
+    def step(self, state: int, char: str) -> int:
+        """Returns the state reached by typing `char` in `state`."""
+        transitions = self._goto[state]
+        nxt = transitions.get(char)
+        if nxt is not None:
+            return nxt
+
+        fallback = self._fail[state]
+        while fallback and char not in self._goto[fallback]:
+            fallback = self._fail[fallback]
+        nxt = self._goto[fallback].get(char, self.ROOT)
+        transitions[char] = nxt  # memoize so the next visit is a single dict lookup
+        return nxt
+
+    def feed(self, text: str, state: int = ROOT) -> int:
+        """Runs a whole string through the automaton and returns the final state."""
+        for char in text:
+            state = self.step(state, char)
+        return state
+
+    def match_at(self, state: int):
+        """Returns (trigger, kind) for the longest trigger ending in `state`, or None."""
+        index = self._match[state]
+        if index == -1:
+            return None
+        return self._triggers[index]
+
+    def __len__(self):
+        return len(self._triggers)
@@ -1,13 +1,18 @@
 import sys
 from PySide6.QtWidgets import QApplication
 from .core.application import Application 
+from .storage.settings_storage import SettingsStorage
+from .storage.persistence_service import default_service
 import logging
-import logging.handlers # For rotating file handler
+import logging.handlers # For rotating file handler and the queue handler/listener
 import os
+import queue
+import atexit
 from PySide6.QtCore import QTimer
 
 
 _persistent_app_instance = None
+_log_listener = None
 
 # Determine the application's root directory or a suitable logs directory
 # In a production app, this might be in user's AppData or a system log directory.
@@ -23,9 +28,30 @@ LOG_FILE_PATH = os.path.join(LOG_DIR, 'app.log')
 
 
 
-def setup_logging():
-    """Configures logging for the application."""
-    log_level = logging.DEBUG # Set to INFO for production, DEBUG for development
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that hands the record over untouched.
+
+    The stock handler formats the message in the calling thread before queueing it, which
+    would put string building back on the keyboard hook thread. Here formatting happens
+    in the QueueListener's writer thread instead.
+    """
+    def prepare(self, record):
+        return record
+
+
+def setup_logging(log_level_name: str = "INFO", use_queue: bool = True):
+    """
+    Configures logging for the application.
+
+    :param log_level_name: Level name from SettingsStorage ("DEBUG", "INFO", ...).
+    :param use_queue: If True, records go through a queue to a background writer thread,
+                      so callers (like the keyboard hook) never wait on console or file I/O.
+    """
+    global _log_listener
+    log_level = logging.getLevelName(str(log_level_name).upper())
+    if not isinstance(log_level, int):
+        log_level = logging.INFO
     log_format = '%(asctime)s - %(name)s - [%(levelname)s] - %(module)s.%(funcName)s:%(lineno)d - %(message)s'
     date_format = '%Y-%m-%d %H:%M:%S'
 
@@ -35,12 +61,12 @@ def setup_logging():
     # Prevent multiple handlers if this function is called again (e.g., in tests or reloads)
     if root_logger.hasHandlers():
         root_logger.handlers.clear()
+    stop_logging()
 
     # Console Handler (StreamHandler)
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(logging.Formatter(log_format, date_format))
     console_handler.setLevel(log_level) # Or a different level for console, e.g., logging.INFO
-    root_logger.addHandler(console_handler)
 
     # File Handler (RotatingFileHandler for better log management)
     # Rotates logs when they reach 5MB, keeping up to 5 backup logs.
@@ -49,19 +75,39 @@ def setup_logging():
     )
     file_handler.setFormatter(logging.Formatter(log_format, date_format))
     file_handler.setLevel(log_level) # Typically log everything to file
-    root_logger.addHandler(file_handler)
+
+    if use_queue:
+        log_queue = queue.SimpleQueue()
+        root_logger.addHandler(_DeferredQueueHandler(log_queue))
+        _log_listener = logging.handlers.QueueListener(
+            log_queue, console_handler, file_handler, respect_handler_level=True
+        )
+        _log_listener.start()
+        atexit.register(stop_logging)
+    else:
+        root_logger.addHandler(console_handler)
+        root_logger.addHandler(file_handler)
 
     # For PySide6/Qt specific logging (optional, can be noisy)
     # logging.getLogger("PySide6").setLevel(logging.WARNING)
 
 
+def stop_logging():
+    """Flushes queued log records and stops the background writer thread."""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+
 def start_main_application():
     global _persistent_app_instance
     _persistent_app_instance = Application()
 
 
 def main():
-    setup_logging() # Call the setup function
+    settings = SettingsStorage()
+    setup_logging(settings.get("log_level", "INFO"), bool(settings.get("async_logging", True))) # Call the setup function
 
     logger = logging.getLogger(__name__)
     logger.info("Application starting...")
@@ -69,6 +115,8 @@ def main():
 
     app = QApplication(sys.argv)
     app.setQuitOnLastWindowClosed(False)
+    app.aboutToQuit.connect(default_service().flush) # covers quit paths that skip quit_application
+    app.aboutToQuit.connect(stop_logging)
     
     try:
         QTimer.singleShot(0, start_main_application)
@@ -0,0 +1,250 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from .history_storage import HistoryStorage
+from .persistence_service import PersistenceService, default_service
+from .prompt_cache import HISTORY_TIMESTAMP_FORMAT
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def _epoch(timestamp: str) -> int:
+    try:
+        return int(datetime.strptime(timestamp, HISTORY_TIMESTAMP_FORMAT).timestamp())
+    except (TypeError, ValueError):
+        return 0
+
+
+def fts_query(text: str) -> str:
+    """
+    Turns free text into an FTS5 query: every word must match, the last one as a prefix so
+    results show up while typing. Words are quoted, so FTS syntax in the input is inert.
+    """
+    tokens = _TOKEN.findall(text)
+    if not tokens:
+        return ""
+    terms = [f'"{token}"' for token in tokens[:-1]] + [f'"{tokens[-1]}"*']
+    return " ".join(terms)
+
+
+class HistoryIndex:
+    """
+    Full-text search over history `query` and `result`, in an SQLite FTS5 table next to the
+    history segments (history_index.db), with entry timestamps in an indexed column for
+    date range filters. Results are ranked by bm25, with query matches weighted above result matches;
+    for words that match a large part of a long history only the newest RANK_WINDOW matches are ranked.
+
+    It follows HistoryStorage through its listener: new entries are inserted and a clear
+    empties the index, both on the PersistenceService thread. `start()` catches up with
+    whatever the history has that the index doesn't (everything the first time) on a
+    background thread, in batches, so startup isn't blocked and searching works meanwhile
+    on what has been indexed so far. Searches use their own connection; with WAL they never
+    wait for the writer.
+    """
+    BUILD_BATCH = 1000
+    QUERY_WEIGHT = 2.0 # bm25 weight of the query column relative to the result column
+    # only the newest this-many matches get ranked: scoring every hit of a common word over a long
+    # history is what makes a search slow, and a match from years ago rarely beats a recent one anyway
+    RANK_WINDOW = 5000
+
+    def __init__(self, history: HistoryStorage, db_name: str = "history_index.db", persistence: PersistenceService = None):
+        self.history = history
+        self.db_path = os.path.join(history.storage_dir, db_name)
+        self.persistence = persistence or default_service()
+        self._write_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self._writer = self._connect()
+        self._reader = self._connect()
+        self._create_schema()
+        self._pending = [] # entries (or None for a clear) waiting for the writer thread
+        self._pending_lock = threading.Lock()
+        self._build_thread = None
+        self.building = False
+        self._closed = False
+        history.add_listener(self._on_history_changed)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _create_schema(self):
+        with self._write_lock:
+            self._writer.executescript("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    id INTEGER PRIMARY KEY,
+                    ts INTEGER NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    result TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS entries_ts ON entries (ts);
+                CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+                    query, result, content='entries', content_rowid='id', tokenize='unicode61'
+                );
+            """)
+
+    def _insert(self, entries):
+        """Adds entries to both tables in one transaction; ids already indexed are skipped."""
+        rows = [(entry["id"], _epoch(entry.get("timestamp")), entry.get("timestamp", ""), entry.get("query", ""), entry.get("result", ""))
+                for entry in entries if "id" in entry]
+        if not rows:
+            return
+        with self._write_lock:
+            self._writer.execute("BEGIN IMMEDIATE")
+            try:
+                for row in rows:
+                    cursor = self._writer.execute(
+                        "INSERT OR IGNORE INTO entries (id, ts, timestamp, query, result) VALUES (?, ?, ?, ?, ?)", row)
+                    if cursor.rowcount:
+                        self._writer.execute("INSERT INTO entries_fts (rowid, query, result) VALUES (?, ?, ?)", (row[0], row[3], row[4]))
+            except BaseException:
+                self._writer.execute("ROLLBACK")
+                raise
+            self._writer.execute("COMMIT")
+
+    def _wipe(self):
+        with self._write_lock:
+            self._writer.execute("BEGIN IMMEDIATE")
+            self._writer.execute("DELETE FROM entries")
+            self._writer.execute("INSERT INTO entries_fts (entries_fts) VALUES ('delete-all')")
+            self._writer.execute("COMMIT")
+
+    def _max_indexed_id(self) -> int:
+        with self._write_lock:
+            return self._writer.execute("SELECT COALESCE(MAX(id), 0) FROM entries").fetchone()[0]
+
+    def _on_history_changed(self, entry):
+        if self._closed:
+            return
+        with self._pending_lock:
+            self._pending.append(entry)
+        self.persistence.schedule(("history_index", self.db_path), self._write_pending)
+
+    def _write_pending(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        if self._closed:
+            return
+        done = 0 # entries (or clears) fully applied
+        try:
+            batch = []
+            for index, entry in enumerate(pending):
+                if entry is not None:
+                    batch.append(entry)
+                    continue
+                batch = []
+                self._wipe()
+                done = index + 1
+            self._insert(batch)
+        except BaseException:
+            # put back what wasn't applied so the service's retry gets it; the inserts are
+            # INSERT OR IGNORE, so entries that did land aren't duplicated
+            with self._pending_lock:
+                self._pending[:0] = pending[done:]
+            raise
+
+    def start(self):
+        """Brings the index up to date with the history on a background thread."""
+        if self._build_thread is None:
+            self.building = True
+            self._build_thread = threading.Thread(target=self._build, name="HistoryIndexBuild", daemon=True)
+            self._build_thread.start()
+
+    def _build(self):
+        started = time.perf_counter()
+        try:
+            indexed_up_to = self._max_indexed_id()
+            if indexed_up_to >= self.history.next_id:
+                # history was reset behind our back (files removed), the index no longer matches it
+                logger.warning("History index is ahead of the history, rebuilding it")
+                self._wipe()
+                indexed_up_to = 0
+            batch = []
+            added = 0
+            for entry in self.history.iter_since(indexed_up_to):
+                batch.append(entry)
+                if len(batch) >= self.BUILD_BATCH:
+                    self._insert(batch)
+                    added += len(batch)
+                    batch = []
+            self._insert(batch)
+            added += len(batch)
+            logger.info(f"History index up to date: {added} entries added in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            logger.error(f"Building the history index failed: {e}", exc_info=True)
+        finally:
+            self.building = False
+
+    def search(self, text: str, limit: int = 100, since: float = None, until: float = None):
+        """
+        Entries whose query or result contain every word of `text` (the last word as a prefix),
+        best matches first, optionally limited to timestamps in [since, until) as epoch seconds.
+        Empty `text` lists the newest entries in the range instead.
+        """
+        match = fts_query(text)
+        with self._read_lock:
+            if self._closed:
+                return []
+            try:
+                low, high = self._id_range(since, until)
+                if low > high:
+                    return []
+                if match:
+                    rows = self._ranked_search(match, low, high, limit)
+                else:
+                    rows = self._reader.execute(
+                        "SELECT id, timestamp, query, result FROM entries WHERE id BETWEEN ? AND ? ORDER BY id DESC LIMIT ?",
+                        (low, high, limit)).fetchall()
+            except sqlite3.Error as e:
+                logger.warning(f"History search for {text!r} failed: {e}")
+                return []
+        return [{"id": row[0], "timestamp": row[1], "query": row[2], "result": row[3]} for row in rows]
+
+    def _id_range(self, since: float, until: float):
+        """
+        The [since, until) time range as an inclusive id range, through the ts index. Ids are
+        handed out in the order entries are added, so they follow time; that lets the FTS
+        queries below bound rowids instead of joining every match against `entries`.
+        """
+        low, high = 0, self.history.next_id
+        if since is not None:
+            row = self._reader.execute("SELECT MIN(id) FROM entries WHERE ts >= ?", (int(since),)).fetchone()
+            low = high + 1 if row[0] is None else row[0]
+        if until is not None:
+            row = self._reader.execute("SELECT MAX(id) FROM entries WHERE ts < ?", (int(until),)).fetchone()
+            high = -1 if row[0] is None else row[0]
+        return low, high
+
+    def _ranked_search(self, match: str, low: int, high: int, limit: int):
+        """bm25-ordered matches with ids in [low, high] among the newest RANK_WINDOW; caller holds the read lock."""
+        # the window is everything from the RANK_WINDOW-th newest match on; FTS5 applies rowid
+        # bounds while reading the index, so matches outside it are never scored
+        row = self._reader.execute(
+            "SELECT rowid FROM entries_fts WHERE entries_fts MATCH ? AND rowid BETWEEN ? AND ? ORDER BY rowid DESC LIMIT 1 OFFSET ?",
+            (match, low, high, self.RANK_WINDOW - 1)).fetchone()
+        if row is not None:
+            low = row[0]
+        # rank on the FTS table alone and only fetch the text of the rows that make the cut
+        return self._reader.execute(
+            "SELECT e.id, e.timestamp, e.query, e.result FROM ("
+            "  SELECT rowid, bm25(entries_fts, ?, 1.0) AS score FROM entries_fts"
+            "  WHERE entries_fts MATCH ? AND rowid BETWEEN ? AND ? ORDER BY score LIMIT ?"
+            ") AS ranked JOIN entries e ON e.id = ranked.rowid ORDER BY ranked.score",
+            (self.QUERY_WEIGHT, match, low, high, limit)).fetchall()
+
+    def close(self):
+        self._closed = True
+        if self._build_thread is not None:
+            self._build_thread.join(timeout=5)
+        with self._write_lock:
+            self._writer.close()
+        with self._read_lock:
+            self._reader.close()
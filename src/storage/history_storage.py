@@ -1,18 +1,68 @@
 import os
 import json
+import gzip
 import logging
+import threading
+import time
+from collections import deque
 from datetime import datetime
+from .persistence_service import PersistenceService, default_service
 
 logger = logging.getLogger(__name__)
 
+SEGMENT_PREFIX = "history-"
+SEGMENT_SUFFIX = ".jsonl"
+COMPRESSED_SUFFIX = ".jsonl.gz"
+
+
+def _segment_first_id(file_name: str):
+    """First entry id encoded in a segment file name, or None if it isn't a segment."""
+    if not file_name.startswith(SEGMENT_PREFIX):
+        return None
+    for suffix in (COMPRESSED_SUFFIX, SEGMENT_SUFFIX):
+        if file_name.endswith(suffix):
+            try:
+                return int(file_name[len(SEGMENT_PREFIX):-len(suffix)])
+            except ValueError:
+                return None
+    return None
+
+
+def _parse_lines(lines):
+    """Decodes JSON lines, skipping blank or damaged ones (e.g. a line cut short by a crash)."""
+    entries = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            entries.append(json.loads(line))
+        except json.JSONDecodeError:
+            logger.warning("Skipping damaged history line")
+    return entries
+
+
 class HistoryStorage:
-    """Handles loading, saving, and managing prompt generation history."""
-    def __init__(self, file_name="history.json", max_entries=100):
+    """
+    Prompt generation history as an append-only log of JSON-lines segments.
+
+    Each entry gets an increasing `id` and is appended as one line to the active segment
+    (history/history-<first id>.jsonl), so adding one costs the same no matter how long the
+    history is. When the active segment passes `segment_max_bytes` a new one is started and
+    the finished one is optionally gzipped; segments older than `retention_days` are dropped
+    (0 keeps everything). Appends and maintenance run on the PersistenceService thread.
+
+    Only the newest `tail_size` entries are kept in memory, read from the last segment(s) at
+    startup, so startup doesn't depend on how much history there is. Older entries are read
+    on demand with `get_page()`. An old history.json is imported on first start.
+    """
+    def __init__(self, file_name="history.json", tail_size=500, segment_max_bytes=1024 * 1024,
+                 compress_segments=True, retention_days=0, persistence: PersistenceService = None):
         try:
             app_data_dir = os.getenv('APPDATA')
             if not app_data_dir:
                 app_data_dir = os.path.expanduser('~')
-            
+
             self.storage_dir = os.path.join(app_data_dir, 'PromptAssist')
             if not os.path.exists(self.storage_dir):
                 os.makedirs(self.storage_dir)
@@ -22,59 +72,327 @@ class HistoryStorage:
             if not os.path.exists(self.storage_dir):
                 os.makedirs(self.storage_dir)
 
-        self.file_path = os.path.join(self.storage_dir, file_name)
-        self.max_entries = max_entries
-        self.history = []
+        self.file_path = os.path.join(self.storage_dir, file_name) # legacy single-file history, only read for migration
+        self.segment_dir = os.path.join(self.storage_dir, 'history')
+        os.makedirs(self.segment_dir, exist_ok=True)
+        self.tail_size = max(1, tail_size)
+        self.segment_max_bytes = segment_max_bytes
+        self.compress_segments = compress_segments
+        self.retention_days = retention_days
+        self.persistence = persistence or default_service()
+        self.tail = deque(maxlen=self.tail_size) # newest entries, oldest on the left
+        self._next_id = 1
+        self._floor_id = 0 # entries below this id were cleared, even if their segments aren't deleted yet
+        self._ops = [] # ("append", entry) / ("clear", None) waiting for the writer, in order
+        self._ops_lock = threading.Lock()
+        self._active_path = None # segment the writer appends to; only touched on the writer thread
+        self._active_size = 0
+        self._written_id = 0 # highest id known to be on disk; also writer-thread only
+        self._listeners = [] # callbacks run with each new entry, or None when the history is cleared
         self._load()
 
+    def add_listener(self, callback):
+        """Registers a callback taking the added entry dict (or None after clear())."""
+        self._listeners.append(callback)
+
+    def _notify_listeners(self, entry):
+        for callback in self._listeners:
+            try:
+                callback(entry)
+            except Exception as e:
+                logger.error(f"History change listener failed: {e}", exc_info=True)
+
+    def _segments(self):
+        """(first id, path) of every segment, newest first."""
+        segments = []
+        for file_name in os.listdir(self.segment_dir):
+            first_id = _segment_first_id(file_name)
+            if first_id is not None:
+                segments.append((first_id, os.path.join(self.segment_dir, file_name)))
+        segments.sort(reverse=True)
+        return segments
+
+    def _read_segment(self, path: str):
+        """All entries of one segment, oldest first."""
+        try:
+            if path.endswith(COMPRESSED_SUFFIX):
+                with gzip.open(path, 'rt', encoding='utf-8') as f:
+                    return _parse_lines(f)
+            with open(path, 'r', encoding='utf-8') as f:
+                return _parse_lines(f)
+        except FileNotFoundError:
+            # compressed by the writer while we were listing, read the new file instead
+            if path.endswith(SEGMENT_SUFFIX) and os.path.exists(path[:-len(SEGMENT_SUFFIX)] + COMPRESSED_SUFFIX):
+                return self._read_segment(path[:-len(SEGMENT_SUFFIX)] + COMPRESSED_SUFFIX)
+            return []
+        except (OSError, EOFError, UnicodeDecodeError) as e:
+            logger.error(f"Could not read history segment {path}: {e}")
+            return []
+
     def _load(self):
-        """Loads history from the JSON file."""
+        """Reads just enough of the newest segments to fill the in-memory tail."""
+        segments = self._segments()
+        if not segments:
+            self._migrate_legacy_file()
+            segments = self._segments()
+
+        newest_first = []
+        for index, (first_id, path) in enumerate(segments):
+            if index == 0 and path.endswith(SEGMENT_SUFFIX):
+                self._repair_active_segment(path)
+            entries = self._read_segment(path)
+            if index == 0:
+                self._next_id = max([first_id] + [entry.get("id", 0) + 1 for entry in entries[-1:]])
+            newest_first.extend(reversed(entries))
+            if len(newest_first) >= self.tail_size:
+                break
+        self.tail.extend(reversed(newest_first[:self.tail_size]))
+        self._written_id = self._next_id - 1
+        logger.info(f"History loaded: {len(self.tail)} recent entries from {self.segment_dir}, next id {self._next_id}")
+
+    def _repair_active_segment(self, path: str):
+        """Cuts off a partial last line left by a crash mid-append, so the next append starts on a fresh line."""
+        try:
+            with open(path, 'rb+') as f:
+                size = f.seek(0, os.SEEK_END)
+                if size == 0:
+                    return
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) == b"\n":
+                    return
+                f.seek(max(0, size - self.segment_max_bytes))
+                data = f.read()
+                cut = size - len(data) + data.rfind(b"\n") + 1
+                f.truncate(cut)
+                logger.warning(f"Removed a partially written entry at the end of {path}")
+        except OSError as e:
+            logger.error(f"Could not check history segment {path}: {e}")
+
+    def _migrate_legacy_file(self):
+        """Imports history.json (newest first, no ids) into the first segment and renames it."""
         if not os.path.exists(self.file_path):
-            logger.info("History file not found. A new one will be created.")
             return
-
         try:
             with open(self.file_path, 'r', encoding='utf-8') as f:
-                self.history = json.load(f)
-                logger.info(f"History loaded from {self.file_path}")
+                legacy = json.load(f)
         except (json.JSONDecodeError, IOError) as e:
             logger.error(f"Error loading history from {self.file_path}: {e}. Starting with empty history.")
-            self.history = []
-
-    def _save(self):
-        """Saves the current history to the JSON file."""
-        try:
-            with open(self.file_path, 'w', encoding='utf-8') as f:
-                json.dump(self.history, f, indent=4)
-            logger.debug(f"History saved to {self.file_path}")
-        except IOError as e:
-            logger.error(f"Failed to save history to {self.file_path}: {e}")
+            return
+        if not isinstance(legacy, list):
+            return
+        entries = [dict(entry, id=index) for index, entry in enumerate(reversed(legacy), start=1) if isinstance(entry, dict)]
+        if entries:
+            path = os.path.join(self.segment_dir, f"{SEGMENT_PREFIX}{1:010d}{SEGMENT_SUFFIX}")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(self.file_path, self.file_path + '.migrated')
+        logger.info(f"Migrated {len(entries)} history entries from {self.file_path}")
 
     def add_entry(self, query: str, result: str):
-        """Adds a new entry to the history and saves."""
+        """Adds a new entry to the in-memory tail and queues its append to the log."""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         entry = {
+            "id": self._next_id,
             "timestamp": timestamp,
             "query": query,
             "result": result
         }
-        
-        # Insert new entry at the beginning of the list
-        self.history.insert(0, entry)
-        
-        # Trim the history if it exceeds the maximum number of entries
-        if len(self.history) > self.max_entries:
-            self.history = self.history[:self.max_entries]
-            
-        self._save()
+        self._next_id += 1
+        self.tail.append(entry)
+        self._queue_op("append", entry)
+        self._notify_listeners(entry)
         logger.info(f"Added new entry to history: Query - '{query[:30]}...'")
 
-    def get_all(self):
-        """Returns all history entries."""
-        return self.history
+    def _queue_op(self, op: str, payload):
+        with self._ops_lock:
+            self._ops.append((op, payload))
+        # one key for all history writes, so they run in order and batch up while debounced
+        self.persistence.schedule(("history", self.segment_dir), self._write_pending)
+
+    def _write_pending(self):
+        """
+        Runs on the persistence thread: applies queued appends and clears in order. If a write
+        fails, the ops not done yet go back to the front of the queue, so the service's retry
+        (or the next change) writes them instead of losing them.
+        """
+        with self._ops_lock:
+            ops, self._ops = self._ops, []
+        done = 0 # ops fully applied
+        try:
+            batch = []
+            for index, (op, payload) in enumerate(ops):
+                if op == "append":
+                    batch.append(payload)
+                    continue
+                self._append(batch)
+                batch = []
+                done = index
+                self._delete_segments()
+                done = index + 1
+            self._append(batch)
+        except BaseException:
+            with self._ops_lock:
+                self._ops[:0] = ops[done:]
+            raise
+
+    def _append(self, entries):
+        # entries a failed earlier attempt already got to disk are skipped, so a retry doesn't duplicate them
+        lines = []
+        pending_size = 0
+        last_id = None
+        for entry in entries:
+            if entry["id"] <= self._written_id:
+                continue
+            if self._active_path is None:
+                self._open_active_segment(entry["id"])
+            elif self._active_size + pending_size >= self.segment_max_bytes:
+                self._write_lines(lines, last_id)
+                lines = []
+                pending_size = 0
+                self._rotate(entry["id"])
+            line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+            lines.append(line)
+            pending_size += len(line)
+            last_id = entry["id"]
+        self._write_lines(lines, last_id)
+
+    def _write_lines(self, lines, last_id: int):
+        if not lines:
+            return
+        data = b"".join(lines)
+        # unbuffered, so nothing is left in a buffer to be written after a failure is handled
+        with open(self._active_path, 'ab', buffering=0) as f:
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[f.write(view):]
+                os.fsync(f.fileno())
+            except BaseException:
+                # cut off whatever part made it, so the retry doesn't append after half a line
+                try:
+                    f.truncate(self._active_size)
+                except OSError:
+                    pass
+                raise
+        self._active_size += len(data)
+        self._written_id = last_id
+
+    def _open_active_segment(self, next_id: int):
+        """Continues the newest plain segment if there is one with room, otherwise starts a new one."""
+        segments = self._segments()
+        if segments and segments[0][1].endswith(SEGMENT_SUFFIX):
+            path = segments[0][1]
+            size = os.path.getsize(path)
+            if size < self.segment_max_bytes:
+                self._active_path, self._active_size = path, size
+                return
+            self._active_path = path
+            self._rotate(next_id)
+            return
+        self._active_path = os.path.join(self.segment_dir, f"{SEGMENT_PREFIX}{next_id:010d}{SEGMENT_SUFFIX}")
+        self._active_size = 0
+
+    def _rotate(self, next_id: int):
+        """Seals the active segment (compressing it if enabled), prunes expired ones and starts the next."""
+        finished = self._active_path
+        self._active_path = os.path.join(self.segment_dir, f"{SEGMENT_PREFIX}{next_id:010d}{SEGMENT_SUFFIX}")
+        self._active_size = 0
+        if finished and self.compress_segments:
+            self._compress(finished)
+        self._prune()
+        logger.info(f"History segment rotated, now writing {os.path.basename(self._active_path)}")
+
+    def _compress(self, path: str):
+        target = path[:-len(SEGMENT_SUFFIX)] + COMPRESSED_SUFFIX
+        temp_path = target + ".tmp"
+        try:
+            with open(path, 'rb') as source, gzip.open(temp_path, 'wb') as destination:
+                destination.write(source.read())
+            os.replace(temp_path, target)
+            os.remove(path)
+        except OSError as e:
+            logger.error(f"Could not compress history segment {path}, keeping it uncompressed: {e}")
+
+    def _prune(self):
+        if self.retention_days <= 0:
+            return
+        cutoff = time.time() - self.retention_days * 86400
+        # the newest segment is never pruned; older ones go once their last write is past retention
+        for _, path in self._segments()[1:]:
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    logger.info(f"Removed expired history segment {os.path.basename(path)}")
+            except OSError as e:
+                logger.warning(f"Could not remove history segment {path}: {e}")
+
+    def _delete_segments(self):
+        for _, path in self._segments():
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.error(f"Could not delete history segment {path}: {e}")
+        self._active_path = None
+        self._active_size = 0
+
+    def get_page(self, limit: int = 100, before_id: int = None):
+        """
+        Returns up to `limit` entries, newest first, with ids below `before_id` (all of them if None).
+        Pass the id of the last entry of one page as `before_id` to get the next.
+        Pages within the in-memory tail don't touch the disk; older ones read only the segments they need.
+        """
+        page = []
+        for entry in reversed(self.tail):
+            if before_id is None or entry["id"] < before_id:
+                page.append(entry)
+                if len(page) >= limit:
+                    return page
+        if len(self.tail) < self.tail_size:
+            return page # a tail that isn't full holds everything there is
+        cutoff = page[-1]["id"] if page else (before_id if before_id is not None else self._next_id)
+        if self.tail:
+            cutoff = min(cutoff, self.tail[0]["id"])
+        for first_id, path in self._segments():
+            if first_id >= cutoff:
+                continue
+            for entry in reversed(self._read_segment(path)):
+                if self._floor_id <= entry.get("id", 0) < cutoff:
+                    page.append(entry)
+                    if len(page) >= limit:
+                        return page
+        return page
+
+    def iter_since(self, after_id: int = 0):
+        """
+        Yields every entry with an id above `after_id`, oldest first, reading only the segments
+        that can hold them. Entries still waiting for the writer come from the in-memory tail.
+        """
+        segments = sorted(self._segments())
+        last_id = after_id
+        for index, (first_id, path) in enumerate(segments):
+            next_first_id = segments[index + 1][0] if index + 1 < len(segments) else None
+            if next_first_id is not None and next_first_id <= after_id + 1:
+                continue # everything in this segment is at or below after_id
+            for entry in self._read_segment(path):
+                entry_id = entry.get("id", 0)
+                if entry_id > last_id and entry_id >= self._floor_id:
+                    last_id = entry_id
+                    yield entry
+        for entry in list(self.tail):
+            if entry["id"] > last_id:
+                last_id = entry["id"]
+                yield entry
+
+    @property
+    def next_id(self) -> int:
+        return self._next_id
 
     def clear(self):
-        """Clears all history entries and saves."""
-        self.history = []
-        self._save()
+        """Clears all history entries and queues deleting the segments."""
+        self.tail.clear()
+        self._floor_id = self._next_id
+        self._queue_op("clear", None)
+        self._notify_listeners(None)
         logger.info("History has been cleared.")
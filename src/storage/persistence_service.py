@@ -0,0 +1,168 @@
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def atomic_write_json(path: str, data, indent: int = 4):
+    """
+    Writes `data` as JSON to a temp file next to `path`, fsyncs it and renames it over `path`,
+    so readers (and a crash at any point) see either the old file or the complete new one.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+class PersistenceService:
+    """
+    Background writer shared by the storage classes so the GUI thread never waits on disk.
+
+    Storages call `schedule(key, write)` with a callable that writes a snapshot taken at call
+    time. Writes are coalesced per key (only the latest callable for a key runs) and debounced:
+    a key is written `delay` seconds after its last change, but never later than `max_delay`
+    seconds after its first unwritten change, so a stream of edits (e.g. typing in a settings
+    field) still reaches disk regularly. A failed write is retried after `max_delay` unless a
+    newer one replaced it.
+
+    `flush()` writes everything pending right away and waits for it, giving each write one try,
+    so a write that keeps failing can't hold up quitting; the app calls it on quit and on
+    SIGINT/SIGTERM, and it also runs at interpreter exit.
+    """
+    def __init__(self, delay: float = 1.0, max_delay: float = 5.0):
+        self.delay = delay
+        self.max_delay = max_delay
+        self._pending = {} # key -> [write callable, due time, deadline, time of its last failure or None]
+        self._writing = 0
+        self._condition = threading.Condition()
+        self._stopped = False
+        self.stats = {"scheduled": 0, "written": 0, "coalesced": 0, "failed": 0}
+        self._thread = threading.Thread(target=self._run, name="PersistenceService", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def schedule(self, key, write, delay: float = None):
+        """Queues `write()` to run on the background thread, replacing any pending write for `key`."""
+        now = time.monotonic()
+        delay = self.delay if delay is None else delay
+        with self._condition:
+            if self._stopped:
+                # after shutdown there's no worker left, so write inline rather than lose it
+                self._run_write(key, write)
+                return
+            self.stats["scheduled"] += 1
+            pending = self._pending.get(key)
+            if pending is None:
+                self._pending[key] = [write, now + delay, now + self.max_delay, None]
+            else:
+                self.stats["coalesced"] += 1
+                pending[0] = write
+                pending[1] = min(now + delay, pending[2])
+                pending[3] = None
+            self._condition.notify()
+
+    def schedule_json(self, key, path: str, data, delay: float = None):
+        """Schedules an atomic JSON write of `data`, which must already be a snapshot the caller won't mutate."""
+        self.schedule(key, lambda: atomic_write_json(path, data), delay)
+
+    def _run(self):
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                due = [key for key, pending in self._pending.items() if pending[1] <= now]
+                if not due:
+                    if self._stopped and not self._pending:
+                        return
+                    timeout = min((pending[1] for pending in self._pending.values()), default=None)
+                    self._condition.wait(None if timeout is None else max(0.0, timeout - now))
+                    continue
+                for key in due:
+                    write = self._pending.pop(key)[0]
+                    self._writing += 1
+                    self._condition.release()
+                    try:
+                        ok = self._run_write(key, write)
+                    finally:
+                        self._condition.acquire()
+                        self._writing -= 1
+                    if not ok and key not in self._pending and not self._stopped:
+                        failed_at = time.monotonic()
+                        retry_at = failed_at + self.max_delay
+                        self._pending[key] = [write, retry_at, retry_at, failed_at]
+                self._condition.notify_all()
+
+    def _run_write(self, key, write) -> bool:
+        try:
+            write()
+            self.stats["written"] += 1
+            return True
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.error(f"Background write for {key} failed: {e}", exc_info=True)
+            return False
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """
+        Writes everything pending now and waits until each write has been tried. Returns False if
+        any of them failed (they stay queued for the usual retry) or `timeout` ran out first.
+        """
+        started = time.monotonic()
+        deadline = started + timeout
+        with self._condition:
+            for pending in self._pending.values():
+                pending[1] = 0.0
+            self._condition.notify_all()
+            # a write that failed during this flush is back in _pending with a later retry, don't wait for that
+            while self._writing or any(pending[3] is None or pending[3] < started for pending in self._pending.values()):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._thread.is_alive():
+                    logger.error(f"Persistence flush gave up with {len(self._pending)} writes pending")
+                    return False
+                self._condition.wait(remaining)
+            if self._pending:
+                logger.error(f"Persistence flush finished with {len(self._pending)} writes failing")
+                return False
+        return True
+
+    def stop(self, timeout: float = 10.0):
+        """Flushes and stops the worker; later writes happen inline on the caller's thread."""
+        if self._stopped:
+            return
+        self.flush(timeout)
+        with self._condition:
+            self._stopped = True
+            if self._pending:
+                # the flush just tried them, a retry now would only keep the worker (and exit) waiting
+                logger.error(f"Dropping {len(self._pending)} writes that keep failing")
+                self._pending.clear()
+            self._condition.notify_all()
+        self._thread.join(timeout)
+
+
+_default_service = None
+_default_lock = threading.Lock()
+
+
+def default_service() -> PersistenceService:
+    """The process-wide service the storage classes use unless they're given one."""
+    global _default_service
+    with _default_lock:
+        if _default_service is None:
+            _default_service = PersistenceService()
+        return _default_service
@@ -0,0 +1,114 @@
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from .history_storage import HistoryStorage
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def normalize_query(user_query: str) -> str:
+    """Collapses runs of whitespace so "fix  my code" and "fix my code " share an entry."""
+    return " ".join(user_query.split())
+
+
+def query_from_command(command: str, llm_keyword: str = "Prompt(") -> str:
+    """
+    Pulls the user query out of a history entry's command (e.g. "::Prompt(fix my code)").
+    Returns "" if the command isn't an LLM command.
+    """
+    start = command.find(llm_keyword)
+    if start == -1 or not command.endswith(")"):
+        return ""
+    return command[start + len(llm_keyword):-1]
+
+
+class PromptCache:
+    """
+    In-memory index of earlier ::Prompt(...) results, built from HistoryStorage.
+
+    Lookups are one dict access on the normalized query, so a repeated prompt can be
+    answered without touching the network. The index is least-recently-used ordered and
+    capped at `max_entries`; results older than `max_age` seconds count as misses.
+    It follows HistoryStorage through a listener, so new results are indexed as soon as
+    they are saved and clearing the history empties the cache too.
+    """
+    def __init__(self, history: HistoryStorage, max_entries: int = 200, max_age: float = 7 * 24 * 3600, refresh_marker: str = "!"):
+        """
+        :param history: HistoryStorage to index; its entries' "query" holds the full command.
+        :param max_entries: Most results kept in memory, least recently used go first.
+        :param max_age: Seconds a result stays usable; 0 or less means results never expire.
+        :param refresh_marker: A query starting with this skips the cache, e.g. "::Prompt(!fix my code)".
+        """
+        self.history = history
+        self.refresh_marker = refresh_marker
+        self.max_entries = max(1, max_entries)
+        self.max_age = max_age
+        self._entries = OrderedDict() # normalized query -> (result, created at as epoch seconds)
+        self.hits = 0
+        self.misses = 0
+        self.rebuild()
+        history.add_listener(self._on_history_changed)
+
+    def rebuild(self):
+        """Reindexes the newest `max_entries` history entries, oldest first so the newest end up most recently used."""
+        self._entries.clear()
+        for entry in reversed(self.history.get_page(limit=self.max_entries)):
+            self._index_entry(entry)
+        logger.info(f"Prompt cache built with {len(self._entries)} entries from history")
+
+    def split_refresh(self, user_query: str):
+        """Returns (query without the refresh marker, whether the marker was there)."""
+        if self.refresh_marker and user_query.startswith(self.refresh_marker):
+            return user_query[len(self.refresh_marker):], True
+        return user_query, False
+
+    def _index_entry(self, entry: dict):
+        user_query, _ = self.split_refresh(query_from_command(entry.get("query", "")))
+        result = entry.get("result")
+        if not user_query or not result:
+            return
+        try:
+            created = datetime.strptime(entry.get("timestamp", ""), HISTORY_TIMESTAMP_FORMAT).timestamp()
+        except ValueError:
+            created = time.time()
+        self.put(user_query, result, created)
+
+    def _on_history_changed(self, entry):
+        if entry is None:
+            self._entries.clear()
+            logger.info("History cleared, prompt cache emptied")
+        else:
+            self._index_entry(entry)
+
+    def get(self, user_query: str):
+        """Returns the cached result for `user_query`, or None if missing or expired."""
+        key = normalize_query(user_query)
+        cached = self._entries.get(key)
+        if cached is not None and self.max_age > 0 and time.time() - cached[1] > self.max_age:
+            del self._entries[key]
+            cached = None
+        if cached is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return cached[0]
+
+    def put(self, user_query: str, result: str, created: float = None):
+        key = normalize_query(user_query)
+        if not key or not result:
+            return
+        self._entries[key] = (result, time.time() if created is None else created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_query: str) -> bool:
+        """Forgets the result for `user_query`. Returns False if there was none."""
+        return self._entries.pop(normalize_query(user_query), None) is not None
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,12 +1,17 @@
 import os
 import json
 import logging
+import threading
+from .persistence_service import PersistenceService, default_service
 
 logger = logging.getLogger(__name__)
 
 class SettingsStorage:
-    """Handles loading and saving application settings from a JSON file."""
-    def __init__(self, file_name="settings.json"):
+    """
+    Handles loading and saving application settings from a JSON file, written in the background.
+    Safe to `set` from worker threads (the text injector saves its learned timings from one).
+    """
+    def __init__(self, file_name="settings.json", persistence: PersistenceService = None):
         try:
             # Prefer AppData for storing user-specific configuration
             app_data_dir = os.getenv('APPDATA')
@@ -27,6 +32,8 @@ class SettingsStorage:
                 os.makedirs(self.storage_dir)
 
         self.file_path = os.path.join(self.storage_dir, file_name)
+        self.persistence = persistence or default_service()
+        self._lock = threading.Lock() # guards changes to self.settings against the snapshot taken for a save
         self.settings = self._get_defaults()
         self._load()
 
@@ -35,6 +42,43 @@ class SettingsStorage:
         return {
             "theme": "Dark",
             "clear_clipboard_on_paste": False,
+            # Snippet commands must start with one of these; the LLM trigger is "<prefix>Prompt("
+            "trigger_prefixes": ["::"],
+            # DEBUG logs every keystroke; keep INFO or higher outside of development
+            "log_level": "INFO",
+            # Write log records from a background thread instead of the calling thread
+            "async_logging": True,
+            # Keyboard events buffered between the OS hook and the matcher worker before dropping
+            "keystroke_queue_size": 1024,
+            # Snippets up to this many characters (and without newlines) are typed instead of pasted
+            "injection_typing_threshold": 64,
+            # Learned per-app paste settle times in seconds, keyed by window class
+            "injection_timings": {},
+            # Backend request timeouts in seconds: connecting, waiting between response bytes, whole request
+            "llm_connect_timeout": 5.0,
+            "llm_read_timeout": 30.0,
+            "llm_total_timeout": 45.0,
+            "llm_http2": True,
+            # Stream the augmented prompt from the backend and show progress while it generates
+            "llm_streaming": True,
+            # How many ::Prompt(...) requests may be in flight at once
+            "max_concurrent_prompts": 3,
+            # Cancels the most recent pending prompt; deleting a placeholder cancels its own request
+            "cancel_prompt_hotkey": "ctrl+alt+backspace",
+            # Answer repeated ::Prompt(...) queries from earlier results in history instead of the backend
+            "prompt_cache_enabled": True,
+            "prompt_cache_max_entries": 200,
+            "prompt_cache_max_age_hours": 168,
+            # Start a query with this to skip the cache and fetch a fresh prompt, e.g. ::Prompt(!fix my code)
+            "prompt_cache_refresh_marker": "!",
+            # History is an append-only log: entries kept in memory, segment size before rotating,
+            # gzip finished segments, and days to keep old segments (0 keeps everything)
+            "history_tail_size": 500,
+            "history_segment_max_kb": 1024,
+            "history_compress_segments": True,
+            "history_retention_days": 0,
+            # Full-text search box on the History page, backed by history_index.db
+            "history_search_enabled": True,
             "blacklisted_apps": [
                 "powershell.exe",
                 "cmd.exe",
@@ -62,19 +106,15 @@ class SettingsStorage:
             self.settings = self._get_defaults()
 
     def _save(self):
-        """Saves the current settings to the JSON file."""
-        try:
-            with open(self.file_path, 'w', encoding='utf-8') as f:
-                json.dump(self.settings, f, indent=4)
-            logger.debug(f"Settings saved to {self.file_path}")
-        except IOError as e:
-            logger.error(f"Failed to save settings to {self.file_path}: {e}")
+        """Queues an atomic write of the current settings; repeated calls within the debounce window become one write."""
+        self.persistence.schedule_json(self.file_path, self.file_path, dict(self.settings))
 
     def get(self, key, default=None):
         """Gets a setting value by key, returning a default if not found."""
         return self.settings.get(key, default)
 
     def set(self, key, value):
-        """Sets a setting value by key and immediately saves to disk."""
-        self.settings[key] = value
-        self._save()
+        """Sets a setting value by key and schedules a save, without waiting for the disk."""
+        with self._lock:
+            self.settings[key] = value
+            self._save()
@@ -2,20 +2,47 @@ import os
 #this is to handle file paths and dir
 import json
 import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from .persistence_service import PersistenceService, default_service
 logger = logging.getLogger(__name__)
 
+DEFAULT_SNIPPETS = {
+    "::emailStarter": """Hello, \n I hope this email finds you well.
+                I am writing this email because """
+}
+
+SCHEMA_VERSION = 1
+
+
 class SnippetStorage:
+    """
+    Snippet library stored in SQLite (snippets.db next to the old config.json).
+
+    Every save or delete is one row written in its own transaction, so the cost doesn't grow
+    with the size of the library, and with the WAL journal a crash or power cut mid-write
+    leaves either the old or the new row, never a half-written file. Commands are the table's
+    primary key, so looking one up in the database is an index lookup.
+
+    `snippets` is an in-memory dict mirroring the table: it's loaded with one query at startup
+    and updated right away on save/delete, while the row itself is written on the shared
+    PersistenceService thread (repeated edits of one snippet coalesce into one write). The
+    keystroke listener and UI keep reading the dict directly. An existing config.json is imported on first start and renamed to
+    config.json.migrated afterwards.
+    """
     #init is special method constructor. Initialize object attributes
-    #"self" muist be included in param because unlike java compiler 
+    #"self" muist be included in param because unlike java compiler
     # doesn't add it for you to use in all methods
-    def __init__(self):
+    def __init__(self, db_name: str = 'snippets.db', persistence: PersistenceService = None):
         try:
             app_data_dir = os.getenv('APPDATA')
             if not app_data_dir:
                 # Fallback to user's home directory if APPDATA is not available
                 app_data_dir = os.path.expanduser('~')
                 logger.warning("APPDATA environment variable not found. Using home directory.")
-            
+
             self.config_dir = os.path.join(app_data_dir, 'PromptAssist')
             if not os.path.exists(self.config_dir):
                 os.makedirs(self.config_dir)
@@ -27,33 +54,153 @@ class SnippetStorage:
             if not os.path.exists(self.config_dir):
                 os.makedirs(self.config_dir)
 
-        self.config_path = os.path.join(self.config_dir, 'config.json')
+        self.config_path = os.path.join(self.config_dir, 'config.json') # legacy store, only read for migration
+        self.db_path = os.path.join(self.config_dir, db_name)
+        self.persistence = persistence or default_service()
+        # the UI writes from the Qt thread, reads of `snippets` happen on the listener threads
+        self._lock = threading.Lock()
+        self._conn = self._connect()
         self.snippets = self._load()
+        self._listeners = [] # callbacks run whenever a snippet is saved or deleted
 
-    def _load(self):
+    def add_listener(self, callback):
+        """Registers a no-argument callback to run after the snippets change."""
+        self._listeners.append(callback)
+
+    def _notify_listeners(self):
+        for callback in self._listeners:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Snippet change listener failed: {e}", exc_info=True)
+
+    def _connect(self) -> sqlite3.Connection:
+        try:
+            return self._open_database()
+        except sqlite3.DatabaseError as e:
+            # Not a database any more (e.g. overwritten by something else): keep it for inspection and start over
+            broken_path = f"{self.db_path}.corrupt-{int(time.time())}"
+            logger.critical(f"Snippet database {self.db_path} is unreadable ({e}), moving it to {broken_path}")
+            # the WAL and shared-memory files go with it, or SQLite would replay the old WAL into the new database
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(self.db_path + suffix):
+                    os.replace(self.db_path + suffix, broken_path + suffix)
+            return self._open_database()
+
+    def _open_database(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            # with WAL, NORMAL can lose the last commit on power loss but never corrupts the file
+            conn.execute("PRAGMA synchronous=NORMAL")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < SCHEMA_VERSION:
+                self._create_schema(conn)
+        except sqlite3.DatabaseError:
+            conn.close()
+            raise
+        return conn
+
+    def _create_schema(self, conn: sqlite3.Connection):
+        """Creates the table and fills it from config.json (or the default snippet) in one transaction."""
+        snippets = self._read_legacy_json()
+        migrated = snippets is not None
+        if snippets is None:
+            snippets = DEFAULT_SNIPPETS
+        now = time.time()
+        with self._transaction(conn):
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS snippets (
+                    command TEXT PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                ) WITHOUT ROWID
+            """)
+            conn.executemany(
+                "INSERT OR IGNORE INTO snippets (command, text, updated_at) VALUES (?, ?, ?)",
+                ((command, text, now) for command, text in snippets.items()),
+            )
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        if migrated:
+            logger.info(f"Migrated {len(snippets)} snippets from {self.config_path} to {self.db_path}")
+            try:
+                # keep it around as a backup, but out of the way so it's never imported twice
+                os.replace(self.config_path, self.config_path + '.migrated')
+            except OSError as e:
+                logger.warning(f"Could not rename {self.config_path} after migrating it: {e}")
+
+    def _read_legacy_json(self):
+        """Snippets from the old config.json, or None if there is none to migrate."""
         try:
             #with open is basically auto open + close otgether
-            with open(self.config_path, 'r') as file:
-                #the json.load function 
+            with open(self.config_path, 'r', encoding='utf-8') as file:
+                #the json.load function
                 # returns dictionary which is kind of like java hashmap key value pair
-                return json.load(file)
+                data = json.load(file)
         except FileNotFoundError:
-            #return default snippet
-            return {
-                "::emailStarter": """Hello, \n I hope this email finds you well.
-                I am writing this email because """
-            }
+            return None
+        except (json.JSONDecodeError, UnicodeDecodeError, OSError) as e:
+            logger.error(f"Could not read {self.config_path} for migration: {e}. Starting with the default snippets.")
+            return None
+        if not isinstance(data, dict):
+            logger.error(f"{self.config_path} does not contain a snippet mapping, skipping migration.")
+            return None
+        return {str(command): str(text) for command, text in data.items()}
+
+    def _load(self):
+        with self._lock:
+            return dict(self._conn.execute("SELECT command, text FROM snippets"))
+
     def save(self, command, text):
+        if not isinstance(text, str):
+            # the row is written later on another thread, so reject bad values while the caller can still see it
+            raise TypeError(f"Snippet text must be a string, got {type(text).__name__}")
         self.snippets[command] = text
-        with open(self.config_path, 'w') as file:
-            json.dump(self.snippets, file, indent = 4)
+        self._schedule_write(command, text)
+        self._notify_listeners()
 
     def delete (self, command):
         if command in self.snippets:
             del self.snippets[command]
-            self._save_to_file()
+            self._schedule_write(command, None)
+            self._notify_listeners()
+
+    def _schedule_write(self, command, text):
+        """Queues the row change for `command`; text None deletes it. A newer change to the same command replaces it."""
+        self.persistence.schedule(("snippet", self.db_path, command), lambda: self._write_row(command, text))
+
+    def _write_row(self, command, text):
+        with self._lock:
+            with self._transaction(self._conn):
+                if text is None:
+                    self._conn.execute("DELETE FROM snippets WHERE command = ?", (command,))
+                else:
+                    self._conn.execute(
+                        "INSERT INTO snippets (command, text, updated_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT(command) DO UPDATE SET text = excluded.text, updated_at = excluded.updated_at",
+                        (command, text, time.time()),
+                    )
+
+    @staticmethod
+    @contextmanager
+    def _transaction(conn: sqlite3.Connection):
+        """Explicit transaction on an autocommit connection: everything inside lands together or not at all."""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
 
-    def _save_to_file(self):
-        #save entire dictionary to file
-        with open(self.config_path, 'w') as file:
-            json.dump(self.snippets, file, indent=4)
+    def close(self):
+        """
+        Checkpoints the WAL into the main file and closes the database. Pending changes are
+        written by flushing the persistence service first, which the app does once for all storages.
+        """
+        with self._lock:
+            try:
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except sqlite3.Error as e:
+                logger.warning(f"Could not checkpoint snippet database: {e}")
+            self._conn.close()
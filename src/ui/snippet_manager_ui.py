@@ -2,24 +2,32 @@ from PySide6.QtWidgets import (
     QApplication, QWidget, QListWidget, QTextEdit, QVBoxLayout, 
     QPushButton, QInputDialog, QMessageBox, QHBoxLayout, QStackedWidget, QLabel,
     QFormLayout, QComboBox, QCheckBox, QPlainTextEdit, QTableWidget, QHeaderView,
-    QTableWidgetItem, QAbstractItemView
+    QTableWidgetItem, QAbstractItemView, QLineEdit
 )
 from PySide6.QtGui import QIcon, QAction
 from PySide6.QtCore import Qt, Slot
 import os
+import time
 
 from ..storage.snippet_storage import SnippetStorage
 from ..storage.settings_storage import SettingsStorage
 from ..storage.history_storage import HistoryStorage
+from ..storage.history_index import HistoryIndex
 from .frameless_window import FramelessWindow
 from ..core.resource_handler import get_path_for_resource
 
 class SnippetUI(QWidget):
-    def __init__(self, storage: SnippetStorage, settings: SettingsStorage, history: HistoryStorage, parent=None):
+    HISTORY_PAGE_SIZE = 100
+    # label -> how far back the history search looks, in seconds (None: no limit)
+    HISTORY_RANGES = {"Any time": None, "Today": 24 * 3600, "Last 7 days": 7 * 24 * 3600, "Last 30 days": 30 * 24 * 3600, "Last year": 365 * 24 * 3600}
+
+    def __init__(self, storage: SnippetStorage, settings: SettingsStorage, history: HistoryStorage, history_index: HistoryIndex = None, parent=None):
         super().__init__(parent)
         self.storage = storage
         self.settings = settings
         self.history = history
+        self.history_index = history_index # None disables the search box
+        self._history_oldest_id = None # id of the last row shown, the next page starts below it
         self._init_ui()
 
     def _init_ui(self):
@@ -136,6 +144,22 @@ class SnippetUI(QWidget):
         page = QWidget()
         layout = QVBoxLayout(page)
 
+        # --- Search Box and Time Range ---
+        search_layout = QHBoxLayout()
+        self.history_search_edit = QLineEdit()
+        self.history_search_edit.setPlaceholderText("Search queries and results...")
+        self.history_search_edit.setClearButtonEnabled(True)
+        self.history_search_edit.textChanged.connect(self._refresh_history_table)
+        search_layout.addWidget(self.history_search_edit)
+        self.history_range_combo = QComboBox()
+        self.history_range_combo.addItems(list(self.HISTORY_RANGES))
+        self.history_range_combo.currentIndexChanged.connect(self._refresh_history_table)
+        search_layout.addWidget(self.history_range_combo)
+        if self.history_index is None:
+            self.history_search_edit.setEnabled(False)
+            self.history_range_combo.setEnabled(False)
+        layout.addLayout(search_layout)
+
         # --- Table for History ---
         self.history_table = QTableWidget()
         self.history_table.setColumnCount(3)
@@ -159,30 +183,56 @@ class SnippetUI(QWidget):
 
         layout.addWidget(self.history_table)
 
-        # --- Clear History Button ---
+        # --- Load More / Clear History Buttons ---
+        buttons_layout = QHBoxLayout()
+        self.load_more_history_button = QPushButton("Load More")
+        self.load_more_history_button.clicked.connect(self._load_more_history)
+        buttons_layout.addWidget(self.load_more_history_button)
+        buttons_layout.addStretch()
         self.clear_history_button = QPushButton("Clear All History")
         self.clear_history_button.clicked.connect(self._clear_history)
-        layout.addWidget(self.clear_history_button, alignment=Qt.AlignmentFlag.AlignRight)
+        buttons_layout.addWidget(self.clear_history_button)
+        layout.addLayout(buttons_layout)
 
         return page
 
     def _on_page_changed(self, index):
         """Slot to refresh data when a page becomes visible."""
-        # Index 2 corresponds to the History page
-        if index == 2:
+        if self.pages.widget(index) is self.history_page:
             self._refresh_history_table()
 
     def _refresh_history_table(self):
-        """Reloads all entries from history storage into the table."""
+        """Reloads the table: search results if a search or time range is set, otherwise the newest page."""
         self.history_table.setRowCount(0) # Clear table
-        history_entries = self.history.get_all()
-        self.history_table.setRowCount(len(history_entries))
+        self._history_oldest_id = None
+        search_text = self.history_search_edit.text().strip()
+        max_age = self.HISTORY_RANGES.get(self.history_range_combo.currentText())
+        if self.history_index is not None and (search_text or max_age):
+            since = time.time() - max_age if max_age else None
+            # ranked matches straight from the index; one capped list, so no Load More
+            self._add_history_rows(self.history_index.search(search_text, limit=500, since=since))
+            self.load_more_history_button.setEnabled(False)
+            return
+        self._load_more_history()
 
-        for row, entry in enumerate(history_entries):
+    def _add_history_rows(self, history_entries):
+        first_row = self.history_table.rowCount()
+        self.history_table.setRowCount(first_row + len(history_entries))
+
+        for row, entry in enumerate(history_entries, start=first_row):
             self.history_table.setItem(row, 0, QTableWidgetItem(entry.get("timestamp", "")))
             self.history_table.setItem(row, 1, QTableWidgetItem(entry.get("query", "")))
             self.history_table.setItem(row, 2, QTableWidgetItem(entry.get("result", "")))
 
+    def _load_more_history(self):
+        """Appends the next (older) page of history entries below the ones already shown."""
+        history_entries = self.history.get_page(limit=self.HISTORY_PAGE_SIZE, before_id=self._history_oldest_id)
+        self._add_history_rows(history_entries)
+        if history_entries:
+            self._history_oldest_id = history_entries[-1].get("id")
+        # a short page means there's nothing older left
+        self.load_more_history_button.setEnabled(len(history_entries) == self.HISTORY_PAGE_SIZE)
+
     def _copy_history_result(self):
         """Copies the result from the selected history row to the clipboard."""
         selected_items = self.history_table.selectedItems()
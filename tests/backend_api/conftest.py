@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+# backend_api.main reads its Settings at import: run it on the fake model and in-process Redis
+for name, value in {
+    "VERTEX_AI_PROJECT": "test-project",
+    "VERTEX_AI_LOCATION": "us-central1",
+    "LLM_MODEL_NAME": "gemini-test",
+    "SYSTEM_INSTRUCTION": "You rewrite prompts.",
+    "MAX_OUTPUT_TOKENS": "256",
+    "TEMPERATURE": "0.2",
+    "API_RETRY_COUNT": "0",
+    "BACKEND_API_KEY": "test-key",
+    "REDIS_URL": "memory://",
+    "USE_FAKE_VERTEX": "true",
+    "FAKE_VERTEX_LATENCY": "0",
+    "FAKE_VERTEX_CHUNK_DELAY": "0",
+    "RESPONSE_CACHE_ENABLED": "false",
+    "WARMUP_ENABLED": "false",
+}.items():
+    os.environ.setdefault(name, value)
+
+from backend_api.settings import Settings
+
+
+def make_settings(**overrides) -> Settings:
+    """Settings that don't depend on a .env file: fake project, no retry delays, nothing optional switched on."""
+    values = dict(
+        VERTEX_AI_PROJECT="test-project",
+        VERTEX_AI_LOCATION="us-central1",
+        LLM_MODEL_NAME="gemini-test",
+        SYSTEM_INSTRUCTION="You rewrite prompts.",
+        MAX_OUTPUT_TOKENS=256,
+        TEMPERATURE=0.2,
+        API_RETRY_COUNT=2,
+        BACKEND_API_KEY="test-key",
+        REDIS_URL="memory://",
+        RETRY_BASE_DELAY_SECONDS=0.0,
+        RETRY_MAX_DELAY_SECONDS=0.0,
+        HEDGE_ENABLED=False,
+        WARMUP_ENABLED=False,
+        RESPONSE_CACHE_ENABLED=False,
+    )
+    values.update(overrides)
+    return Settings(_env_file=None, **values)
+
+
+@pytest.fixture
+def settings():
+    return make_settings()
+
+
+@pytest.fixture
+def api():
+    """TestClient for the app with its lifespan run, sending the test API key."""
+    from fastapi.testclient import TestClient
+    from backend_api import main
+
+    with TestClient(main.app, headers={"X-API-KEY": "test-key"}) as client:
+        yield client
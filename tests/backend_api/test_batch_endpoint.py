@@ -0,0 +1,38 @@
+from backend_api import main
+
+BATCH = "/api/v1/generate-prompt/batch"
+
+
+def batch_of(size):
+    return {"items": [{"user_query": f"query {index}"} for index in range(size)]}
+
+
+def test_batch_answers_in_request_order(api):
+    response = api.post(BATCH, json=batch_of(3))
+    assert response.status_code == 200
+    body = response.json()
+    assert body["succeeded"] == 3 and body["failed"] == 0
+    assert [result["augmented_prompt"] for result in body["results"]] == [f"Augmented prompt for: query {index}" for index in range(3)]
+
+
+def test_batch_items_are_charged_to_the_single_endpoint_limit(api):
+    assert api.post(BATCH, json=batch_of(main.settings.BATCH_MAX_ITEMS)).status_code == 200
+    response = api.post("/api/v1/generate-prompt", json={"user_query": "one more"})
+    assert response.status_code == 429
+
+
+def test_unavailable_model_is_not_charged(api):
+    api.app.state.vertex_ai_client = None
+    assert api.post(BATCH, json=batch_of(5)).status_code == 503
+    assert api.app.state.rate_limiter.stats["allowed"] == 0
+
+
+def test_batch_above_the_maximum_is_rejected_before_charging(api):
+    response = api.post(BATCH, json=batch_of(main.settings.BATCH_MAX_ITEMS + 1))
+    assert response.status_code == 413
+    assert api.app.state.rate_limiter.stats["allowed"] == 0
+
+
+def test_batch_requires_the_api_key(api):
+    response = api.post(BATCH, json=batch_of(1), headers={"X-API-KEY": "wrong"})
+    assert response.status_code == 401
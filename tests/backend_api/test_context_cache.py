@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+from backend_api.context_cache import SystemInstructionCache
+from backend_api.fake_genai import FakeAPIError, FakeGenaiClient
+from backend_api.vertex_ai_client import VertexAIClient
+from .conftest import make_settings
+
+INSTRUCTION = "You rewrite prompts. " * 50
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def cached_client(fake, **overrides) -> VertexAIClient:
+    return VertexAIClient(make_settings(CONTEXT_CACHE_ENABLED=True, SYSTEM_INSTRUCTION=INSTRUCTION, API_RETRY_COUNT=0, **overrides), client=fake)
+
+
+def test_requests_reference_the_cached_instruction():
+    fake = FakeGenaiClient()
+    client = cached_client(fake)
+
+    async def scenario():
+        await client.generate_prompt_async("first")
+        await client.generate_prompt_async("second")
+
+    run(scenario())
+    assert len(fake.aio.caches.entries) == 1
+    stats = client.get_usage_stats()
+    assert stats["cached"]["requests"] == 2 and stats["inline"]["requests"] == 0
+    assert stats["cached"]["cached_tokens"] == 2 * fake.count_tokens_of(INSTRUCTION)
+    assert stats["cache"]["created"] == 1
+
+
+def test_too_small_instruction_stays_inline():
+    fake = FakeGenaiClient(min_cache_tokens=10_000)
+    client = cached_client(fake)
+
+    assert run(client.generate_prompt_async("hello")) == "Augmented prompt for: hello"
+    stats = client.get_usage_stats()
+    assert stats["inline"]["requests"] == 1 and stats["cached"]["requests"] == 0
+    assert stats["cache"]["errors"] == 1
+
+
+def test_expired_cache_is_retried_inline_and_recreated():
+    fake = FakeGenaiClient()
+    client = cached_client(fake)
+
+    async def scenario():
+        await client.generate_prompt_async("first")
+        fake.aio.caches.entries.clear() # gone on Vertex's side, e.g. expired early
+        second = await client.generate_prompt_async("second")
+        await client.generate_prompt_async("third")
+        return second
+
+    assert run(scenario()) == "Augmented prompt for: second"
+    stats = client.get_usage_stats()
+    assert stats["cache"]["invalidated"] == 1
+    assert stats["inline"]["requests"] == 1 # the retry of the second request
+    assert stats["cached"]["requests"] == 2 # first, and third on the new cache
+    assert stats["cache"]["created"] == 2
+
+
+def test_other_bad_requests_do_not_drop_the_cache():
+    fake = FakeGenaiClient()
+    client = cached_client(fake)
+    run(client.generate_prompt_async("warm"))
+    fake.fail_first, fake.error_code = fake.calls + 1, 400
+
+    with pytest.raises(FakeAPIError):
+        run(client.generate_prompt_async("too long"))
+    assert fake.calls == 2 # not retried inline
+    assert client.get_usage_stats()["cache"]["invalidated"] == 0
+
+
+def test_missing_cache_errors_are_recognised():
+    assert VertexAIClient._is_missing_cache_error(FakeAPIError(404))
+    assert VertexAIClient._is_missing_cache_error(FakeAPIError(400, "Cached content projects/p/cachedContents/1 has expired"))
+    assert not VertexAIClient._is_missing_cache_error(FakeAPIError(400, "The input token count exceeds the maximum"))
+    assert not VertexAIClient._is_missing_cache_error(FakeAPIError(503))
+
+
+def test_cache_is_refreshed_before_expiry():
+    fake = FakeGenaiClient()
+    cache = SystemInstructionCache(fake, ttl=3600, refresh_margin=300)
+
+    async def scenario():
+        name = await cache.current("gemini-test", INSTRUCTION)
+        cache._expires_at -= 3400 # now inside the refresh margin
+        assert await cache.current("gemini-test", INSTRUCTION) == name
+
+    run(scenario())
+    assert cache.stats["refreshed"] == 1 and cache.stats["created"] == 1
+
+
+def test_changed_instruction_rebuilds_the_cache_and_deletes_the_old_one():
+    fake = FakeGenaiClient()
+    cache = SystemInstructionCache(fake)
+
+    async def scenario():
+        old = await cache.current("gemini-test", INSTRUCTION)
+        new = await cache.current("gemini-test", INSTRUCTION + " Be brief.")
+        return old, new
+
+    old, new = run(scenario())
+    assert old != new
+    assert list(fake.aio.caches.entries) == [new]
+    assert fake.aio.caches.entries[new].system_instruction.endswith("Be brief.")
+    assert cache.stats["rebuilt"] == 1 and cache.stats["deleted"] == 1
+
+
+def test_stop_deletes_the_cache():
+    fake = FakeGenaiClient()
+    cache = SystemInstructionCache(fake)
+
+    async def scenario():
+        cache.start(lambda: ("gemini-test", INSTRUCTION))
+        await asyncio.sleep(0.01)
+        assert len(fake.aio.caches.entries) == 1
+        await cache.stop()
+
+    run(scenario())
+    assert fake.aio.caches.entries == {}
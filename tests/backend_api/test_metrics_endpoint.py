@@ -0,0 +1,15 @@
+from backend_api import main
+
+
+def test_metrics_need_the_api_key_by_default(api):
+    assert api.get("/metrics", headers={"X-API-KEY": ""}).status_code == 401
+    response = api.get("/metrics")
+    assert response.status_code == 200
+    assert "# TYPE" in response.text
+
+
+def test_metrics_token_replaces_the_api_key(api, monkeypatch):
+    monkeypatch.setattr(main.settings, "METRICS_TOKEN", "scrape-secret")
+    assert api.get("/metrics").status_code == 401 # the API key alone no longer works
+    assert api.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert api.get("/metrics", headers={"Authorization": "Bearer scrape-secret"}).status_code == 200
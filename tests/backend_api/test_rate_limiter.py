@@ -0,0 +1,113 @@
+import asyncio
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from backend_api.rate_limiter import LocalFirstRateLimiter, RateLimit, client_key, parse_networks
+
+ROUTE = "/api/v1/generate-prompt"
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def make_request(peer: str = "203.0.113.7", forwarded: str = None, path: str = ROUTE) -> Request:
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "method": "POST", "path": path, "headers": headers, "client": (peer, 50000), "query_string": b""})
+
+
+def test_parse_limit():
+    assert RateLimit.parse("20/minute") == RateLimit(20, 60)
+    assert RateLimit.parse("5 / seconds") == RateLimit(5, 1)
+    with pytest.raises(ValueError):
+        RateLimit.parse("lots")
+
+
+def test_requests_over_the_limit_get_429_with_retry_after():
+    limiter = LocalFirstRateLimiter(default="2/minute")
+    request = make_request()
+    run(limiter.check(request))
+    run(limiter.check(request))
+    with pytest.raises(HTTPException) as error:
+        run(limiter.check(request))
+    assert error.value.status_code == 429
+    assert int(error.value.headers["Retry-After"]) >= 1
+
+
+def test_cost_above_the_whole_limit_is_413():
+    limiter = LocalFirstRateLimiter(default="5/minute")
+    with pytest.raises(HTTPException) as error:
+        run(limiter.check(make_request(), cost=6))
+    assert error.value.status_code == 413
+
+
+def test_full_buckets_are_pruned_without_redis(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("backend_api.rate_limiter.time.monotonic", lambda: clock[0])
+    limiter = LocalFirstRateLimiter(default="60/minute")
+    for index in range(100):
+        limiter.hit(ROUTE, f"client-{index}")
+    assert len(limiter._buckets) == 100
+
+    clock[0] += 2 # one token back per second: still owed
+    limiter.hit(ROUTE, "client-new")
+    assert len(limiter._buckets) == 101
+
+    clock[0] += LocalFirstRateLimiter.PRUNE_INTERVAL
+    limiter.hit(ROUTE, "client-new")
+    assert list(limiter._buckets) == [(ROUTE, "client-new")]
+
+
+def test_forwarded_for_is_ignored_from_untrusted_peers():
+    assert client_key(make_request("203.0.113.7", forwarded="198.51.100.1")) == "203.0.113.7"
+
+
+def test_forwarded_for_from_a_trusted_proxy_uses_the_nearest_untrusted_hop():
+    proxies = parse_networks(["10.0.0.0/8"])
+    # the client made up the first entry, our proxy appended the address it actually saw
+    request = make_request("10.0.0.5", forwarded="1.2.3.4, 198.51.100.9, 10.0.0.2")
+    assert client_key(request, proxies) == "198.51.100.9"
+
+
+def test_spoofed_forwarded_for_does_not_get_a_fresh_bucket():
+    limiter = LocalFirstRateLimiter(default="1/minute")
+    run(limiter.check(make_request(forwarded="1.1.1.1")))
+    with pytest.raises(HTTPException):
+        run(limiter.check(make_request(forwarded="2.2.2.2")))
+
+
+def test_sync_shares_counts_between_workers_through_redis():
+    server = fakeredis.FakeServer()
+    first = LocalFirstRateLimiter(fakeredis.aioredis.FakeRedis(server=server), default="5/minute")
+    second = LocalFirstRateLimiter(fakeredis.aioredis.FakeRedis(server=server), default="5/minute")
+
+    async def scenario():
+        for _ in range(4):
+            assert first.hit(ROUTE, "client") is None
+        await first.sync()
+        await second.sync()
+        assert second.hit(ROUTE, "client") is None # nothing known about this client locally yet
+        await second.sync()
+        # 5 used cluster-wide: the second worker's bucket is capped to what's left
+        assert second.hit(ROUTE, "client") is not None
+
+    run(scenario())
+    assert first.stats["syncs"] == 1 and first.redis_healthy
+
+
+def test_redis_failure_falls_back_to_local_limits():
+    class BrokenRedis:
+        def pipeline(self, transaction=False):
+            raise ConnectionError("redis is down")
+
+    limiter = LocalFirstRateLimiter(BrokenRedis(), default="2/minute")
+    assert limiter.hit(ROUTE, "client") is None
+    run(limiter.sync())
+    assert not limiter.redis_healthy
+    assert limiter.stats["sync_errors"] == 1
+    assert limiter.hit(ROUTE, "client") is None
+    assert limiter.hit(ROUTE, "client") is not None
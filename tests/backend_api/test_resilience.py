@@ -0,0 +1,197 @@
+import asyncio
+
+import pytest
+
+from backend_api.fake_genai import FakeAPIError, FakeGenaiClient
+from backend_api.resilience import CircuitBreaker, CircuitOpenError, ResiliencePolicy, UpstreamUnavailableError
+from backend_api.vertex_ai_client import VertexAIClient
+from .conftest import make_settings
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def collect(stream):
+    return "".join([chunk async for chunk in stream])
+
+
+def test_retryable_errors_are_retried_until_success():
+    fake = FakeGenaiClient(fail_first=2, error_code=503)
+    client = VertexAIClient(make_settings(API_RETRY_COUNT=2), client=fake)
+
+    assert run(client.generate_prompt_async("hello")) == "Augmented prompt for: hello"
+    assert fake.calls == 3
+    assert client.resilience.stats["retries"] == 2
+    assert client.resilience.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_exhausted_retries_raise_upstream_unavailable():
+    fake = FakeGenaiClient(fail_first=10, error_code=503)
+    client = VertexAIClient(make_settings(API_RETRY_COUNT=1), client=fake)
+
+    with pytest.raises(UpstreamUnavailableError):
+        run(client.generate_prompt_async("hello"))
+    assert fake.calls == 2
+
+
+def test_bad_requests_are_not_retried_or_counted_by_the_breaker():
+    fake = FakeGenaiClient(fail_first=1, error_code=400)
+    client = VertexAIClient(make_settings(API_RETRY_COUNT=3), client=fake)
+
+    with pytest.raises(FakeAPIError):
+        run(client.generate_prompt_async("hello"))
+    assert fake.calls == 1
+    assert client.resilience.breaker.failures == 0
+
+
+def test_breaker_opens_and_fails_fast_then_recovers_through_a_probe():
+    fake = FakeGenaiClient(fail_first=3, error_code=503)
+    client = VertexAIClient(make_settings(API_RETRY_COUNT=2, BREAKER_FAILURE_THRESHOLD=3, BREAKER_RECOVERY_SECONDS=0.05), client=fake)
+
+    with pytest.raises(UpstreamUnavailableError):
+        run(client.generate_prompt_async("hello"))
+    assert client.resilience.breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(CircuitOpenError):
+        run(client.generate_prompt_async("hello"))
+    assert fake.calls == 3 # failed fast, upstream wasn't called
+
+    run(asyncio.sleep(0.06))
+    assert run(client.generate_prompt_async("hello")) == "Augmented prompt for: hello"
+    assert client.resilience.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_probe_reopens_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_time=0.0)
+    breaker.record_failure()
+    assert breaker.before_call() is True
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def _half_open_policy() -> ResiliencePolicy:
+    policy = ResiliencePolicy(retry_count=0, hedge_enabled=False, breaker_failure_threshold=1, breaker_recovery_time=0.0)
+    policy.breaker.record_failure() # open; with no recovery time the next call is the half-open probe
+    return policy
+
+
+def test_cancelled_probe_hands_the_probe_back():
+    policy = _half_open_policy()
+
+    async def scenario():
+        call = asyncio.ensure_future(policy.call(lambda: asyncio.sleep(10, result="late")))
+        await asyncio.sleep(0.01)
+        assert policy.breaker.state == CircuitBreaker.HALF_OPEN
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        # the next request becomes the new probe instead of being refused forever
+        return await policy.call(lambda: asyncio.sleep(0, result="ok"))
+
+    assert run(scenario()) == "ok"
+    assert policy.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_stream_closed_before_first_chunk_hands_the_probe_back():
+    policy = _half_open_policy()
+
+    async def slow_stream():
+        await asyncio.sleep(10)
+        yield "never"
+
+    async def fast_stream():
+        yield "ok"
+
+    async def scenario():
+        consumer = asyncio.ensure_future(collect(policy.stream(slow_stream)))
+        await asyncio.sleep(0.01)
+        consumer.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await consumer
+        return await collect(policy.stream(fast_stream))
+
+    assert run(scenario()) == "ok"
+    assert policy.breaker.state == CircuitBreaker.CLOSED
+
+
+class FirstCallSlow(FakeGenaiClient):
+    def begin_call(self) -> float:
+        super().begin_call()
+        return 1.0 if self.calls == 1 else 0.0
+
+
+def test_slow_call_is_hedged_and_the_faster_attempt_wins():
+    fake = FirstCallSlow()
+    client = VertexAIClient(make_settings(HEDGE_ENABLED=True, HEDGE_MIN_SAMPLES=5), client=fake)
+    for _ in range(5):
+        client.resilience.latency.record(0.02)
+
+    async def timed():
+        started = asyncio.get_running_loop().time()
+        text = await client.generate_prompt_async("hello")
+        return text, asyncio.get_running_loop().time() - started
+
+    text, seconds = run(timed())
+    assert text == "Augmented prompt for: hello"
+    assert seconds < 0.5
+    assert fake.calls == 2
+    assert client.resilience.stats["hedges"] == 1
+    assert client.resilience.stats["hedge_wins"] == 1
+
+
+def test_no_hedge_before_enough_latency_samples():
+    fake = FakeGenaiClient(latency=0.05)
+    client = VertexAIClient(make_settings(HEDGE_ENABLED=True, HEDGE_MIN_SAMPLES=5), client=fake)
+
+    run(client.generate_prompt_async("hello"))
+    assert fake.calls == 1
+    assert client.resilience.stats["hedges"] == 0
+
+
+def test_stream_is_retried_before_the_first_chunk():
+    fake = FakeGenaiClient(fail_first=1, error_code=503, chunk_size=2)
+    client = VertexAIClient(make_settings(API_RETRY_COUNT=1), client=fake)
+
+    assert run(collect(client.generate_prompt_stream_async("hello there"))) == "Augmented prompt for: hello there"
+    assert fake.calls == 2
+
+
+def test_hung_attempt_times_out_and_is_retried():
+    fake = FirstCallSlow()
+    client = VertexAIClient(make_settings(API_RETRY_COUNT=1, ATTEMPT_TIMEOUT_SECONDS=0.05), client=fake)
+
+    async def timed():
+        started = asyncio.get_running_loop().time()
+        text = await client.generate_prompt_async("hello")
+        return text, asyncio.get_running_loop().time() - started
+
+    text, seconds = run(timed())
+    assert text == "Augmented prompt for: hello"
+    assert seconds < 0.5
+    assert fake.calls == 2
+    assert client.resilience.stats["retries"] == 1
+
+
+def test_hung_attempts_end_in_upstream_unavailable_and_feed_the_breaker():
+    client = VertexAIClient(make_settings(API_RETRY_COUNT=1, ATTEMPT_TIMEOUT_SECONDS=0.02), client=FakeGenaiClient(latency=10))
+
+    with pytest.raises(UpstreamUnavailableError):
+        run(client.generate_prompt_async("hello"))
+    assert client.resilience.breaker.failures == 2
+
+
+def test_stream_that_hangs_before_the_first_chunk_is_retried():
+    policy = ResiliencePolicy(retry_count=1, base_delay=0.0, hedge_enabled=False, attempt_timeout=0.02)
+    opened = []
+
+    async def hangs_once():
+        opened.append(1)
+        if len(opened) == 1:
+            await asyncio.sleep(10)
+        yield "ok"
+
+    assert run(collect(policy.stream(hangs_once))) == "ok"
+    assert len(opened) == 2
+    assert policy.breaker.failures == 0 # the second attempt's success reset it
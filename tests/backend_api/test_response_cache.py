@@ -0,0 +1,158 @@
+import asyncio
+
+import fakeredis.aioredis
+
+from backend_api.response_cache import ResponseCache
+from .conftest import make_settings
+
+
+def make_cache(**kwargs) -> ResponseCache:
+    return ResponseCache(fakeredis.aioredis.FakeRedis(decode_responses=True), make_settings(), **kwargs)
+
+
+class SlowModel:
+    """generate() callable that counts its calls and answers once `release` is set."""
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self) -> str:
+        self.calls += 1
+        await self.release.wait()
+        return "augmented"
+
+
+def test_identical_misses_share_one_generation():
+    async def scenario():
+        cache, model = make_cache(), SlowModel()
+        callers = [asyncio.ensure_future(cache.get_or_generate("fix  my code", model)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        model.release.set()
+        results = await asyncio.gather(*callers)
+        return cache, model, results
+
+    cache, model, results = asyncio.run(scenario())
+    assert results == ["augmented"] * 3
+    assert model.calls == 1
+    assert cache.stats["coalesced"] == 2
+    assert not cache._in_flight
+
+
+def test_cancelling_the_first_caller_doesnt_cancel_the_others():
+    async def scenario():
+        cache, model = make_cache(), SlowModel()
+        leader = asyncio.ensure_future(cache.get_or_generate("fix my code", model))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(cache.get_or_generate("fix my code", model))
+        await asyncio.sleep(0.01)
+
+        leader.cancel() # the first client disconnects
+        await asyncio.sleep(0.01)
+        model.release.set()
+        return cache, model, leader, await follower, await cache.get("fix my code")
+
+    cache, model, leader, followed, cached = asyncio.run(scenario())
+    assert leader.cancelled()
+    assert followed == cached == "augmented"
+    assert model.calls == 1
+
+
+def test_a_failed_generation_reaches_every_caller_and_isnt_cached():
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream went away")
+
+    async def scenario():
+        cache = make_cache()
+        results = await asyncio.gather(*(cache.get_or_generate("hello", failing) for _ in range(2)), return_exceptions=True)
+        return cache, results, await cache.get("hello")
+
+    cache, results, cached = asyncio.run(scenario())
+    assert [type(result) for result in results] == [RuntimeError, RuntimeError]
+    assert cached is None and not cache._in_flight
+
+
+def test_lookups_dont_wait_for_the_shared_counters():
+    async def scenario():
+        cache = make_cache()
+        await cache.put("fix my code", "augmented")
+        hits = [await cache.get("fix my code") for _ in range(3)]
+        still_sending = cache._send_task is not None and not cache._send_task.done()
+        return hits, still_sending, await cache.get_stats()
+
+    hits, still_sending, stats = asyncio.run(scenario())
+    assert hits == ["augmented"] * 3
+    assert still_sending # the lookups returned before the shared counters were written
+    assert stats["worker"]["hits"] == stats["total"]["hits"] == 3
+
+
+class SlowStream:
+    """generate_stream() callable yielding `chunks`, one each time `step` is set."""
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.calls = 0
+        self.step = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        for chunk in self.chunks:
+            await self.step.wait()
+            self.step.clear()
+            yield chunk
+
+
+async def read_all(stream) -> list:
+    return [chunk async for chunk in stream]
+
+
+def test_identical_streams_share_one_generation_and_late_readers_catch_up():
+    async def scenario():
+        cache, model = make_cache(), SlowStream(["Augmented ", "prompt ", "text"])
+        first = asyncio.ensure_future(read_all(cache.stream_or_generate("plan a trip", model)))
+        await asyncio.sleep(0.01)
+        model.step.set()
+        await asyncio.sleep(0.01)
+        late = asyncio.ensure_future(read_all(cache.stream_or_generate("plan  a trip", model)))
+        for _ in range(2):
+            await asyncio.sleep(0.01)
+            model.step.set()
+        return cache, model, await first, await late, await read_all(cache.stream_or_generate("plan a trip", model))
+
+    cache, model, first, late, after = asyncio.run(scenario())
+    assert first == late == ["Augmented ", "prompt ", "text"]
+    assert after == ["Augmented prompt text"] # served from the cache as one chunk
+    assert model.calls == 1
+    assert cache.stats["coalesced"] == 1 and not cache._streams_in_flight
+
+
+def test_a_reader_leaving_doesnt_stop_the_stream_for_the_others():
+    async def scenario():
+        cache, model = make_cache(), SlowStream(["one ", "two"])
+        leaving = asyncio.ensure_future(read_all(cache.stream_or_generate("hello", model)))
+        staying = asyncio.ensure_future(read_all(cache.stream_or_generate("hello", model)))
+        await asyncio.sleep(0.01)
+        leaving.cancel() # the first client disconnects
+        for _ in range(2):
+            await asyncio.sleep(0.01)
+            model.step.set()
+        return model, leaving, await staying, await cache.get("hello")
+
+    model, leaving, chunks, cached = asyncio.run(scenario())
+    assert leaving.cancelled()
+    assert chunks == ["one ", "two"] and cached == "one two"
+    assert model.calls == 1
+
+
+def test_a_failed_stream_reaches_every_reader():
+    async def failing():
+        yield "partial "
+        raise RuntimeError("upstream went away")
+
+    async def scenario():
+        cache = make_cache()
+        readers = (read_all(cache.stream_or_generate("hello", failing)) for _ in range(2))
+        return cache, await asyncio.gather(*readers, return_exceptions=True), await cache.get("hello")
+
+    cache, results, cached = asyncio.run(scenario())
+    assert [type(result) for result in results] == [RuntimeError, RuntimeError]
+    assert cached is None and not cache._streams_in_flight
@@ -0,0 +1,48 @@
+import asyncio
+import json
+
+import httpx
+
+from src.core.prompt_stream import read_prompt_stream
+
+STREAM = "/api/v1/generate-prompt/stream"
+
+
+def parse_events(body: str):
+    """(event, data) pairs of a text/event-stream body."""
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_stream_sends_deltas_then_done(api):
+    response = api.post(STREAM, json={"user_query": "write a haiku about rain"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = parse_events(response.text)
+    kinds = [event for event, _ in events]
+    assert kinds[-1] == "done" and set(kinds[:-1]) == {"delta"} and len(kinds) > 2
+    streamed = "".join(data["text"] for event, data in events if event == "delta")
+    assert streamed == events[-1][1]["augmented_prompt"] == "Augmented prompt for: write a haiku about rain"
+
+
+def test_upstream_failure_becomes_an_error_event(api):
+    api.app.state.vertex_ai_client.client.fail_first = 10**6
+    events = parse_events(api.post(STREAM, json={"user_query": "hello"}).text)
+    assert events == [("error", {"detail": "Model temporarily unavailable", "retry_after": 1})]
+
+
+def test_client_reads_what_the_server_streams(api):
+    body = api.post(STREAM, json={"user_query": "plan a trip"}).content
+    partials = []
+    prompt = asyncio.run(read_prompt_stream(httpx.Response(200, content=body), partials.append, partial_interval=0))
+    assert prompt == "Augmented prompt for: plan a trip"
+    assert partials[-1] == prompt and len(partials) > 1
+
+
+def test_stream_without_the_model_is_503(api):
+    api.app.state.vertex_ai_client = None
+    assert api.post(STREAM, json={"user_query": "hello"}).status_code == 503
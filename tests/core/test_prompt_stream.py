@@ -0,0 +1,54 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src.core.prompt_stream import BackendStreamError, iter_sse_events, read_prompt_stream
+
+
+def response(body: str) -> httpx.Response:
+    return httpx.Response(200, content=body.encode("utf-8"), headers={"content-type": "text/event-stream"})
+
+
+def read(body: str, partials=None):
+    on_partial = partials.append if partials is not None else None
+    return asyncio.run(read_prompt_stream(response(body), on_partial, partial_interval=0))
+
+
+async def collect_events(body: str):
+    return [event async for event in iter_sse_events(response(body))]
+
+
+def test_events_are_parsed_with_multiline_data_and_comments_ignored():
+    body = ': keep-alive\n\nevent: delta\ndata: {"text":\ndata:  "hi"}\n\ndata: {"plain": true}\n\n'
+    assert asyncio.run(collect_events(body)) == [("delta", {"text": "hi"}), ("message", {"plain": True})]
+
+
+def test_partial_text_is_reported_cumulatively():
+    partials = []
+    body = 'event: delta\ndata: {"text": "Hello "}\n\nevent: delta\ndata: {"text": "world"}\n\nevent: done\ndata: {"augmented_prompt": "Hello world"}\n\n'
+    assert read(body, partials) == "Hello world"
+    assert partials == ["Hello ", "Hello world"]
+
+
+def test_done_without_a_prompt_falls_back_to_the_deltas():
+    assert read('event: delta\ndata: {"text": "abc"}\n\nevent: done\ndata: {}\n\n') == "abc"
+
+
+def test_error_event_after_partial_text_raises():
+    partials = []
+    body = 'event: delta\ndata: {"text": "Half a"}\n\nevent: error\ndata: {"detail": "Model temporarily unavailable", "retry_after": 3}\n\n'
+    with pytest.raises(BackendStreamError, match="Model temporarily unavailable"):
+        read(body, partials)
+    assert partials == ["Half a"]
+
+
+def test_stream_ending_without_done_raises():
+    with pytest.raises(BackendStreamError, match="ended before"):
+        read('event: delta\ndata: {"text": "cut o"}\n\n')
+
+
+def test_unterminated_last_event_is_not_used():
+    # per the SSE format an event only counts once its blank line arrives
+    with pytest.raises(BackendStreamError):
+        read('event: done\ndata: {"augmented_prompt": "never finished"}')
@@ -0,0 +1,43 @@
+import pytest
+
+from src.core.ring_buffer import KeystrokeRingBuffer
+
+
+def filled(text, capacity=8):
+    ring = KeystrokeRingBuffer(capacity)
+    for index, char in enumerate(text):
+        ring.append(char, index + 1)
+    return ring
+
+
+def test_keeps_the_newest_characters_when_full():
+    ring = filled("abcdefghij", capacity=4)
+    assert ring.text() == "ghij"
+    assert (ring.start, ring.end, len(ring)) == (6, 10, 4)
+    assert ring.last_state() == 10 and ring.last_char() == "j"
+
+
+def test_text_from_an_absolute_position_across_the_wrap():
+    ring = filled("abcdefghij", capacity=4)
+    assert ring.text(8) == "ij"
+    assert ring.text(2) == "ghij" # older than what's held: everything held
+
+
+def test_pop_past_the_start_keeps_following_the_cursor():
+    ring = filled("ab")
+    assert ring.pop() and ring.pop()
+    assert not ring.pop()
+    assert (ring.end, len(ring), ring.text(), ring.last_state(default=-1)) == (-1, 0, "", -1)
+
+
+def test_drop_oldest_and_clear():
+    ring = filled("abcdef")
+    ring.drop_oldest(4)
+    assert ring.text() == "ef" and ring.start == 4
+    ring.clear()
+    assert (ring.text(), ring.end, ring.last_char()) == ("", 0, "")
+
+
+def test_capacity_must_be_positive():
+    with pytest.raises(ValueError):
+        KeystrokeRingBuffer(0)
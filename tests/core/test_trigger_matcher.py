@@ -0,0 +1,42 @@
+from src.core.trigger_matcher import LLM_TRIGGER, SNIPPET_TRIGGER, TriggerMatcher
+
+
+def match_after(matcher, text):
+    return matcher.match_at(matcher.feed(text))
+
+
+def test_command_is_matched_where_it_ends():
+    matcher = TriggerMatcher(["::sig", "::signature"])
+    assert match_after(matcher, "thanks ::sig") == ("::sig", SNIPPET_TRIGGER)
+    assert match_after(matcher, "thanks ::signature") == ("::signature", SNIPPET_TRIGGER)
+    assert match_after(matcher, "thanks ::sign") is None
+
+
+def test_overlapping_commands_use_failure_links():
+    matcher = TriggerMatcher(["::abc", "::b"])
+    # "::ab" is a dead end for "::abc", but the text can't contain "::b" there either
+    assert match_after(matcher, "::ab") is None
+    assert match_after(matcher, ":::b") == ("::b", SNIPPET_TRIGGER)
+    assert match_after(matcher, "x::a::b") == ("::b", SNIPPET_TRIGGER)
+
+
+def test_llm_trigger_for_every_prefix():
+    matcher = TriggerMatcher([], prefixes=("::", ";;"))
+    assert match_after(matcher, "hey ;;Prompt(") == (";;Prompt(", LLM_TRIGGER)
+    assert match_after(matcher, "::Prompt(") == ("::Prompt(", LLM_TRIGGER)
+
+
+def test_llm_trigger_wins_over_a_snippet_with_the_same_text():
+    matcher = TriggerMatcher(["::Prompt("])
+    assert match_after(matcher, "::Prompt(") == ("::Prompt(", LLM_TRIGGER)
+
+
+def test_commands_without_a_prefix_are_not_armed():
+    matcher = TriggerMatcher(["sig", "::sig"])
+    assert len(matcher) == 2 # ::sig and the LLM trigger
+    assert match_after(matcher, "sig") is None
+
+
+def test_max_trigger_length_covers_the_llm_trigger():
+    assert TriggerMatcher(["::a"]).max_trigger_length == len("::Prompt(")
+    assert TriggerMatcher(["::a-very-long-command"]).max_trigger_length == len("::a-very-long-command")
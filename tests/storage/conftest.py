@@ -0,0 +1,17 @@
+import pytest
+
+from src.storage.persistence_service import PersistenceService
+
+
+@pytest.fixture
+def app_data(tmp_path, monkeypatch):
+    """Points the storages at a fresh PromptAssist directory under tmp_path."""
+    monkeypatch.setenv("APPDATA", str(tmp_path))
+    return tmp_path / "PromptAssist"
+
+
+@pytest.fixture
+def persistence():
+    service = PersistenceService(delay=0.01, max_delay=0.05)
+    yield service
+    service.stop()
@@ -0,0 +1,68 @@
+from src.storage.history_index import HistoryIndex, fts_query
+from src.storage.history_storage import HistoryStorage
+
+
+def make_index(persistence, entries):
+    history = HistoryStorage(persistence=persistence)
+    for query, result in entries:
+        history.add_entry(query, result)
+    index = HistoryIndex(history, persistence=persistence)
+    index.start()
+    index._build_thread.join()
+    return history, index
+
+
+def test_fts_query_quotes_words_and_prefixes_the_last():
+    assert fts_query('haiku zeb') == '"haiku" "zeb"*'
+    assert fts_query('AND OR "(*') == '"AND" "OR"*'
+    assert fts_query("  ") == ""
+
+
+def test_search_ranks_query_matches_first(app_data, persistence):
+    history, index = make_index(persistence, [
+        ("::Prompt(summarise the invoice)", "an invoice summary"),
+        ("::Prompt(write a haiku)", "a haiku about an invoice"),
+        ("::Prompt(plan a trip)", "three days in Rome"),
+    ])
+    try:
+        results = index.search("invoice")
+        assert [entry["query"] for entry in results] == ["::Prompt(summarise the invoice)", "::Prompt(write a haiku)"]
+        assert index.search("hai")[0]["query"] == "::Prompt(write a haiku)"
+        assert index.search("nothing like this") == []
+    finally:
+        index.close()
+
+
+def test_index_follows_new_entries_and_clear(app_data, persistence):
+    history, index = make_index(persistence, [("::Prompt(first)", "one")])
+    try:
+        history.add_entry("::Prompt(second)", "two")
+        assert persistence.flush()
+        assert [entry["query"] for entry in index.search("")] == ["::Prompt(second)", "::Prompt(first)"]
+
+        history.clear()
+        assert persistence.flush()
+        assert index.search("") == []
+    finally:
+        index.close()
+
+
+def test_failed_index_write_is_retried(app_data, persistence, monkeypatch):
+    history, index = make_index(persistence, [])
+    try:
+        insert = index._insert
+        attempts = []
+
+        def failing_once(entries):
+            attempts.append(len(entries))
+            if len(attempts) == 1:
+                raise OSError("database is locked")
+            insert(entries)
+
+        monkeypatch.setattr(index, "_insert", failing_once)
+        history.add_entry("::Prompt(kept)", "still indexed")
+        assert not persistence.flush()
+        assert persistence.flush() # the next flush runs the retry right away
+        assert [entry["query"] for entry in index.search("kept")] == ["::Prompt(kept)"]
+    finally:
+        index.close()
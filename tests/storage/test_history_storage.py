@@ -0,0 +1,67 @@
+from src.storage.history_storage import HistoryStorage
+
+
+def add_entries(history, start, stop):
+    for index in range(start, stop):
+        history.add_entry(f"::Prompt(query {index})", f"result {index}")
+
+
+def stored_ids(persistence):
+    return [entry["id"] for entry in HistoryStorage(persistence=persistence).iter_since(0)]
+
+
+def test_entries_survive_a_restart(app_data, persistence):
+    history = HistoryStorage(persistence=persistence)
+    add_entries(history, 0, 5)
+    assert persistence.flush()
+
+    reloaded = HistoryStorage(persistence=persistence)
+    assert [entry["query"] for entry in reloaded.tail] == [f"::Prompt(query {index})" for index in range(5)]
+    assert reloaded.next_id == 6
+
+
+def test_failed_write_keeps_the_entries_for_the_retry(app_data, persistence, monkeypatch):
+    history = HistoryStorage(persistence=persistence, segment_max_bytes=200, compress_segments=False)
+    add_entries(history, 0, 2)
+    assert persistence.flush()
+
+    write_lines = history._write_lines
+    attempts = []
+
+    def failing_once(lines, last_id):
+        attempts.append(last_id)
+        if len(attempts) == 2: # after part of the batch already reached disk
+            raise OSError("No space left on device")
+        write_lines(lines, last_id)
+
+    monkeypatch.setattr(history, "_write_lines", failing_once)
+    add_entries(history, 2, 10)
+    assert not persistence.flush()
+    assert persistence.flush() # the next flush runs the retry right away
+    assert persistence.stats["failed"] == 1
+
+    # nothing lost, nothing written twice
+    assert stored_ids(persistence) == list(range(1, 11))
+
+
+def test_get_page_walks_back_through_all_entries(app_data, persistence):
+    history = HistoryStorage(persistence=persistence, tail_size=5, segment_max_bytes=300, compress_segments=True)
+    add_entries(history, 0, 40)
+    assert persistence.flush()
+
+    seen = []
+    page = history.get_page(limit=7)
+    while page:
+        seen.extend(entry["id"] for entry in page)
+        page = history.get_page(limit=7, before_id=page[-1]["id"])
+    assert seen == list(range(40, 0, -1))
+
+
+def test_clear_drops_entries_written_before_it(app_data, persistence):
+    history = HistoryStorage(persistence=persistence)
+    add_entries(history, 0, 3)
+    history.clear()
+    add_entries(history, 3, 5)
+    assert persistence.flush()
+
+    assert stored_ids(persistence) == [4, 5]
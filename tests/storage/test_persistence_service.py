@@ -0,0 +1,77 @@
+import json
+import threading
+import time
+
+from src.storage.persistence_service import PersistenceService, atomic_write_json
+
+
+def test_writes_for_a_key_are_coalesced(persistence):
+    written = []
+    persistence.delay = 60 # nothing runs until the flush
+    for value in range(5):
+        persistence.schedule("settings", lambda value=value: written.append(value))
+    assert persistence.flush()
+    assert written == [4]
+    assert persistence.stats["coalesced"] == 4
+
+
+def test_max_delay_bounds_a_stream_of_edits():
+    service = PersistenceService(delay=0.05, max_delay=0.2)
+    done = threading.Event()
+    try:
+        for _ in range(40): # keeps pushing the debounce back for longer than max_delay
+            service.schedule("settings", done.set)
+            if done.wait(0.02):
+                break
+        assert done.is_set()
+    finally:
+        service.stop()
+
+
+def test_failed_write_is_retried(persistence):
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise OSError("disk full")
+
+    persistence.schedule("history", flaky)
+    assert not persistence.flush() # one try per flush, the retry is still queued
+    assert persistence.flush()
+    assert len(attempts) == 2
+    assert persistence.stats["failed"] == 1 and persistence.stats["written"] == 1
+
+
+def test_flush_gives_a_failing_write_one_try():
+    service = PersistenceService(delay=0.01, max_delay=60)
+    attempts = []
+
+    def broken():
+        attempts.append(1)
+        raise OSError("read-only file system")
+
+    service.schedule("settings", broken)
+    started = time.monotonic()
+    assert not service.flush()
+    assert not service.flush()
+    service.stop() # flushes once more, then drops it instead of retrying
+    assert time.monotonic() - started < 1
+    assert len(attempts) == 3
+    assert not service._thread.is_alive()
+
+
+def test_writes_after_stop_run_inline():
+    service = PersistenceService(delay=60)
+    service.stop()
+    written = []
+    service.schedule("settings", lambda: written.append(threading.current_thread()))
+    assert written == [threading.current_thread()]
+
+
+def test_atomic_write_json_leaves_no_temp_files(tmp_path):
+    path = tmp_path / "settings.json"
+    atomic_write_json(str(path), {"a": 1})
+    atomic_write_json(str(path), {"a": 2})
+    assert json.loads(path.read_text(encoding="utf-8")) == {"a": 2}
+    assert [p.name for p in tmp_path.iterdir()] == ["settings.json"]
@@ -0,0 +1,52 @@
+import time
+
+from src.storage.history_storage import HistoryStorage
+from src.storage.prompt_cache import PromptCache, query_from_command
+
+
+def test_query_from_command():
+    assert query_from_command("::Prompt(fix my code)") == "fix my code"
+    assert query_from_command("::sig") == ""
+
+
+def test_history_is_indexed_with_normalized_queries(app_data, persistence):
+    history = HistoryStorage(persistence=persistence)
+    history.add_entry("::Prompt(fix  my code)", "a better prompt")
+    cache = PromptCache(history)
+    assert cache.get(" fix my code ") == "a better prompt"
+
+    history.add_entry("::Prompt(!explain this)", "fresh result") # a refresh is stored without its marker
+    assert cache.get("explain this") == "fresh result"
+
+
+def test_clearing_history_empties_the_cache(app_data, persistence):
+    history = HistoryStorage(persistence=persistence)
+    cache = PromptCache(history)
+    cache.put("fix my code", "a better prompt")
+    history.clear()
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entries_go_first(app_data, persistence):
+    cache = PromptCache(HistoryStorage(persistence=persistence), max_entries=2)
+    cache.put("a", "result a")
+    cache.put("b", "result b")
+    cache.get("a")
+    cache.put("c", "result c")
+    assert cache.get("b") is None
+    assert cache.get("a") == "result a" and cache.get("c") == "result c"
+
+
+def test_expired_results_are_misses(app_data, persistence):
+    cache = PromptCache(HistoryStorage(persistence=persistence), max_age=60)
+    cache.put("old", "result", created=time.time() - 120)
+    assert cache.get("old") is None
+    assert (cache.hits, cache.misses, len(cache)) == (0, 1, 0)
+
+
+def test_split_refresh_and_invalidate(app_data, persistence):
+    cache = PromptCache(HistoryStorage(persistence=persistence))
+    assert cache.split_refresh("!fix my code") == ("fix my code", True)
+    cache.put("fix my code", "result")
+    assert cache.invalidate("fix my code")
+    assert not cache.invalidate("fix my code")
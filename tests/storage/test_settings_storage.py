@@ -0,0 +1,22 @@
+import json
+import threading
+
+from src.storage.settings_storage import SettingsStorage
+
+
+def test_sets_from_several_threads_all_reach_disk(app_data, persistence):
+    settings = SettingsStorage(persistence=persistence)
+
+    def set_many(thread_index):
+        for value in range(200):
+            settings.set(f"worker_{thread_index}", value)
+
+    threads = [threading.Thread(target=set_many, args=(index,)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert persistence.flush()
+
+    saved = json.loads((app_data / "settings.json").read_text(encoding="utf-8"))
+    assert [saved[f"worker_{index}"] for index in range(4)] == [199] * 4
@@ -0,0 +1,60 @@
+import json
+import os
+import sqlite3
+
+from src.storage.snippet_storage import DEFAULT_SNIPPETS, SnippetStorage
+
+
+def test_defaults_on_first_start(app_data, persistence):
+    storage = SnippetStorage(persistence=persistence)
+    assert storage.snippets == DEFAULT_SNIPPETS
+    storage.close()
+
+
+def test_saves_and_deletes_survive_a_restart(app_data, persistence):
+    storage = SnippetStorage(persistence=persistence)
+    storage.save("::sig", "Best regards")
+    storage.save("::addr", "1 Main St")
+    storage.delete("::emailStarter")
+    assert persistence.flush()
+    storage.close()
+
+    assert SnippetStorage(persistence=persistence).snippets == {"::sig": "Best regards", "::addr": "1 Main St"}
+
+
+def test_config_json_is_migrated_once(app_data, persistence):
+    app_data.mkdir(parents=True)
+    (app_data / "config.json").write_text(json.dumps({"::hi": "Hello"}), encoding="utf-8")
+
+    storage = SnippetStorage(persistence=persistence)
+    assert storage.snippets == {"::hi": "Hello"}
+    storage.close()
+    assert not (app_data / "config.json").exists()
+    assert (app_data / "config.json.migrated").exists()
+
+
+def test_corrupt_database_is_moved_aside_with_its_wal(app_data, persistence, monkeypatch):
+    storage = SnippetStorage(persistence=persistence)
+    storage.close()
+    db_path = str(app_data / "snippets.db")
+    for suffix, content in (("", b"this is not a database"), ("-wal", b"stale wal"), ("-shm", b"stale shm")):
+        with open(db_path + suffix, "wb") as f:
+            f.write(content * 200)
+
+    # SQLite usually deletes unusable sidecar files itself when the failed connection closes;
+    # fail the first open without touching the files to cover the case where they survive
+    open_database = SnippetStorage._open_database
+    failures = []
+
+    def corrupt_once(self):
+        if not failures:
+            failures.append(db_path)
+            raise sqlite3.DatabaseError("file is not a database")
+        return open_database(self)
+
+    monkeypatch.setattr(SnippetStorage, "_open_database", corrupt_once)
+    storage = SnippetStorage(persistence=persistence)
+    assert storage.snippets == DEFAULT_SNIPPETS
+    storage.close()
+    moved = sorted(name.split(".corrupt-")[1].partition("-")[2] for name in os.listdir(app_data) if ".corrupt-" in name)
+    assert moved == ["", "shm", "wal"]